@@ -0,0 +1,3 @@
+"""
+Benchmarks of gisaid_curation on synthetic GISAID workbooks (see benchmarks.run)
+"""
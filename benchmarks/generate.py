@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Generate synthetic GISAID submission workbooks.
+
+Values look like real submissions: locations taken from the gazetteer, dates in all
+formats found in real files (text, Excel dates, Excel serial numbers), coverages written
+in many ways, a few labs, addresses and authors shared by many sequences...
+A given share of dates, coverages and locations are malformed, and a given share of
+virus names are duplicated, so that the curator has something to check.
+
+    python -m benchmarks.generate -n 10000 -o bulk.xlsx
+"""
+
+import os
+import sys
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from gisaid_curation.gazetteer import load_gazetteer
+
+
+COLUMNS = ["fn", "covv_virus_name", "covv_type", "covv_passage", "covv_collection_date",
+           "covv_location", "covv_host", "covv_gender", "covv_patient_age",
+           "covv_seq_technology", "covv_assembly_method", "covv_coverage", "covv_orig_lab",
+           "covv_orig_lab_addr", "covv_subm_lab", "covv_subm_lab_addr", "covv_authors"]
+# 2nd header line of the GISAID template
+DESCRIPTIONS = ["filename", "Virus name", "Type", "Passage details/history",
+                "Collection date", "Location", "Host", "Gender", "Patient age",
+                "Sequencing technology", "Assembly method", "Coverage", "Originating lab",
+                "Address", "Submitting lab", "Address", "Authors"]
+WRONG_DATES = ["2020-13-01", "2021-04-31", "31/03/2020", "2099-01-01", "march 2020"]
+WRONG_COVERAGES = ["high", "n/a", "about 100", "100-50x", "x"]
+WRONG_LOCATIONS = ["France", "europe/frnace/ile de france", "Paris", "Europe", "Bali / Denpasar"]
+
+
+def generate(nb_rows, cardinality=50, wrong=0.05, duplicates=0.01, seed=0):
+    """
+    Generate metadata of a synthetic bulk.
+
+    Parameters
+    ----------
+    nb_rows: int
+        number of sequences
+    cardinality: int
+        number of distinct values in lab, address, authors, location, assembly method and
+        sequencing technology columns
+    wrong: float
+        share of malformed dates, coverages and locations
+    duplicates: float
+        share of virus names used twice
+    seed: int
+        seed of random generator: same parameters give the same bulk
+
+    Returns
+    -------
+    pandas.DataFrame
+        Submissions sheet, with the 2nd header line of the template
+    """
+    rng = np.random.default_rng(seed)
+
+    def pick(pool, size=nb_rows):
+        return np.asarray(pool, dtype=object)[rng.integers(0, len(pool), size)]
+
+    def spoil(values, pool):
+        # Replace a share of values by malformed ones
+        bad = rng.random(nb_rows) < wrong
+        values[bad] = pick(pool, bad.sum())
+        return values
+
+    locations = spoil(pick(location_pool(cardinality, rng)), WRONG_LOCATIONS)
+    countries = [loc.split(" / ")[1] if loc.count(" / ") >= 1 else "France" for loc in locations]
+    vnames = np.array([f"hCoV-19/{country}/LAB{i % cardinality}-{i}/2020"
+                       for i, country in enumerate(countries)], dtype=object)
+    dup = np.flatnonzero(rng.random(nb_rows) < duplicates)
+    if len(dup):
+        vnames[dup] = vnames[rng.integers(0, nb_rows, len(dup))]
+
+    md = pd.DataFrame({
+        "fn": "all_sequences.fasta",
+        "covv_virus_name": vnames,
+        "covv_type": pick(["betacoronavirus", "Betacoronavirus"]),
+        "covv_passage": pick(["Original", "original", "Vero"]),
+        "covv_collection_date": spoil(date_values(nb_rows, rng), WRONG_DATES),
+        "covv_location": locations,
+        "covv_host": pick(["Human", "human"]),
+        "covv_gender": pick(["Male", "Female", "m", "f", "unknown", ""]),
+        "covv_patient_age": rng.integers(1, 99, nb_rows).astype(str),
+        "covv_seq_technology": pick([f"Illumina {k}" for k in range(max(1, cardinality // 10))]),
+        "covv_assembly_method": pick([f"bwa-mem {k}" for k in range(max(1, cardinality // 10))]),
+        "covv_coverage": spoil(coverage_values(nb_rows, rng), WRONG_COVERAGES),
+        "covv_orig_lab": pick([f"Laboratory {k}" for k in range(cardinality)]),
+        "covv_orig_lab_addr": pick([f"{k} rue du Docteur Roux, Paris" for k in range(cardinality)]),
+        "covv_subm_lab": pick([f"Sequencing center {k}" for k in range(cardinality)]),
+        "covv_subm_lab_addr": pick([f"{k} avenue Pasteur, Lyon" for k in range(cardinality)]),
+        "covv_authors": pick([f"Author {k}a, Author {k}b" for k in range(cardinality)]),
+    }, columns=COLUMNS)
+    header = pd.DataFrame([DESCRIPTIONS], columns=COLUMNS)
+    return pd.concat([header, md], ignore_index=True)
+
+
+def location_pool(cardinality, rng):
+    """
+    'cardinality' locations (continent / country / region) taken from the gazetteer, some
+    of them written the way submitters do ('Europe/France', accents...)
+    """
+    gazetteer = load_gazetteer()
+    places = [(gazetteer.country_continents[country][0], country, region)
+              for country, regions in sorted(gazetteer.regions.items())
+              for region in sorted(set().union(*regions.keys.values()))]
+    chosen = [places[i] for i in rng.permutation(len(places))[:cardinality]]
+    pool = []
+    for i, (continent, country, region) in enumerate(chosen):
+        if i % 3 == 1:
+            pool.append(f"{continent}/{country}/{region}")
+        elif i % 3 == 2:
+            pool.append(f"{continent} / {country}")
+        else:
+            pool.append(f"{continent} / {country} / {region}")
+    return pool
+
+
+def date_values(nb_rows, rng):
+    """
+    Collection dates in 2020-2021, in all formats found in submissions
+    """
+    start = datetime.date(2020, 1, 1)
+    days = rng.integers(0, 700, nb_rows)
+    dates = pd.to_datetime(start) + pd.to_timedelta(days, unit="D")
+    kinds = rng.integers(0, 4, nb_rows)
+    values = np.where(kinds == 0, dates.strftime("%Y-%m-%d"),
+                      np.where(kinds == 1, dates.strftime("%Y-%m-%d 00:00:00"),
+                               np.where(kinds == 2, dates.strftime("%Y-%m"),
+                                        (days + 43831).astype(str))))
+    return values.astype(object)
+
+
+def coverage_values(nb_rows, rng):
+    """
+    Coverages written in all the ways found in submissions
+    """
+    covs = rng.integers(10, 20000, nb_rows)
+    kinds = rng.integers(0, 5, nb_rows)
+    values = np.where(kinds == 0, [f"{c}x" for c in covs],
+                      np.where(kinds == 1, [f"{c:,} X" for c in covs],
+                               np.where(kinds == 2, covs.astype(str),
+                                        np.where(kinds == 3, [f">{c}x" for c in covs], ""))))
+    return values.astype(object)
+
+
+def write_workbook(md, path):
+    """
+    Write metadata to a workbook with instructions and Submissions sheets (xlsx), or
+    to a csv/tsv export of Submissions sheet
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in [".csv", ".tsv"]:
+        md.to_csv(path, sep="," if ext == ".csv" else "\t", index=False)
+        return
+    if ext == ".parquet":
+        md.to_parquet(path, index=False)
+        return
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame({"Instructions": ["Synthetic bulk"]}).to_excel(
+            writer, sheet_name="instructions", index=False)
+        md.to_excel(writer, sheet_name="Submissions", index=False)
+
+
+def make_parser(argu):
+    parser = argparse.ArgumentParser(description="Generate a synthetic GISAID bulk")
+    parser.add_argument("-n", "--rows", type=int, default=1000, help="Number of sequences")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Workbook to create (xlsx, csv, tsv or parquet)")
+    parser.add_argument("--cardinality", type=int, default=50,
+                        help="Number of distinct labs, addresses, authors, locations")
+    parser.add_argument("--wrong", type=float, default=0.05,
+                        help="Share of malformed dates, coverages and locations")
+    parser.add_argument("--duplicates", type=float, default=0.01,
+                        help="Share of duplicated virus names")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argu)
+
+
+if __name__ == '__main__':
+    parsed = make_parser(sys.argv[1:])
+    write_workbook(generate(parsed.rows, parsed.cardinality, parsed.wrong, parsed.duplicates,
+                            parsed.seed), parsed.output)
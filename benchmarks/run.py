@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Benchmark curation on synthetic bulks (see benchmarks.generate).
+
+Questions are answered by a script instead of a curator (see ScriptedInput), so that
+every run does the same work. Two kinds of benchmarks:
+- each check_* function of data_curation, called on all distinct values of its column
+- the whole pipeline (cure_metadata), with the time spent in each stage (reading, each
+  column, writing), the number of rows per second and the peak memory.
+
+Results are saved to a json file, with the commit and versions used, so that runs on two
+commits can be compared:
+
+    python -m benchmarks.run -n 10000 --chunk-size 5000 -o before.json
+    git checkout other_commit
+    python -m benchmarks.run -n 10000 --chunk-size 5000 -o after.json --compare before.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import builtins
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+import threading
+import multiprocessing
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from gisaid_curation import utils
+from gisaid_curation import data_curation as dc
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.gazetteer import load_gazetteer
+from gisaid_curation.workbook import StreamingWriter
+
+from benchmarks.generate import generate, write_workbook
+
+
+# Answers given to each question, found by the text of the question.
+# First matching pattern is used. Answers must be valid, otherwise the question is asked
+# again.
+ANSWERS = [
+    ("correct virus name", lambda n: f"hCoV-19/France/BENCH-{n}/2020"),
+    ("correct location", "Europe / France"),
+    ("collection date", "2020"),
+    ("gender", "u"),
+    ("coverage", "u"),
+]
+# More questions than this per line of the bulk: an answer is not accepted, so the same
+# question is asked forever
+MAX_QUESTIONS = 20
+
+
+class ScriptedInput:
+    """
+    Replacement of input(): answers questions with ANSWERS (accept proposal for all other
+    questions), and counts questions asked.
+
+    max_questions: stop (RuntimeError) after this number of questions
+    """
+
+    def __init__(self, answers=ANSWERS, max_questions=None):
+        self.answers = [(re.compile(pattern, re.I), answer) for pattern, answer in answers]
+        self.max_questions = max_questions
+        self.count = 0
+
+    def __call__(self, prompt=""):
+        self.count += 1
+        if self.max_questions and self.count > self.max_questions:
+            raise RuntimeError(f"Too many questions, scripted answer not accepted? {prompt}")
+        for pattern, answer in self.answers:
+            if pattern.search(prompt):
+                return answer(self.count) if callable(answer) else answer
+        return ""
+
+    @contextlib.contextmanager
+    def active(self):
+        """
+        Answer questions with this script (and hide prompts and messages to the curator)
+        """
+        ori_input = builtins.input
+        builtins.input = self
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                yield self
+        finally:
+            builtins.input = ori_input
+
+
+class StageTimer:
+    """
+    Time spent in each stage of cure_metadata: reading, checking each column, writing.
+
+    Stage functions of data_curation are replaced by timed versions while the timer is
+    active. Time not spent in any stage is reported as 'other'.
+    """
+
+    # function: column checked by it (None: column is its 3rd argument)
+    COLUMNS = {"check_type": "covv_type", "check_vnames": "covv_virus_name",
+               "curate_date_column": "covv_collection_date",
+               "curate_coverage_column": "covv_coverage",
+               "curate_column": None, "curate_text_column": None,
+               "curate_mandatory_column": None}
+
+    def __init__(self):
+        self.stages = {}
+        # Depth of timed calls, in each thread (chunks are read and written in background
+        # threads, see gisaid_curation.pipeline)
+        self.local = threading.local()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def timed(self, stage, func):
+        """
+        Timed version of func. Only outer calls are timed (curate_text_column calls
+        curate_column...)
+        """
+        def run(*args, **kwargs):
+            name = stage(args) if callable(stage) else stage
+            depth = getattr(self.local, "depth", 0)
+            self.local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.depth = depth
+                if depth == 0:
+                    self.add(name, time.perf_counter() - start)
+        return run
+
+    def timed_chunks(self, chunks):
+        """
+        Time spent reading each chunk (iter_workbook)
+        """
+        while True:
+            start = time.perf_counter()
+            try:
+                md = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                self.add("read", time.perf_counter() - start)
+            yield md
+
+    @contextlib.contextmanager
+    def active(self):
+        patched = {"read_workbook": self.timed("read", dc.read_workbook)}
+        ori_iter = dc.iter_workbook
+
+        def iter_workbook(*args, **kwargs):
+            instructions, chunks = self.timed("read", ori_iter)(*args, **kwargs)
+            return instructions, self.timed_chunks(chunks)
+        patched["iter_workbook"] = iter_workbook
+        for func, column in self.COLUMNS.items():
+            patched[func] = self.timed(column or (lambda args: args[2]), getattr(dc, func))
+        ori_funcs = {func: getattr(dc, func) for func in patched}
+        ori_writer = {meth: getattr(StreamingWriter, meth)
+                      for meth in ["__init__", "append", "close"]}
+        try:
+            for func, timed_func in patched.items():
+                setattr(dc, func, timed_func)
+            for meth, ori_meth in ori_writer.items():
+                setattr(StreamingWriter, meth, self.timed("write", ori_meth))
+            yield self
+        finally:
+            for func, ori_func in ori_funcs.items():
+                setattr(dc, func, ori_func)
+            for meth, ori_meth in ori_writer.items():
+                setattr(StreamingWriter, meth, ori_meth)
+
+
+def bench_pipeline(file_in, nb_rows, chunk_size=None, trace=False):
+    """
+    Curate file_in with scripted answers (run in its own process by run_pipeline, so that
+    peak memory is only the one of curation)
+
+    Returns
+    -------
+    dict
+        total time, time per stage, number of questions asked and peak memory (MB)
+    """
+    logname = "gisaid_curation"
+    utils.init_logger(file_in, logname)
+    answers = ScriptedInput(max_questions=MAX_QUESTIONS * nb_rows)
+    timer = StageTimer()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with answers.active(), timer.active():
+            dc.cure_metadata(file_in, DecisionStore(":memory:"), chunk_size=chunk_size)
+    finally:
+        total = time.perf_counter() - start
+        utils.close_logger(logname)
+    result = {"seconds": total, "questions": answers.count,
+              # Reading and writing overlap curation (background threads)
+              "stages": dict(timer.stages, other=max(0, total - sum(timer.stages.values()))),
+              # ru_maxrss is in kB on Linux
+              "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if trace:
+        result["peak_python_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def run_pipeline(file_in, nb_rows, chunk_size=None, trace=False):
+    """
+    Run bench_pipeline in a new process
+    """
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        result = pool.apply(bench_pipeline, (file_in, nb_rows, chunk_size, trace))
+    result["rows"] = nb_rows
+    result["rows_per_sec"] = nb_rows / result["seconds"]
+    return result
+
+
+def check_calls(md, rows):
+    """
+    For each check_* function of data_curation, the calls done by the pipeline: one per
+    distinct value of its column (one per line for virus names). Each run starts with
+    empty memos (nothing already checked).
+
+    Returns
+    -------
+    dict
+        {name: (number of calls, function running all calls)}
+    """
+    data = md[rows]
+    gazetteer = load_gazetteer()
+
+    def distinct(column):
+        values, index = np.unique(data[column].to_numpy(dtype=str), return_index=True)
+        return list(zip(values, data["covv_virus_name"].to_numpy(dtype=object)[index]))
+
+    def each(values, check):
+        # check(value, seq, memo)
+        def run():
+            memo = {}
+            return [check(value, seq, memo) for value, seq in values]
+        return len(values), run
+
+    def each_vname(pairs, check):
+        # check(vname, location, vnames, countries)
+        def run():
+            vnames, countries = set(), {}
+            return [check(vname, loc, vnames, countries) for vname, loc in pairs]
+        return len(pairs), run
+
+    locations = distinct("covv_location")
+    pairs = list(zip(data["covv_virus_name"], data["covv_location"]))
+    return {
+        "check_type": (len(data), lambda: dc.check_type(md.copy(), rows)),
+        "check_location": each(locations, partial(dc.check_location, gazetteer=gazetteer)),
+        "checked_location_format": each(
+            locations, lambda loc, seq, memo: dc.checked_location_format(loc.split("/"), loc,
+                                                                         memo)),
+        "check_vnames": (len(data), lambda: dc.check_vnames(md.copy(), rows, set(), {})),
+        "check_vname": each_vname(pairs, dc.check_vname),
+        "checked_vname_format": each_vname(
+            [(vname, loc) for vname, loc in pairs if len(vname.split("/")) == 4],
+            lambda vname, loc, vnames, countries: dc.checked_vname_format(vname, loc,
+                                                                          countries)),
+        "check_date": each(distinct("covv_collection_date"), dc.check_date),
+        "check_gender": each(distinct("covv_gender"), dc.check_gender),
+        "check_coverage": each(distinct("covv_coverage"), dc.check_coverage),
+        "check_column": each(distinct("covv_passage"), lambda value, seq, memo: (
+            dc.check_column(value, seq, "covv_passage", memo))),
+        "check_clusters": (len(data), lambda: dc.check_clusters(md.copy(), rows,
+                                                                "covv_orig_lab", {})),
+        "check_cluster": (1, lambda: dc.check_cluster(
+            ["Institut Pasteur, Paris", "institut pasteur - paris"], "Institut Pasteur, Paris",
+            "seq", "covv_orig_lab", {"Institut Pasteur, Paris": 2,
+                                     "institut pasteur - paris": 1})),
+        "check_mandatory_field": each(distinct("covv_authors"), lambda value, seq, memo: (
+            dc.check_mandatory_field(value, seq, "covv_authors", memo))),
+    }
+
+
+def bench_checks(md, repeat=3):
+    """
+    Time each check_* function (best of 'repeat' runs)
+
+    Returns
+    -------
+    dict
+        {name: {"calls": number of calls, "seconds": time, "calls_per_sec": ...}}.
+        Check functions without benchmark are reported with None, so that they are not
+        forgotten.
+    """
+    rows = ~md["fn"].str.contains("filename", regex=False)
+    calls = check_calls(md, rows)
+    results = {}
+    logname = "gisaid_curation"
+    with tempfile.TemporaryDirectory() as tmp:
+        utils.init_logger(os.path.join(tmp, "checks"), logname)
+        try:
+            with ScriptedInput(max_questions=MAX_QUESTIONS * len(md) * repeat).active():
+                for name, (nb_calls, run) in calls.items():
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        run()
+                        times.append(time.perf_counter() - start)
+                    best = min(times)
+                    results[name] = {"calls": nb_calls, "seconds": best,
+                                     "calls_per_sec": nb_calls / best if best else None}
+        finally:
+            utils.close_logger(logname)
+    for name in dir(dc):
+        if re.match(r"checke?d?_", name) and callable(getattr(dc, name)):
+            results.setdefault(name, None)
+    return results
+
+
+def environment():
+    """
+    Commit and versions used for a run
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import openpyxl
+    return {"commit": commit, "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__,
+            "openpyxl": openpyxl.__version__, "machine": platform.machine(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def print_report(report, base=None):
+    """
+    Print results (and ratio new time / base time if a base report is given)
+    """
+    def ratio(new, old):
+        if not new or not old:
+            return ""
+        return f"{new / old:8.2f}"
+
+    base = base or {}
+    print(f"commit {report['env']['commit']}"
+          + (f" (compared with {base['env']['commit']})" if base else ""))
+    if report["checks"]:
+        print("\nCheck functions" + " " * 16 + "calls    calls/sec   vs base")
+    base_checks = base.get("checks", {})
+    for name, res in report["checks"].items():
+        if res is None:
+            print(f"  {name:28} no benchmark")
+            continue
+        old = (base_checks.get(name) or {}).get("seconds")
+        print(f"  {name:28} {res['calls']:6} {res['calls_per_sec'] or 0:12.0f} "
+              f"{ratio(res['seconds'], old)}")
+    for run in report["pipeline"]:
+        old = next((b for b in base.get("pipeline", []) if b["rows"] == run["rows"]), {})
+        print(f"\nPipeline, {run['rows']} rows: {run['seconds']:.2f} s "
+              f"({run['rows_per_sec']:.0f} rows/sec) {ratio(run['seconds'], old.get('seconds'))}"
+              f"\n  peak memory: {run['peak_rss_mb']:.0f} MB"
+              + (f" ({run['peak_python_mb']:.0f} MB python objects)"
+                 if "peak_python_mb" in run else "")
+              + f", questions asked: {run['questions']}")
+        for stage, seconds in sorted(run["stages"].items(), key=lambda item: -item[1]):
+            print(f"  {stage:28} {seconds:8.3f} s {100 * seconds / run['seconds']:5.1f}% "
+                  f"{ratio(seconds, old.get('stages', {}).get(stage))}")
+
+
+def make_parser(argu):
+    parser = argparse.ArgumentParser(description="Benchmark curation on synthetic bulks")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=[1000, 10000],
+                        help="Number of sequences of each synthetic bulk (up to 100000)")
+    parser.add_argument("--cardinality", type=int, default=50,
+                        help="Number of distinct labs, addresses, authors, locations")
+    parser.add_argument("--wrong", type=float, default=0.05,
+                        help="Share of malformed dates, coverages and locations")
+    parser.add_argument("--duplicates", type=float, default=0.01,
+                        help="Share of duplicated virus names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", default="xlsx", choices=["xlsx", "csv", "tsv", "parquet"],
+                        help="Format of synthetic bulks")
+    parser.add_argument("--chunk-size", type=int, help="Curate bulks by chunks of lines")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Check functions: keep best time of this number of runs")
+    parser.add_argument("--no-checks", action="store_true",
+                        help="Do not benchmark check functions")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also report peak memory of python objects (slower)")
+    parser.add_argument("-o", "--output", help="Save results to this json file")
+    parser.add_argument("--compare", help="json file of a previous run, to compare with")
+    return parser.parse_args(argu)
+
+
+def main(argu):
+    parsed = make_parser(argu)
+    report = {"env": environment(), "params": {
+        key: getattr(parsed, key) for key in ["cardinality", "wrong", "duplicates", "seed",
+                                              "format", "chunk_size"]},
+        "checks": {}, "pipeline": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for nb_rows in parsed.rows:
+            md = generate(nb_rows, parsed.cardinality, parsed.wrong, parsed.duplicates,
+                          parsed.seed)
+            if not parsed.no_checks and not report["checks"]:
+                report["checks"] = bench_checks(md, parsed.repeat)
+            file_in = os.path.join(tmp, f"bulk_{nb_rows}.{parsed.format}")
+            write_workbook(md, file_in)
+            del md
+            report["pipeline"].append(run_pipeline(file_in, nb_rows, parsed.chunk_size,
+                                                   parsed.tracemalloc))
+    base = None
+    if parsed.compare:
+        with open(parsed.compare) as base_file:
+            base = json.load(base_file)
+    print_report(report, base)
+    if parsed.output:
+        with open(parsed.output, "w") as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Curate several metadata files at once.
+
+Files are read and checked in parallel (one process per file), in non-interactive mode.
+Questions of all files are then merged: a value found in several files (same lab, same
+location...) is asked only once. Files are curated again with all answers, and this is
+repeated as long as new questions come up (e.g. the country of a virus name, once its
+location is fixed).
+
+Each file keeps its own outputs and logs ({file}.curated.xlsx, {file}.changes.log,
+{file}.contact_sub.log, {file}.virus_IDs.txt, {file}.changes.jsonl).
+
+Virus names must also be unique across the files of a batch. Each file curated claims its
+virus names, in the order of files: a file using a name already claimed by another one is
+curated again, with the names of the other files taken (see TakenNames), so that its
+sequences are renamed. Names are added to the registry only once claimed.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from gisaid_curation import utils
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.questions import Questions, ask_questions
+from gisaid_curation.registry import VirusNameRegistry
+from gisaid_curation.workbook import EXTENSIONS
+
+# Answers and options shared by all files curated by a worker process
+_worker = {}
+
+
+def list_files(paths):
+    """
+    Metadata files to curate: given files, and all metadata files found in given
+    directories (except outputs of a previous curation).
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if ".curated." in name or name.endswith(".questions.tsv"):
+                continue
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                files.append(os.path.join(path, name))
+    return files
+
+
+def cure_batch(files, decisions=None, questions_file=None, registry=None, jobs=None, **options):
+    """
+    Curate several metadata files, asking each question only once for all files.
+
+    Parameters
+    ----------
+    files: list of str
+        metadata files
+    decisions: DecisionStore
+        answers already given by curators, and where to save new ones
+    questions_file: str
+        if given, do not ask anything: questions of all files are merged and written to this
+        file (to give back with --answers)
+    registry: str
+        SQLite file of virus names already released (see registry.VirusNameRegistry)
+    jobs: int
+        number of files curated in parallel (default: number of CPUs)
+    options:
+        other parameters of data_curation.cure_metadata (cache_dir, cache_size, chunk_size)
+
+    Returns
+    -------
+    list
+        files which could not be curated, because some questions are left
+    """
+    if decisions is None:
+        decisions = DecisionStore(":memory:")
+    pending = list(files)
+    asked = set()
+    # {virus name: file} names of curated files
+    claimed = {}
+    while pending:
+        left = curate_round(pending, decisions, registry, claimed, jobs, options)
+        questions = Questions()
+        for file_questions in left.values():
+            questions.merge(file_questions)
+        pending = list(left)
+        if questions_file:
+            questions.write(questions_file)
+            print(f"{len(questions)} questions (for {len(pending)} files) written to "
+                  f"{questions_file}. Fill the 'answer' column, and run again with this file "
+                  "as answers file.")
+            return pending
+        # Do not ask again questions which were answered but are still there (value not
+        # accepted by the curator)
+        new = Questions()
+        new.questions = {key: info for key, info in questions.questions.items()
+                         if key not in asked}
+        if not len(new):
+            break
+        asked.update(new.questions)
+        ask_questions(new, decisions)
+    for file_in in pending:
+        print(f"{file_in} not curated: see questions left in {file_in}.questions.tsv")
+    return pending
+
+
+def curate_round(files, decisions, registry, claimed, jobs, options):
+    """
+    Curate files in parallel, without asking anything. Files curated claim their virus
+    names: a file using names already claimed is curated again, these names being taken.
+
+    Parameters
+    ----------
+    files: list of str
+        metadata files, in order of priority for their virus names
+    decisions: DecisionStore
+        answers already given by curators
+    registry: str
+        SQLite file of virus names already released. Names claimed are added to it.
+    claimed: dict
+        {virus name: file} names of files already curated, completed with the names of
+        files curated now
+    jobs, options: see cure_batch
+
+    Returns
+    -------
+    dict
+        {file: Questions} questions left for files which could not be curated
+    """
+    left = {}
+    todo = list(files)
+    while todo:
+        with ProcessPoolExecutor(jobs, initializer=init_worker,
+                                 initargs=(decisions.answers, decisions.curator, registry,
+                                           set(claimed), options)) as pool:
+            results = list(pool.map(cure_file, todo))
+        again = []
+        for file_in, (file_questions, names) in zip(todo, results):
+            if len(file_questions):
+                left[file_in] = file_questions
+                continue
+            used = sorted(name for name in names if name in claimed)
+            if used:
+                print(f"{file_in}: {len(used)} virus name(s) already used in other files of "
+                      f"the batch ('{used[0]}' in {claimed[used[0]]}). Curated again to "
+                      "rename them.")
+                discard_outputs(file_in)
+                again.append(file_in)
+                continue
+            claimed.update(dict.fromkeys(names, file_in))
+            if registry:
+                released = VirusNameRegistry(registry)
+                released.add(names)
+                released.close()
+            print(f"{file_in} curated.")
+        todo = again
+    return left
+
+
+def discard_outputs(file_in):
+    """
+    Remove curated file written for file_in (its virus names are not accepted)
+    """
+    for path in [f"{file_in}.curated.xlsx", f"{file_in}.curated.diff.tsv"]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class TakenNames:
+    """
+    Virus names which cannot be used by a file of a batch: names already released (see
+    registry.VirusNameRegistry), and names claimed by other files of the batch. Same
+    interface as VirusNameRegistry, but names of the file are not added to the registry:
+    they are kept in 'names', and added once claimed (see curate_round).
+
+    Parameters
+    ----------
+    registry: VirusNameRegistry
+        names already released (None: not checked)
+    taken: set
+        names claimed by other files of the batch
+    """
+
+    def __init__(self, registry, taken):
+        self.registry = registry
+        self.taken = taken
+        self.names = set()
+
+    def __contains__(self, name):
+        return name in self.taken or (self.registry is not None and name in self.registry)
+
+    def released(self, names):
+        found = {name for name in names if name in self.taken}
+        if self.registry is not None:
+            found |= self.registry.released(names)
+        return found
+
+    def add(self, names):
+        self.names.update(names)
+
+
+def init_worker(answers, curator, registry, taken, options):
+    """
+    Start a worker process, with a copy of all answers already given, and of virus names
+    claimed by other files
+    """
+    _worker["answers"] = answers
+    _worker["curator"] = curator
+    _worker["registry"] = registry
+    _worker["taken"] = taken
+    _worker["options"] = options
+
+
+def cure_file(file_in):
+    """
+    Curate a file in a worker process, without asking anything.
+
+    Returns
+    -------
+    (Questions, set)
+        questions left for this file (empty if file was curated), and its curated virus
+        names (empty if not curated)
+    """
+    # Imported here: listing files (list_files) must not load pandas
+    from gisaid_curation.data_curation import cure_metadata
+
+    utils.init_logger(file_in, "gisaid_curation")
+    decisions = DecisionStore(":memory:", _worker["curator"])
+    decisions.answers.update(_worker["answers"])
+    registry = None
+    if _worker["registry"]:
+        registry = VirusNameRegistry(_worker["registry"])
+    names = TakenNames(registry, _worker["taken"])
+    try:
+        questions = cure_metadata(file_in, decisions, f"{file_in}.questions.tsv", names,
+                                  **_worker["options"])
+        return questions, names.names
+    finally:
+        utils.close_logger("gisaid_curation")
+        decisions.close()
+        if registry is not None:
+            registry.close()
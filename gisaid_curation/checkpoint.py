@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Checkpoint of an interactive curation session, to resume it if it is stopped (STOP
+answer, Ctrl-C, crash).
+
+The checkpoint ({file}.checkpoint.json) contains everything the curator said during the
+session:
+- answers saved in the decisions store (locations, dates, labs...)
+- virus names typed for each line, with a hash of the line content
+- columns skipped, and the value where they were skipped
+and where the session stopped (last line and column curated).
+
+It is written after each column when the last save is older than CHECKPOINT_INTERVAL
+seconds, and each time the session stops before the end. It is removed once the curated
+file is written.
+
+When resuming, the file is curated again from the start, but all these answers are
+replayed instead of asking the questions again: the first question asked is the one
+where the session stopped. Curation is fast once the answers are known, and logs of the
+new session contain all changes. Virus names typed for lines which changed in the file
+since the checkpoint are not replayed: these lines are checked again.
+"""
+
+import os
+import json
+import time
+
+import pandas as pd
+
+
+# Minimum time between two checkpoints, in seconds
+CHECKPOINT_INTERVAL = 30
+
+
+def row_hashes(md):
+    """
+    Hash of the content of each line of metadata: {line: hash}
+    """
+    hashes = pd.util.hash_pandas_object(md, index=False)
+    return dict(zip(md.index.tolist(), hashes.tolist()))
+
+
+class Checkpoint:
+    """
+    Checkpoint of a curation session of file_in
+
+    Parameters
+    ----------
+    file_in: str
+        metadata file curated
+    decisions: DecisionStore
+        where answers of the curator are saved: answers added during the session are
+        saved in the checkpoint
+    interval: float
+        minimum time between two checkpoints (seconds)
+    """
+
+    def __init__(self, file_in, decisions, interval=CHECKPOINT_INTERVAL):
+        self.path = f"{file_in}.checkpoint.json"
+        self.decisions = decisions
+        self.interval = interval
+        # Answers already known before the session
+        self.known = dict(decisions.answers)
+        self.last_save = time.monotonic()
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def restore(self, state):
+        """
+        Load checkpoint: its answers are added to the decisions store, and virus names
+        typed and skipped columns to state (data_curation.CurationState)
+        """
+        with open(self.path) as cf:
+            saved = json.load(cf)
+        for field, original, value, accepted in saved["answers"]:
+            if self.decisions.get(field, original) is None:
+                self.decisions.record(field, original, value, accepted)
+        for column, text in saved["skipped"].items():
+            state.memo(column)[text] = None
+        state.row_hashes = {int(row): row_hash for row, row_hash in saved["hashes"].items()}
+        state.typed_vnames = {int(row): names for row, names in saved["vnames"].items()}
+        print(f"Resuming session stopped after column '{saved['last_column']}' (lines up to "
+              f"{saved['last_row']}): replaying {len(saved['answers'])} answers.")
+
+    def save(self, state):
+        """
+        Save all answers of the session, and progress of state (data_curation.CurationState)
+        """
+        answers = [[field, original, value, accepted]
+                   for (field, original), (value, accepted) in self.decisions.answers.items()
+                   if self.known.get((field, original)) != (value, accepted)]
+        saved = {"answers": answers, "skipped": state.skipped,
+                 "vnames": {row: names for row, names in state.typed_vnames.items() if names},
+                 "hashes": state.row_hashes,
+                 "last_row": state.last_row, "last_column": state.last_column}
+        # Write to a temporary file first: a crash while writing must not lose the
+        # previous checkpoint
+        with open(f"{self.path}.tmp", "w") as cf:
+            json.dump(saved, cf)
+        os.replace(f"{self.path}.tmp", self.path)
+        self.last_save = time.monotonic()
+
+    def save_if_due(self, state):
+        """
+        Save checkpoint if the last one is older than the interval
+        """
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save(state)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Find near-identical values of a column: 'Institut Pasteur, Paris', 'Institut Pasteur Paris'
+and 'institut pasteur - paris' are the same lab, written in different ways.
+
+Values are compared by their key (without accents, case, punctuation and extra spaces), and
+by the trigrams (3 consecutive characters) of their keys: 2 values are similar if the
+Jaccard index of their trigrams (shared trigrams / all trigrams) is at least THRESHOLD, and
+if they have the same numbers ('12 rue du Docteur Roux' and '13 rue du Docteur Roux' are
+not the same address).
+
+Similar values are found with an inverted index of trigrams, in which only the rarest
+trigrams of each key are indexed (prefix filtering): 2 keys with a high enough Jaccard
+index always share one of them. So each value is only compared to a few others, even
+with thousands of distinct values.
+"""
+
+import re
+import math
+from collections import Counter
+
+from gisaid_curation.transliteration import to_ascii
+
+
+# Minimum Jaccard index of trigrams of 2 similar values
+THRESHOLD = 0.65
+
+
+def cluster_key(text):
+    """
+    Key of a value: lower case words, without accents nor punctuation
+    """
+    return " ".join(re.findall(r"[^\W_]+", to_ascii(text).casefold()))
+
+
+def trigrams(key):
+    """
+    Set of trigrams of a key (with a space before and after, so that short keys have some)
+    """
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def find_clusters(values, threshold=THRESHOLD):
+    """
+    Group near-identical values.
+
+    Parameters
+    ----------
+    values: list of str
+        distinct values, in the order of their first appearance
+    threshold: float
+        minimum Jaccard index of trigrams of 2 similar values
+
+    Returns
+    -------
+    list of list of str
+        groups of at least 2 values, in the order of appearance of their first value
+        (and values of a group in the order of appearance)
+    """
+    # Values with the same key are the same
+    by_key = {}
+    for value in values:
+        by_key.setdefault(cluster_key(value), []).append(value)
+    keys = [key for key in by_key if key]
+    grams = [trigrams(key) for key in keys]
+    numbers = [re.findall(r"\d+", key) for key in keys]
+    # Rarest trigrams first
+    frequency = Counter(gram for key_grams in grams for gram in key_grams)
+    parent = list(range(len(keys)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    index = {}
+    for i, key_grams in enumerate(grams):
+        ordered = sorted(key_grams, key=lambda gram: (frequency[gram], gram))
+        # If Jaccard >= threshold, at least threshold * len(key_grams) trigrams are shared:
+        # one of them is in the first len - ceil(threshold * len) + 1 ones
+        prefix = ordered[:len(ordered) - math.ceil(threshold * len(ordered)) + 1]
+        candidates = {j for gram in prefix for j in index.get(gram, ())}
+        for j in candidates:
+            if numbers[i] != numbers[j] or root(i) == root(j):
+                continue
+            shared = len(key_grams & grams[j])
+            if shared >= threshold * (len(key_grams) + len(grams[j]) - shared):
+                parent[root(i)] = root(j)
+        for gram in prefix:
+            index.setdefault(gram, []).append(i)
+
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(root(i), []).extend(by_key[key])
+    rank = {value: pos for pos, value in enumerate(values)}
+    clusters = [sorted(group, key=rank.get) for group in groups.values()]
+    return sorted((cluster for cluster in clusters if len(cluster) > 1),
+                  key=lambda cluster: rank[cluster[0]])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Read and format coverages, all at once.
+
+Accepted coverages: numbers with or without 'x' ('4000X', '4,000 x', '12.5x', '4.5e3'),
+with a comparison sign ('>1000x'), or ranges ('100-200x', '100x to 200x'). Empty or
+'unknown' coverages are unknown.
+
+Coverages are written with ',' as thousands separator and a lower 'x' after the number:
+'4,000x', '>1,000x', '100-200x', '12.5x'. Numbers given with decimals or an exponent keep
+a decimal: '4.000' gives '4.0x', '4.5e3' gives '4,500.0x'.
+
+parse_coverages reads many coverages at once (with pandas), parse_coverage reads a single
+coverage (in pure python, without pandas).
+"""
+
+import re
+
+
+NUMBER = r"\d+(?:,\d{3})*(?:\.\d+)?(?:e[+-]?\d+)?"
+COVERAGE = (rf"(?i)^(?P<sign>[<>]=?|~)?\s*(?P<low>{NUMBER})\s*x?"
+            rf"(?:\s*(?:-|to)\s*(?P<high>{NUMBER})\s*x?)?$")
+
+
+def parse_coverages(values):
+    """
+    Read and format all given coverages at once.
+
+    Parameters
+    ----------
+    values: iterable of str
+        coverages, as given by the submitter
+
+    Returns
+    -------
+    numpy.ndarray
+        formatted coverages ('unknown' if no coverage given, None if it cannot be read)
+    """
+    import numpy as np
+    import pandas as pd
+
+    texts = pd.Series(list(values), dtype=object).fillna("").astype(str).str.strip()
+    if texts.empty:
+        return np.array([], dtype=object)
+    parts = texts.str.extract(COVERAGE)
+    low = pd.to_numeric(parts["low"].str.replace(",", "", regex=False))
+    high = pd.to_numeric(parts["high"].str.replace(",", "", regex=False))
+    covs = np.full(len(texts), None, dtype=object)
+    ok = (low.notna() & (high.isna() | (high >= low))).to_numpy()
+    signs = parts["sign"].fillna("").to_numpy(dtype=object)
+    for i in np.flatnonzero(ok):
+        cov = signs[i] + format_number(parts["low"].iat[i])
+        if not pd.isna(high.iat[i]):
+            cov += "-" + format_number(parts["high"].iat[i])
+        covs[i] = cov + "x"
+    unknown = ((texts == "") | (texts.str.lower() == "unknown")).to_numpy()
+    covs[unknown] = "unknown"
+    return covs
+
+
+def parse_coverage(value):
+    """
+    Read and format a single coverage (same rules as parse_coverages)
+    """
+    text = "" if value is None or value != value else str(value).strip()
+    if text == "" or text.lower() == "unknown":
+        return "unknown"
+    match = re.match(COVERAGE, text)
+    if not match:
+        return None
+    low = float(match["low"].replace(",", ""))
+    high = float(match["high"].replace(",", "")) if match["high"] else None
+    if high is not None and high < low:
+        return None
+    cov = (match["sign"] or "") + format_number(match["low"])
+    if high is not None:
+        cov += "-" + format_number(match["high"])
+    return cov + "x"
+
+
+def format_number(text):
+    """
+    Number as given by the submitter, with ',' as thousands separator: integers without
+    decimals, other numbers as floats (with at least 1 decimal)
+    """
+    number = text.replace(",", "")
+    if number.isdigit():
+        return f"{int(number):,}"
+    return f"{float(number):,}"
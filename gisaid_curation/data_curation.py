@@ -23,151 +23,828 @@
 #############################################################################
 
 import sys
+import contextlib
+from functools import partial
+
+import numpy as np
 import pandas as pd
-import unidecode
 
 import logging
 logger = logging.getLogger("gisaid_curation.metadata")
 
-from gisaid_curation import utils
-
-
-def cure_metadata(file_in):
-    """
-    file_in in xls format
-    """
-    # dict to put {original_value: new_value} (new_value can be the same as original one)
-    # to avoid re-checking next time we see this value
-    locations_list = {}
-    dates_list = {}
-    details_list = {}
-    hosts_list = {}
-    countries = {}  # countries found in virus names.
-    genders_list = {}
-    covs_list = {}
-    orilab_list = {}
-    orilabaddress_list = {}
-    sublab_list = {}
-    sublabaddress_list = {}
-    assembly_list = {}
-    seqtechno_list = {}
-    authors_list = {}
-    vnames_list = []  # list of virus names
-    
+from gisaid_curation import utils, transliteration
+from gisaid_curation.checkpoint import Checkpoint, row_hashes
+from gisaid_curation.clusters import find_clusters
+from gisaid_curation.coverage import parse_coverages, parse_coverage
+from gisaid_curation.dates import normalize_dates, normalize_date
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.gazetteer import GAZETTEER, load_gazetteer, CountryMatcher
+from gisaid_curation.journal import change
+from gisaid_curation.pipeline import Lookahead, BackgroundWriter
+from gisaid_curation.questions import Questions
+from gisaid_curation.rules import RULES
+from gisaid_curation.sequences import cure_fasta, read_renames
+from gisaid_curation.transliteration import to_ascii
+from gisaid_curation.workbook import read_workbook, iter_workbook, StreamingWriter, CACHE_SIZE
+
+
+# Columns where near-identical values are checked together (see check_clusters)
+CLUSTERED = ["covv_orig_lab", "covv_orig_lab_addr", "covv_subm_lab", "covv_subm_lab_addr",
+             "covv_authors"]
+
+
+class CurationState:
+    """
+    Everything already checked, shared by all lines (and all chunks) of a bulk
+
+    gazetteer: gazetteer.Gazetteer, known places used to fix locations (None to ask the
+               curator for every new location). Countries of virus names are compared to
+               locations with the countries of this gazetteer (default one if None).
+    """
+
+    # Memo of each column
+    MEMOS = {"covv_location": "locations_list", "covv_collection_date": "dates_list",
+             "covv_passage": "details_list", "covv_host": "hosts_list",
+             "covv_gender": "genders_list", "covv_patient_age": "ages_list",
+             "covv_coverage": "covs_list",
+             "covv_orig_lab": "orilab_list", "covv_orig_lab_addr": "orilabaddress_list",
+             "covv_subm_lab": "sublab_list", "covv_subm_lab_addr": "sublabaddress_list",
+             "covv_assembly_method": "assembly_list", "covv_seq_technology": "seqtechno_list",
+             "covv_authors": "authors_list"}
+
+    def __init__(self, gazetteer=None):
+        self.gazetteer = gazetteer
+        # dict to put {original_value: new_value} (new_value can be the same as original one)
+        # to avoid re-checking next time we see this value
+        self.locations_list = {}
+        self.dates_list = {}
+        self.details_list = {}
+        self.hosts_list = {}
+        self.countries = {}  # countries found in virus names.
+        # Whether countries of virus names correspond to locations
+        self.matcher = CountryMatcher(gazetteer or load_gazetteer())
+        self.genders_list = {}
+        self.ages_list = {}
+        self.covs_list = {}
+        self.orilab_list = {}
+        self.orilabaddress_list = {}
+        self.sublab_list = {}
+        self.sublabaddress_list = {}
+        self.assembly_list = {}
+        self.seqtechno_list = {}
+        self.authors_list = {}
+        self.vnames = set()  # virus names already seen
+        # Columns skipped by the curator: following lines are kept as is
+        # {column: text of the line where the curator skipped it}
+        self.skipped = {}
+        # Virus names typed by the curator: {line: [names]}, with a hash of the content of
+        # each line already curated: {line: hash} (see checkpoint.Checkpoint)
+        self.typed_vnames = {}
+        self.row_hashes = {}
+        # Last line and column curated
+        self.last_row = None
+        self.last_column = None
+
+    def check_rows(self, md):
+        """
+        Save the hash of each line of md (metadata, or chunk of metadata). Virus names
+        typed for lines which changed since they were hashed (previous session) are
+        forgotten: these lines will be checked again.
+
+        return int: number of lines changed
+        """
+        hashes = row_hashes(md)
+        changed = [row for row, row_hash in hashes.items()
+                   if self.row_hashes.get(row, row_hash) != row_hash]
+        for row in changed:
+            self.typed_vnames.pop(row, None)
+        self.row_hashes.update(hashes)
+        self.last_row = int(md.index[-1]) if len(md) else self.last_row
+        return len(changed)
+
+    def memo(self, column):
+        """
+        Memo of the given column: {original_value: new_value}
+        """
+        return getattr(self, self.MEMOS[column])
+
+
+def cure_metadata(file_in, decisions=None, questions_file=None, registry=None, cache_dir=None,
+                  cache_size=CACHE_SIZE, chunk_size=None, gazetteer=GAZETTEER, profiler=None,
+                  resume=False, fasta=None, jobs=None):
+    """
+    file_in in xls format (or xlsx, csv, tsv, parquet: see workbook.read_workbook)
+    decisions: DecisionStore, answers already given by curators (and where to save new ones)
+    questions_file: if given, do not ask anything to the curator. Questions are written
+                    to this file, and curated metadata are only saved if there is no question.
+    registry: VirusNameRegistry, virus names already released. Names of the curated
+              bulk are added to it.
+    cache_dir, cache_size: cache of parsed files (see workbook.read_workbook)
+    chunk_size: if given, read and curate lines by chunks of chunk_size lines, and write
+                each curated chunk to {file_in}.curated.xlsx before reading the next one.
+                Otherwise, the whole file is curated, then written to this file.
+                Cells changed are listed in {file_in}.curated.diff.tsv.
+    gazetteer: file of known places (see gazetteer.Gazetteer). Locations made only of known
+               places are fixed without asking the curator. None to check all locations.
+    profiler: profiling.Profiler, to record time spent in each phase and check function,
+              and memo hits/misses
+    resume: resume the session stopped on this file (see checkpoint.Checkpoint). In
+            interactive mode, a checkpoint of the session is always saved until the
+            curated file is written.
+    fasta: FASTA file of the bulk. Once the curated file is written, its sequences are
+           renamed with the curated virus names, and counted (see sequences.cure_fasta).
+    jobs: number of processes counting bases of big FASTA files (default: number of CPUs)
+
+    return Questions: in non-interactive mode, questions left (None otherwise)
+    """
+    state = CurationState(load_gazetteer(gazetteer) if gazetteer else None)
+    if profiler is None:
+        phase = lambda name: contextlib.nullcontext()
+    else:
+        phase = profiler.phase
+        profiler.watch_memos(state)
+
+    if decisions is None:
+        decisions = DecisionStore(":memory:")
+    checkpoint = None
+    # Non-interactive mode: collect questions instead of asking them
+    if questions_file:
+        decisions.questions = Questions()
+    # Interactive mode: save answers of the curator, to resume if stopped
+    else:
+        checkpoint = Checkpoint(file_in, decisions)
+        if resume and checkpoint.exists():
+            checkpoint.restore(state)
+        elif resume:
+            print(f"No checkpoint found for {file_in}: starting a new session.")
+    try:
+        md, original, writer = curate_file(file_in, state, decisions, registry, cache_dir,
+                                           cache_size, chunk_size, phase, profiler, checkpoint)
+
+        if questions_file:
+            decisions.questions.write(questions_file)
+        if questions_file and len(decisions.questions):
+            if chunk_size:
+                writer.discard()
+            print(f"{len(decisions.questions)} questions written to {questions_file}. Fill "
+                  "the 'answer' column, and run again with this file as answers file.")
+            return decisions.questions
+
+        with phase("write"):
+            if not chunk_size:
+                writer = curated_writer(file_in)
+                writer.append(md, original)
+            writer.close()
+    except BaseException:
+        # Stopped by the curator (STOP, Ctrl-C) or crash: save all answers
+        if checkpoint is not None:
+            checkpoint.save(state)
+            print(f"Session saved to {checkpoint.path}. Run again with --resume to go on.")
+        raise
+    if checkpoint is not None:
+        checkpoint.remove()
+    # Curated names are now taken
+    if registry is not None:
+        registry.add(state.vnames)
+    if fasta:
+        with phase("sequences"):
+            summary = cure_fasta(fasta, sorted(state.vnames),
+                                 read_renames(f"{file_in}.curated.diff.tsv"), jobs)
+        print(f"{summary['sequences']} sequences in {fasta}: {summary['renamed']} renamed, "
+              f"{summary['extra']} without metadata line, {summary['duplicated']} given "
+              f"several times, and {summary['missing']} metadata lines without sequence. "
+              f"Curated sequences written to {fasta}.curated.fasta.")
+    if questions_file:
+        return decisions.questions
+
+
+def curate_file(file_in, state, decisions, registry, cache_dir, cache_size, chunk_size, phase,
+                profiler=None, checkpoint=None):
+    """
+    Read and curate file_in (see cure_metadata for parameters)
+
+    Returns
+    -------
+    (pandas.DataFrame, pandas.DataFrame, workbook.StreamingWriter)
+        curated and original metadata (None in chunk mode), writer of curated chunks
+        (None if not in chunk mode)
+    """
+    writer = md = original = None
+    if chunk_size:
+        # Read input file chunk by chunk, and write curated chunks as soon as they are ready
+        # (no need to keep them in memory). In non-interactive mode, the curated file is
+        # removed if some questions are left.
+        # Next chunks are read, and curated ones written, in the background while the
+        # curator answers questions (see pipeline)
+        with phase("read"):
+            _, chunks = iter_workbook(file_in, chunk_size)
+            writer = BackgroundWriter(curated_writer(file_in))
+        chunks = Lookahead(chunks, state.gazetteer)
+        if profiler is not None:
+            chunks = profiler.timed_iter("read", chunks)
+        try:
+            for md, prepared in chunks:
+                original = md.copy()
+                with phase("curation"):
+                    curate_submissions(md, state, decisions, registry, checkpoint, prepared)
+                with phase("write"):
+                    writer.append(md, original)
+            # Last chunks
+            with phase("write"):
+                writer.finish()
+        except BaseException:
+            writer.discard()
+            raise
+        md = original = None
+    else:
+        # Read input file (both sheets at once)
+        with phase("read"):
+            _, md = read_workbook(file_in, cache_dir, cache_size)
+        # Empty cells filled, and dates, coverages and locations normalized in the
+        # background while the first columns are curated (see pipeline)
+        md, prepared = next(iter(Lookahead([md], state.gazetteer)))
+        # Kept to list cells changed by curation
+        original = md.copy()
+        with phase("curation"):
+            curate_submissions(md, state, decisions, registry, checkpoint, prepared)
+    return md, original, writer
+
+
+def curated_writer(file_in):
+    """
+    Writer of curated metadata: {file_in}.curated.xlsx, with the instructions sheet of
+    file_in, and cells changed in {file_in}.curated.diff.tsv
+    """
+    return StreamingWriter(f"{file_in}.curated.xlsx", file_in, f"{file_in}.curated.diff.tsv")
+
+
+def curate_submissions(md, state, decisions=None, registry=None, checkpoint=None,
+                       prepared=None):
+    """
+    Check all fields of metadata (or of a chunk of metadata), column by column.
+    Each distinct value of a column is checked only once, and curated values are written
+    back to the whole column.
+
+    md: pandas.DataFrame, metadata (Submissions sheet, or chunk of lines), modified in place
+    state: CurationState, values already checked (updated with this chunk)
+    decisions: DecisionStore, answers already given by curators
+    registry: VirusNameRegistry, virus names already released
+    checkpoint: checkpoint.Checkpoint, saved from time to time, after a column is curated
+    prepared: pipeline.Prepared, locations, dates and coverages of md already normalized
+    """
+    def normalized(column, wait=True):
+        return prepared.get(column, wait) if prepared is not None else None
+
+    def done(column):
+        state.last_column = column
+        if checkpoint is not None:
+            checkpoint.save_if_due(state)
+
+    if checkpoint is not None:
+        changed = state.check_rows(md)
+        if changed:
+            print(f"{changed} lines changed since the session was stopped: they are "
+                  "checked again.")
+    # Skip 2nd header line
+    rows = ~md["fn"].str.contains("filename", regex=False)
+    # Check covv_type.
+    check_type(md, rows)
+    done("covv_type")
+    # Check location field
+    curate_column(md, rows, "covv_location",
+                  partial(check_location, locations=state.locations_list, decisions=decisions,
+                          gazetteer=state.gazetteer,
+                          # Not ready for the 1st chunk: do not wait, check them here
+                          normalized=normalized("covv_location", wait=False)),
+                  decisions)
+    done("covv_location")
+    # Check virus names (must be done line by line, as they must be unique)
+    check_vnames(md, rows, state.vnames, state.countries, decisions, registry,
+                 state.typed_vnames, state.matcher)
+    done("covv_virus_name")
+    # Check dates
+    curate_date_column(md, rows, state.dates_list, decisions,
+                       normalized("covv_collection_date"))
+    done("covv_collection_date")
+    # Check passage history/details column
+    curate_text_column(md, rows, "covv_passage", state.details_list, decisions=decisions)
+    done("covv_passage")
+    # Check host
+    curate_text_column(md, rows, "covv_host", state.hosts_list, decisions=decisions)
+    done("covv_host")
+    # Check gender
+    apply_rule(md, rows, "covv_gender", state.genders_list)
+    curate_column(md, rows, "covv_gender",
+                  partial(check_gender, genders_list=state.genders_list, decisions=decisions),
+                  decisions)
+    done("covv_gender")
+    # Check patient age (nothing asked: wrong ages are reported to the submitter)
+    if "covv_patient_age" in md:
+        curate_rule_column(md, rows, "covv_patient_age", state.ages_list, decisions)
+        done("covv_patient_age")
+    # Check originating and submitting lab and address
+    # If not given, contact submitter and DO NOT release
+    curate_mandatory_column(md, rows, "covv_orig_lab", state.orilab_list, state.skipped,
+                            decisions=decisions)
+    done("covv_orig_lab")
+    curate_mandatory_column(md, rows, "covv_orig_lab_addr", state.orilabaddress_list,
+                            state.skipped, decisions=decisions)
+    done("covv_orig_lab_addr")
+    curate_mandatory_column(md, rows, "covv_subm_lab", state.sublab_list, state.skipped,
+                            decisions=decisions)
+    done("covv_subm_lab")
+    curate_mandatory_column(md, rows, "covv_subm_lab_addr", state.sublabaddress_list,
+                            state.skipped, decisions=decisions)
+    done("covv_subm_lab_addr")
+    curate_mandatory_column(md, rows, "covv_authors", state.authors_list, state.skipped,
+                            decisions=decisions)
+    done("covv_authors")
+    # Check sequence information. If not given, contact submitter, but release
     # Sometimes, assembly method was incremented by a bad "Excell fill down" by the user. Hence,
     # it will always ask if method is ok (as these are different methods each time)
     # Curator can skip this column
-    skip_assembly = False
-    # same as for assembly method
-    skip_seqtechno = False
-    skip_authors = False
-
-    # Read input xls file
-    md = pd.read_excel(file_in, sheet_name=1, header=0, dtype=str)
-    instructions = pd.read_excel(file_in, sheet_name=0, header=0, dtype=str)
-
-
-    # Empty cells
-    md = md.fillna("")
-    corresp_file = f"{file_in}.virus_IDs.txt"
-    # create empty file to put curated metadata
-    open(corresp_file, "w").close()
-    # Check all fields, line by line
-    for index, line in md.iterrows():
-        # Skip 2nd header line
-        if "filename" in line["fn"]:
+    curate_mandatory_column(md, rows, "covv_assembly_method", state.assembly_list,
+                            state.skipped, decisions=decisions)
+    done("covv_assembly_method")
+    # same as for assembly_method
+    curate_mandatory_column(md, rows, "covv_seq_technology", state.seqtechno_list,
+                            state.skipped, decisions=decisions)
+    done("covv_seq_technology")
+    # Check coverage
+    curate_coverage_column(md, rows, state.covs_list, decisions, normalized("covv_coverage"))
+    done("covv_coverage")
+
+
+def curate_column(md, rows, column, cure_value, decisions=None):
+    """
+    Check a column once per distinct value, and write curated values back to md.
+
+    Distinct values are checked in the order of their first appearance in the column, so
+    that questions are asked in the same order as when reading the file line by line.
+
+    Parameters
+    ----------
+    md: pandas.DataFrame
+        metadata (Submissions sheet)
+    rows: pandas.Series of bool
+        lines to check (False for the 2nd header line)
+    column: str
+        header of column to check
+    cure_value: function(value, seq) -> new_value
+        check a given value. 'seq' is the first sequence with this value (for messages
+        to the curator). If it returns None, the curator asked to skip this column: this
+        value, and all lines starting from the first sequence having it, are kept as is.
+    decisions: DecisionStore
+        in non-interactive mode, used to count lines concerned by each question
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        original and curated values of the checked lines
+    """
+    values = md.loc[rows, column]
+    categorical = isinstance(values.dtype, pd.CategoricalDtype)
+    if categorical:
+        codes, uniques = categories_by_appearance(values)
+    else:
+        # Copy: when all lines are checked, to_numpy gives a view of md, changed below
+        codes, uniques = pd.factorize(values.to_numpy(dtype=object).copy())
+    ori_values = np.asarray(uniques, dtype=object)[codes]
+    transliteration.count(column, pd.Series(uniques, dtype=object))
+    seqs = md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)
+    # Position of the first line with each distinct value. As codes are given by order of
+    # appearance, value 'i' is first seen at first_rows[i]
+    first_rows, counts = np.unique(codes, return_index=True, return_counts=True)[1:]
+    new_uniques = np.array(uniques, dtype=object)
+    skip_from = None
+    for code, value in enumerate(uniques):
+        new_value = cure_value(value, seqs[first_rows[code]])
+        if collecting(decisions):
+            decisions.questions.add_rows(counts[code])
+        if new_value is None:
+            skip_from = first_rows[code]
+            break
+        new_uniques[code] = new_value
+    new_values = new_uniques[codes] if len(codes) else ori_values.copy()
+    # Column skipped by curator: keep lines as they are starting from this sequence
+    if skip_from is not None:
+        new_values[skip_from:] = ori_values[skip_from:]
+    if categorical:
+        recode(md, rows, column, codes, uniques, new_uniques, skip_from)
+    else:
+        md.loc[rows, column] = new_values
+    return ori_values, new_values
+
+
+def categories_by_appearance(values):
+    """
+    Codes and distinct values of a categorical column, as pandas.factorize would give
+    them: values are numbered in the order of their first appearance, and unused
+    categories are left out.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        code of each line, and distinct values
+    """
+    cat_codes = values.cat.codes.to_numpy()
+    present, first_rows = np.unique(cat_codes, return_index=True)
+    present = present[np.argsort(first_rows)]
+    renumber = np.empty(len(values.cat.categories), dtype=np.intp)
+    renumber[present] = np.arange(len(present))
+    return renumber[cat_codes], values.cat.categories.to_numpy(dtype=object)[present]
+
+
+def recode(md, rows, column, codes, uniques, new_uniques, skip_from=None):
+    """
+    Write curated values of a categorical column back to md by recoding its categories:
+    lines are given the code of the curated value of their category, without building
+    a value per line.
+
+    codes, uniques: see categories_by_appearance
+    new_uniques: curated value of each distinct value
+    skip_from: position (among checked lines) from which lines are kept as they are
+    """
+    column_values = md[column]
+    categories = pd.Index(pd.unique(np.concatenate([
+        np.asarray(new_uniques, dtype=object),
+        column_values.cat.categories.to_numpy(dtype=object)])))
+    # Code of the curated value of each distinct value, and of each original category
+    new_codes = categories.get_indexer(new_uniques)[codes]
+    kept_codes = categories.get_indexer(column_values.cat.categories)
+    all_codes = column_values.cat.codes.to_numpy()
+    new_all = kept_codes[all_codes]
+    if skip_from is not None:
+        checked = new_codes.copy()
+        checked[skip_from:] = kept_codes[all_codes[np.flatnonzero(rows)[skip_from:]]]
+        new_codes = checked
+    new_all[np.flatnonzero(np.asarray(rows))] = new_codes
+    md[column] = pd.Series(pd.Categorical.from_codes(new_all, categories),
+                           index=md.index).cat.remove_unused_categories()
+
+
+def apply_rule(md, rows, column, column_list, key=None, log=True):
+    """
+    Apply the rule of a column (see rules.RULES) to all its new distinct values at once.
+    Values fixed without asking the curator (accepted, or unknown in an optional column,
+    or wrong but not asked) are saved in column_list, so that only the other ones are
+    checked one by one afterwards.
+
+    key: function giving the key of a value in column_list (default: value itself)
+    log: log changed values, and wrong values reported to the submitter (with the first
+         sequence having them)
+    """
+    rule = RULES[column]
+    key = key or (lambda value: value)
+    values = md.loc[rows, column]
+    # First sequence with each value (reversed: first one is written last)
+    seqs = dict(zip(values.to_numpy(dtype=object)[::-1],
+                    md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)[::-1]))
+    new = [value for value in pd.unique(values) if key(value) not in column_list]
+    for value, fixed, status in zip(new, *rule.fix_all(new)):
+        if not rule.final(status) or key(value) in column_list:
+            continue
+        column_list[key(value)] = fixed
+        if not log:
             continue
-        # Check covv_type. 
-        check_type(line)
-        # Check location field
-        check_location(line, locations_list)
-        print("")
-        # Check virus names
-        check_vnames(line, vnames_list, countries, corresp_file)
-        print("")
-        # Check dates
-        check_date(line, dates_list)
-        # Check passage history/details column
-        check_column(line, "covv_passage", details_list, capital=True)
-        print("")
-        # Check host
-        check_column(line, "covv_host", hosts_list, capital=True)
-        # Check gender
-        check_gender(line, genders_list)
-        # Check originating and submitting lab and address
-        # If not given, contact submitter and DO NOT release
-        check_mandatory_field(line, "covv_orig_lab", orilab_list, alert=True)
-        check_mandatory_field(line, "covv_orig_lab_addr", orilabaddress_list, alert=True)
-        check_mandatory_field(line, "covv_subm_lab", sublab_list, alert=True)
-        check_mandatory_field(line, "covv_subm_lab_addr", sublabaddress_list, alert=True)
-        if not skip_authors:
-            skip_authors = check_mandatory_field(line, "covv_authors", authors_list, 
-                                                 alert=True, user_check=True)
-        # Check sequence information. If not given, contact submitter, but release
-        if not skip_assembly:
-            # Sometimes, assembly method was incremented by a bad "Excell fill down" by the user. Hence,
-            # it will always ask if method is ok (as these are different methods each time)
-            # Curator can skip this column
-            skip_assembly = check_mandatory_field(line, "covv_assembly_method", assembly_list, 
-                                                  alert=False, user_check=True)
-        if not skip_seqtechno:
-            # same as for assembly_method
-            skip_seqtechno = check_mandatory_field(line, "covv_seq_technology", seqtechno_list, 
-                                                   alert=False, user_check=True)
-        # Check coverage
-        check_coverage(line, covs_list)
-
-    logger.error("TO CURATOR: check 'Patient age'.")
-
-    # Save as xls
-    writer = pd.ExcelWriter(f"{file_in}.curated.xls") 
-    instructions.to_excel(writer, sheet_name='instructions', index=False)
-    md.to_excel(writer, sheet_name='Submissions', index=False)
-    writer.save()
-
-
-def check_type(line):
-    """
-    type must always be 'betacoronavirus'
+        seq = seqs[value]
+        if status == "wrong":
+            report = logger.error if rule.severity == "ERROR" else logger.warning
+            report(f"For {seq}, wrong '{column}': '{value}' ({rule.message}). Inform "
+                   "submitter." + (" NO RELEASE" if rule.severity == "ERROR"
+                                   else " Can be released."),
+                   extra=change(column, value, fixed, seq))
+        elif fixed != value:
+            logger.info(f"For {seq}, '{column}' column: changed '{value}' to '{fixed}'.",
+                        extra=change(column, value, fixed, seq))
+
+
+def curate_rule_column(md, rows, column, column_list, decisions=None):
+    """
+    Check a column only with its rule (see rules.RULES), without any check function:
+    nothing is asked to the curator.
+    """
+    apply_rule(md, rows, column, column_list)
+    curate_column(md, rows, column, lambda value, seq: column_list[value], decisions)
+
+
+def curate_text_column(md, rows, column, column_list, decisions=None):
+    """
+    Check passage details/history or host column (see check_column), and log each
+    changed sequence.
+    """
+    # Memo of check_column is on lower case values
+    apply_rule(md, rows, column, column_list, key=str.lower, log=False)
+    ori_values, new_values = curate_column(md, rows, column,
+                                           partial(check_column, column=column,
+                                                   column_list=column_list,
+                                                   decisions=decisions),
+                                           decisions)
+    seqs = md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)
+    index = md.index[rows]
+    for i in np.flatnonzero(ori_values != new_values):
+        logger.info(f"For {seqs[i]}, '{column}' column: changed '{ori_values[i]}' "
+                    f"to '{new_values[i]}'.",
+                    extra=change(column, ori_values[i], new_values[i], seqs[i], index[i]))
+
+
+def curate_date_column(md, rows, dates_list, decisions=None, normalized=None):
+    """
+    Check collection date column. All new distinct dates are normalized at once (see
+    dates.normalize_dates): only invalid ones are then checked one by one (see check_date).
+
+    normalized: {date: (normalized date, reason)} dates already normalized (see pipeline)
+    """
+    normalized = normalized or {}
+    dates = pd.unique(md.loc[rows, "covv_collection_date"].str.strip())
+    dates = [date for date in dates if date not in dates_list]
+    todo = [date for date in dates if date not in normalized]
+    normalized = {**normalized, **dict(zip(todo, zip(*normalize_dates(todo))))}
+    for ori_date in dates:
+        date, reason = normalized[ori_date]
+        if reason is not None:
+            continue
+        dates_list[ori_date] = date
+        if date != ori_date and date != "unknown":
+            logger.info(f"'Collection date' column: changed '{ori_date}' to '{date}'.",
+                        extra=change("covv_collection_date", ori_date, date))
+    curate_column(md, rows, "covv_collection_date",
+                  partial(check_date, dates_list=dates_list, decisions=decisions),
+                  decisions)
+
+
+def curate_mandatory_column(md, rows, column, column_list, skipped, decisions=None):
+    """
+    Check a mandatory column (see check_mandatory_field)
+
+    skipped: {column: text} columns skipped by the curator, and text of the line where it
+             was skipped. If this column is in it, lines are kept as is. If the curator asks
+             to skip it now, it is added.
+    """
+    if column in skipped:
+        return
+    if column in CLUSTERED:
+        check_clusters(md, rows, column, column_list, decisions)
+    apply_rule(md, rows, column, column_list)
+
+    def cure_text(text, seq):
+        new_text = check_mandatory_field(text, seq, column, column_list, decisions=decisions)
+        if new_text is None:
+            skipped[column] = text
+        return new_text
+
+    curate_column(md, rows, column, cure_text, decisions)
+
+
+def check_clusters(md, rows, column, column_list, decisions=None):
+    """
+    Near-identical new values of a column ('Institut Pasteur, Paris', 'institut pasteur -
+    paris', see clusters.find_clusters) are shown together to the curator, who chooses the
+    value to put for all of them. This value is saved in column_list for each of them, so
+    that they are not checked one by one afterwards.
+
+    Answers are saved in decisions under column '<column>_cluster', for the values of the
+    group separated by ' | '.
+    """
+    values = md.loc[rows, column]
+    counts = values.value_counts(sort=False)
+    # First sequence with each value (reversed: first one is written last)
+    seqs = dict(zip(values.to_numpy(dtype=object)[::-1],
+                    md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)[::-1]))
+    new = [value for value in pd.unique(values)
+           if value not in column_list and value.strip() and value.lower() != "unknown"]
+    for cluster in find_clusters(new):
+        # Most frequent value proposed (first one if several)
+        proposal = max(cluster, key=lambda value: counts[value])
+        chosen = check_cluster(cluster, proposal, seqs[cluster[0]], column, counts, decisions)
+        if collecting(decisions):
+            decisions.questions.add_rows(sum(counts[value] for value in cluster))
+            # Question saved: values are not asked one by one before it is answered
+            if (f"{column}_cluster", " | ".join(cluster)) in decisions.questions:
+                column_list.update((value, value) for value in cluster)
+                continue
+        if chosen is None:
+            continue
+        chosen = to_ascii(chosen)
+        for value in cluster:
+            if value != chosen:
+                logger.info(f"For sequence {seqs[value]}, '{column}' column: changed "
+                            f"'{value}' to '{chosen}'.",
+                            extra=change(column, value, chosen, seqs[value]))
+            column_list[value] = chosen
+
+
+def check_cluster(cluster, proposal, seq, column, counts, decisions=None):
+    """
+    Ask the curator which value to put for a group of near-identical values.
+
+    cluster: list of str, values of the group
+    proposal: str, value proposed for all of them
+    seq: str, first sequence with one of these values
+    counts: {value: number of sequences}
+
+    return str or None: value to put for all of them, or None if they must be checked one
+    by one (curator said they are not the same, or question saved for later)
+    """
+    field = f"{column}_cluster"
+    key = " | ".join(cluster)
+    # Already answered by a curator in a previous run
+    known = decisions.get(field, key) if decisions is not None else None
+    if known:
+        return known[0] if known[1] else None
+    if ask_later(decisions, field, key, proposal, seq,
+                 f"Are {', '.join(repr(value) for value in cluster)} the same {column}? "
+                 f"'y' to put '{proposal}' for all of them, 'n' to check them one by one, "
+                 "or value to put for all of them."):
+        return None
+    print(f"\n------{column.upper()} checking-----")
+    print(f"These values look the same (first one for {seq}):")
+    for num, value in enumerate(cluster, 1):
+        print(f"\t{num}: '{value}' ({counts[value]} sequence(s))")
+    answer = input(f"Put '{proposal}' for all of them: 'Y' (default), number of the value "
+                   "to put for all of them, 'n' if they are not the same (they will be "
+                   "checked one by one), or new value:\n").strip()
+    if answer.lower() in ["n", "no"]:
+        if decisions is not None:
+            decisions.record(field, key, proposal, accepted=False)
+        return None
+    if answer.lower() in ["", "y", "yes"]:
+        chosen = proposal
+    elif answer.isdigit() and 1 <= int(answer) <= len(cluster):
+        chosen = cluster[int(answer) - 1]
+    else:
+        chosen = answer
+    if decisions is not None:
+        decisions.record(field, key, chosen)
+    return chosen
+
+
+def curate_coverage_column(md, rows, cov_list, decisions=None, normalized=None):
+    """
+    Check coverage column, and log each changed sequence (contact submitter, but can be
+    released).
+
+    All new distinct coverages are read at once (see coverage.parse_coverages). Those which
+    cannot be read are shown to the curator all together, who can put 'unknown' for all
+    of them at once, or give them one by one (see check_coverage).
+
+    normalized: {coverage: parsed coverage} coverages already read (see pipeline)
+    """
+    normalized = normalized or {}
+    covs = [cov for cov in pd.unique(md.loc[rows, "covv_coverage"]) if cov not in cov_list]
+    todo = [cov for cov in covs if cov not in normalized]
+    normalized = {**normalized, **dict(zip(todo, parse_coverages(todo)))}
+    wrong = []
+    for ori_cov in covs:
+        cov = normalized[ori_cov]
+        if cov is not None:
+            cov_list[ori_cov] = cov
+        # Already corrected by a curator: see check_coverage
+        elif not known_answer(decisions, "covv_coverage", ori_cov):
+            wrong.append(ori_cov)
+    if wrong and not collecting(decisions):
+        counts = md.loc[rows, "covv_coverage"].value_counts()
+        print("------COVERAGE checking-----")
+        print(f"{len(wrong)} given coverage(s) cannot be read:")
+        for ori_cov in wrong:
+            print(f"\t'{ori_cov}' ({counts[ori_cov]} sequence(s))")
+        answer = input("Put 'unknown' for all of them: 'U' (default), or give them one "
+                       "by one: 'e'\n")
+        if answer.strip().lower() not in ["e", "edit"]:
+            for ori_cov in wrong:
+                cov_list[ori_cov] = "unknown"
+                if decisions is not None:
+                    decisions.record("covv_coverage", ori_cov, "unknown")
+    ori_values, new_values = curate_column(md, rows, "covv_coverage",
+                                           partial(check_coverage, cov_list=cov_list,
+                                                   decisions=decisions),
+                                           decisions)
+    seqs = md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)
+    for row, seq, ori_cov, cov in zip(md.index[rows], seqs, ori_values, new_values):
+        # If there was something in coverage but it was changed, log it
+        if ori_cov != cov and ori_cov:
+            logger.warning(f"For {seq} 'Coverage' column: changed '{ori_cov}' to "
+                           f"'{cov}'. Sequence can be released",
+                           extra=change("covv_coverage", ori_cov, cov, seq, row))
+        elif not ori_cov:
+            logger.warning(f"For {seq}, coverage not given. Filled with unknown "
+                           "(Sequence can be released)",
+                           extra=change("covv_coverage", ori_cov, cov, seq, row))
+
+
+def known_answer(decisions, column, value):
+    """
+    Get value accepted by a curator (in a previous run, or in an answers file) for
+    this original value.
+
+    return str or None: None if this value was never checked, or was refused
+    """
+    if decisions is None:
+        return None
+    known = decisions.get(column, value)
+    if known and known[1]:
+        return known[0]
+    return None
+
+
+def collecting(decisions):
+    """
+    True if running in non-interactive mode (questions are saved instead of asked)
+    """
+    return decisions is not None and decisions.questions is not None
+
+
+def ask_later(decisions, column, value, proposal, seq, question):
+    """
+    In non-interactive mode, save a question instead of asking it to the curator.
+
+    column, value: column and original value concerned by the question
+    proposal: value which will be put if the curator accepts it
+    seq: first sequence with this value
+
+    return bool: True if question was saved (so it must not be asked now)
+    """
+    if not collecting(decisions):
+        return False
+    decisions.questions.add(column, value, proposal, seq, question)
+    return True
+
+
+def check_type(md, rows):
+    """
+    type must always be 'betacoronavirus' (see rules.RULES)
 
     Parameters
     ----------
-    line: pandas.core.series.Series
-        line currently checked
+    md: pandas.DataFrame
+        metadata (Submissions sheet)
+    rows: pandas.Series of bool
+        lines to check
     """
-    vtype = line["covv_type"]
-    if vtype != "betacoronavirus":
-        logger.info(f"Type changed from '{vtype}' to 'betacoronavirus'.")
-        line["covv_type"] = "betacoronavirus"
+    vtypes = md.loc[rows, "covv_type"].unique()
+    fixed = dict(zip(vtypes, RULES["covv_type"].fix_all(vtypes)[0]))
+    for vtype, new_type in fixed.items():
+        if new_type != vtype:
+            logger.info(f"Type changed from '{vtype}' to '{new_type}'.",
+                        extra=change("covv_type", vtype, new_type))
+    curate_column(md, rows, "covv_type", lambda vtype, seq: fixed[vtype])
 
 
-def check_location(line, locations):
+def check_location(ori_location, seq, locations, decisions=None, gazetteer=None,
+                   normalized=None):
     """
     Check Location column
 
-    line = pandas.core.series.Series
+    ori_location -> str
+    seq -> str, first sequence with this location
     locations -> dict {prev_loc: new_loc}
+    decisions -> DecisionStore, answers already given by curators
+    gazetteer -> Gazetteer, known places. If all places of the location are known, it is
+                 fixed (missing continent, case, typos) without asking the curator
+    normalized -> dict {location: (fields, sure)} locations already normalized with the
+                  gazetteer (see pipeline)
+
+    return str: checked location
     """
     write_warning = True
-    ori_location = line["covv_location"]
     location = ori_location
     location_ok = False
+    location_typed = False
+    # Location already checked by a curator in a previous run: reuse his answer
+    if location not in locations:
+        known = known_answer(decisions, "covv_location", ori_location)
+        if known:
+            location = known
+            location_ok = True
     while not location_ok:
         # If we already saw this field, and it was valid, just skip checking this time
         if location in locations:
             location = locations[location]
-            line["covv_location"] = location
             locations[ori_location] = location
-            location_ok = True
-            return
+            return location
         # If never seen before, check format
         else:
             # Separate by continent, country, region
             sep = location.strip().split("/")
             # Keep only each field without accent, non-utf8 characters, and no trailing spaces
-            sep = [unidecode.unidecode(f.strip()) for f in sep]
-            formatted_sep = checked_location_format(sep, location, locations)
+            sep = [to_ascii(f.strip()) for f in sep]
+            if gazetteer is not None:
+                if normalized and location in normalized:
+                    sep, sure = normalized[location]
+                    sep = list(sep)
+                else:
+                    sep, sure = gazetteer.normalize(sep)
+                if sure:
+                    location = " / ".join(sep)
+                    # Location typed by the curator, now in the right format
+                    if location_typed and decisions is not None:
+                        decisions.record("covv_location", ori_location, location)
+                    break
+            formatted_sep = checked_location_format(sep, location, locations, decisions)
             location = " / ".join(formatted_sep)
+            if ask_later(decisions, "covv_location", ori_location, location, seq,
+                         f"Is location '{location}' ok? (format 'Continent / Country [/ Region]')"):
+                break
             # If we removed accents, inform curator and ask for approval
             if location != ori_location:
                 print("------LOCATION checking-----")
@@ -188,29 +865,35 @@ def check_location(line, locations):
                 answer = input("Please enter correct location, in "
                                "format 'Continent / Country [/ Region]'\n")
                 location = answer
+                location_typed = True
             elif not answer or answer.lower() in ["y", "yes"]:
                 location_ok = True
+                if decisions is not None:
+                    decisions.record("covv_location", ori_location, location)
 
     # If location was changed, inform curator.
     # If it was changed exactly as before, no need to write it
     if ori_location != location:
-        logger.info(f"'Location' column: changed '{ori_location}' to '{location}'.")
+        logger.info(f"'Location' column: changed '{ori_location}' to '{location}'.",
+                    extra=change("covv_location", ori_location, location))
 
-    line["covv_location"] = location
     locations[ori_location] = location
+    return location
 
 
-def checked_location_format(sep, location, locations):
+def checked_location_format(sep, location, locations, decisions=None):
     """
     Check if Location is in expected format: Continent / Country / Region
 
     location -> str
     locations -> dict {prev_loc: new_loc}
+    decisions -> DecisionStore. In non-interactive mode, location is kept as is (question
+                 is saved by check_location)
     """
     new_sep = sep
     # Check that location has at least continent, and at most 3 fields
     # If not, ask user for location field
-    while len(new_sep) < 2:
+    while len(new_sep) < 2 and not collecting(decisions):
         print("------LOCATION checking-----")
         print(f"Wrong format for location: {location}")
         answer = input("Please enter correct location, in "
@@ -220,14 +903,74 @@ def checked_location_format(sep, location, locations):
     return new_sep
 
 
-def check_vnames(line, vnames_list, countries, corresp_file):
+def check_vnames(md, rows, vnames, countries, decisions=None, registry=None, typed=None,
+                 matcher=None):
+    """
+    Check virus names, line by line (each name must be unique)
+
+    md: pandas.DataFrame
+    rows: pandas.Series of bool, lines to check
+    vnames : set of virus names already seen
+    countries: {'vname country / location country': new_country_in_vname}
+    decisions: DecisionStore, answers already given by curators
+    registry: VirusNameRegistry, virus names already released
+    typed: {line: [names]} virus names typed by the curator for each line (see check_vname),
+           updated with names typed now
+    matcher: gazetteer.CountryMatcher, to compare countries of virus names with locations
+    """
+    given_vnames = md.loc[rows, "covv_virus_name"].to_numpy(dtype=object)
+    # Given location, to compare with 2nd field of virus name
+    locations = md.loc[rows, "covv_location"].to_numpy(dtype=object)
+    # Compare all countries of virus names with locations at once
+    if matcher is None:
+        matcher = CountryMatcher(load_gazetteer())
+    fields = pd.Series(given_vnames, dtype=object).str.split("/")
+    named = (fields.str.len() == 4).to_numpy()
+    matcher.add_all(fields[named].str[1], locations[named])
+    # Look for all names of the bulk in the registry at once
+    if registry is not None:
+        registry.released(given_vnames)
+    new_vnames = []
+    for row, vname, location in zip(md.index[rows], given_vnames, locations):
+        answers = None
+        if typed is not None:
+            answers = typed.setdefault(int(row), [])
+        new_vnames.append(check_vname(vname, location, vnames, countries, decisions, registry,
+                                      answers, matcher))
+        if typed is not None and not answers:
+            del typed[int(row)]
+        if collecting(decisions):
+            decisions.questions.add_rows(1)
+    md.loc[rows, "covv_virus_name"] = np.array(new_vnames, dtype=object)
+
+
+def check_vname(vname, location, vnames, countries, decisions=None, registry=None,
+                answers=None, matcher=None):
     """
-    line = pandas.core.series.Series
-    vnames_list : dict
+    vname: str, given virus name
+    location: str, location of this sequence
+    vnames : set of virus names already seen
+    countries: {'vname country / location country': new_country_in_vname}
+    decisions: DecisionStore, answers already given by curators
+    registry: VirusNameRegistry, virus names already released
+    answers: list of names typed by the curator for this line in a previous session: they
+             are replayed instead of asking again. Names typed now are added to it.
+    matcher: gazetteer.CountryMatcher, to compare country of virus name with location
+
+    return str: checked virus name
     """
-    # Get given virus name, and given location (to compare with 2nd field of virus name)
-    vname = line["covv_virus_name"]
-    location = line["covv_location"]
+    def exists(name):
+        return name in vnames or (registry is not None and name in registry)
+
+    replay = list(answers or [])
+
+    def ask(prompt):
+        if replay:
+            return replay.pop(0)
+        answer = input(prompt)
+        if answers is not None and answer != "STOP":
+            answers.append(answer)
+        return answer
 
     fields = vname.strip().split("/")
     fields = [f.strip() for f in fields]
@@ -235,14 +978,26 @@ def check_vnames(line, vnames_list, countries, corresp_file):
     # If vname already exists : problem
     uniq = False
     orig_vname = vname   # same original virus name given
+    known = known_answer(decisions, "covv_virus_name", orig_vname)
     while not uniq:
-        if vname not in vnames_list:
+        if not exists(vname):
             uniq = True
+        # Already renamed by curator (answers file)
+        elif known and not exists(known):
+            fields = [f.strip() for f in known.strip().split("/")]
+            vname = "/".join(fields)
+        elif ask_later(decisions, "covv_virus_name", orig_vname, "", orig_vname,
+                       f"{vname} already exists! Virus names must be unique. "
+                       "Please give correct virus name."):
+            return vname
         else:
             print("------VIRUS NAME checking-----")
-            print(f"ERROR: {vname} already exists! Virus names must be unique.")
-            answer = input("Please give correct virus name or type 'STOP' "
-                           "to stop program and go back yourself to the xls file.\n")
+            if vname in vnames:
+                print(f"ERROR: {vname} already exists! Virus names must be unique.")
+            else:
+                print(f"ERROR: {vname} was already released! Virus names must be unique.")
+            answer = ask("Please give correct virus name or type 'STOP' "
+                         "to stop program and go back yourself to the xls file.\n")
             if answer == "STOP":
                 sys.exit(1)
             # Update fields with new answer
@@ -255,12 +1010,19 @@ def check_vnames(line, vnames_list, countries, corresp_file):
     while not fields_ok:
         if len(fields) == 4:
             fields_ok = True
+        elif known and len(known.split("/")) == 4:
+            vname = known
+            fields = [f.strip() for f in known.strip().split("/")]
+        elif ask_later(decisions, "covv_virus_name", orig_vname, "", orig_vname,
+                       f"'{vname}' is not a valid virus name. It should follow this format: "
+                       "hCoV-19/Country/Identifier/2020. Please give correct virus name."):
+            return vname
         else:
             print("------VIRUS NAME checking-----")
             print(f"'{vname}' is not a valid virus name. It should follow this format: "
                   "hCoV-19/Country/Identifier/2020.")
-            answer = input("Please give correct virus name, or type 'STOP' "
-                           "to stop program and go back yourself to the xls file.\n")
+            answer = ask("Please give correct virus name, or type 'STOP' "
+                         "to stop program and go back yourself to the xls file.\n")
             if answer == "STOP":
                 sys.exit(1)
             fields = answer.strip().split("/")
@@ -269,43 +1031,68 @@ def check_vnames(line, vnames_list, countries, corresp_file):
 
     # We are now sure that virus name is uniq, and there are 4 fields
     # Fields required for a virus name
-    final_vname = checked_vname_format(vname, location, countries)
-    if final_vname not in vnames_list:
-        vnames_list.append(final_vname)
+    final_vname = checked_vname_format(vname, location, countries, orig_vname, decisions,
+                                       matcher)
+    vnames.add(final_vname)
     # Log if we changed something
     if orig_vname != final_vname:
-        with open(corresp_file, "a") as cf:
-            cf.write("\t".join([orig_vname, final_vname]) + "\n")
         logger.warning(f"Changed sequence name '{orig_vname}' to '{final_vname}'. "
-                        "Sequence can be released.")
-
-    line["covv_virus_name"] = final_vname
+                       "Sequence can be released.",
+                       extra=change("covv_virus_name", orig_vname, final_vname, orig_vname))
+    return final_vname
 
 
-def checked_vname_format(vname, location, countries):
+def checked_vname_format(vname, location, countries, seq=None, decisions=None,
+                         matcher=None):
     """
     Check if vname is in expected format: hCoV-19/Country/Identifier/2020
 
     vname -> str
     vnames -> list of virus names
     location : str
-    countries: {ori_country_in_vname: new_country_in_vname}
+    countries: {'vname country / location country': new_country_in_vname}
+    seq: str, original virus name (for non-interactive mode)
+    decisions: DecisionStore, answers already given by curators
+    matcher: gazetteer.CountryMatcher. Country of the virus name corresponds to location if
+             it is one of its places, or another name (or ISO code) of its country.
     """
     name = "hCoV-19"
     country = ""
     v_id = ""
     date = "2020"
     fields = vname.split("/")
+    if matcher is None:
+        matcher = CountryMatcher(load_gazetteer())
 
     # Check country is in location. Otherwise, get country
-    if fields[1].upper() not in location.upper():
-        # Country not in location, but already seen before -> replace as it 
+    if not matcher(fields[1], location):
+        loc_fields = location.split("/")
+        loc_country = loc_fields[1].strip() if len(loc_fields) >= 2 else ""
+        # Answers depend on both countries: 'France' must not be replaced the same way in
+        # names of sequences from Brazil and from Switzerland
+        key = f"{fields[1]} / {loc_country}"
+        # Country not in location, but this pair was already seen before -> replace as it
         # has been replaced before
-        if fields[1].lower() in countries:
-            country = countries[fields[1]]
+        if key in countries:
+            country = countries[key]
+        # Country not in location, and already checked by a curator (previous run,
+        # or answers file). 'n' answer: keep country given in virus name
+        elif decisions is not None and decisions.get("vname_country", key):
+            country, accepted = decisions.get("vname_country", key)
+            if not accepted:
+                country = fields[1]
+            countries[key] = country
+        # Location not in expected format (non-interactive mode): nothing to compare with
+        elif not loc_country:
+            country = fields[1]
         # Country not in location and never seen before: try to fix it
+        elif ask_later(decisions, "vname_country", key, loc_country,
+                       seq, f"Country '{fields[1]}' of virus name does not correspond to "
+                       f"location '{location}'. Is it ok to replace it by the proposed one (y), "
+                       f"or do you want to keep {fields[1]} (n)?"):
+            country = fields[1]
         else:
-            country = location.split("/")[1].strip()
+            country = loc_country
             print("------VIRUS NAME checking-----")
             print(f"'{vname}' is not a valid virus name. It should follow this format: "
                    "hCoV-19/Country/Identifier/2020. Here, 'Country' field does not correspond "
@@ -315,9 +1102,9 @@ def checked_vname_format(vname, location, countries):
             # no: keep fields[1], do not change country. Save this for next time
             if answer.lower() in ["n", "no"]:
                 country = fields[1]
-                countries[country] = country
-            else:
-                countries[fields[1]] = country
+            countries[key] = country
+            if decisions is not None:
+                decisions.record("vname_country", key, country)
     # If country field corresponds to location column, keep it as is
     else:
         country = fields[1]
@@ -330,130 +1117,156 @@ def checked_vname_format(vname, location, countries):
     return final_vname
 
 
-def check_column(line, column, column_list, capital=False):
+def check_column(column_text, seq, column, column_list, decisions=None):
     """
-    First letter must be uppercase, others lowercase.
-    if details/history, ask curator to confirm. Sometimes, it is written like 'clinical sample'.
-    Should be replaced by 'Original (clinical sample)'
+    Check a text with the rule of its column (see rules.RULES): empty or unknown texts are
+    replaced by 'unknown', others are written as the rule says (first letter uppercase,
+    others lowercase, without accents).
+    If the rule asks for a confirmation (details/history), ask curator to confirm. Sometimes,
+    it is written like 'clinical sample'. Should be replaced by 'Original (clinical sample)'
 
-    line = pandas.core.series.Series
+    column_text : str, text to check
+    seq : str, first sequence with this text
     column : str, header of column to check
     column_list : dict {ori_text:new_text}
+    decisions : DecisionStore, answers already given by curators
 
     Works for 
     - passage details/history
     - host
-    """
-    text_ok = False
-    column_text = line[column]
-    seq = line["covv_virus_name"]
 
-    final_column_text = column_text
+    return str: checked text
+    """
+    # If we already saw this field, and it was valid, just skip checking this time
+    if column_text.lower() in column_list:
+        return column_list[column_text.lower()]
+    rule = RULES[column]
+    final_column_text, status = rule.fix(column_text)
+    text_ok = rule.final(status)
+    question = f"Is '{column_text}' ok for column {column}? ({rule.message})"
     while not text_ok:
-        # If we already saw this field, and it was valid, just skip checking this time
-        if column_text.lower() in column_list:
-            final_column_text = column_list[column_text.lower()]
-            text_ok = True
-        # If empty or UNKNOWN: put 'unknown'
-        elif not column_text or column_text.lower() == "unknown":
-            final_column_text = "unknown"
-            column_list[column_text] = "unknown"
-            text_ok = True
+        # The curator confirms the text (answer ok is True), or gives a new one.
+        # Otherwise, False -> recheck
+        answer_ok = True  # Did the curator answer yes, or a new text
+        asked = False
+        known = known_answer(decisions, column, column_text.lower())
+        # Already answered by a curator in a previous run
+        if known:
+            final_column_text = known
+        elif ask_later(decisions, column, column_text.lower(), rule.format(column_text), seq,
+                       question):
+            final_column_text = column_text
         else:
-            # If column is covv_passage, we will ask user to confirm. If he confirms,
-            # answer ok will be True. Otherwise, False -> recheck
-            # Ask to check if cov_passage:
-            answer_ok = True  # Did the curator answer yes, or a new text
-            if column == "covv_passage":
-                print("------PASSAGE DETAILS/HISTORY checking-----")
-                answer = input(f"Is '{column_text}' ok for 'Passage details/history'? "
-                                "It should start with Original or Vero. Y/new_text:\n" )
-                # If user answered yes, we keep what we already have
-                if not answer or answer.lower() in ["y", "yes", ""]:
-                    final_column_text = column_text
-                # If answer is a new string (not 'no'), this is the new text
-                # User should not answer 'no', but let's check
-                elif answer and answer.lower() not in ["no", "n"]:
-                    final_column_text = answer
-                else:
-                    answer_ok = False
-                # If he answered no, will be asked again
-            # If user confirmed or gave new text, format text and release
-            if answer_ok:
-                # Put first letter in upper case if asked
-                if capital:
-                    final_column_text = final_column_text.capitalize()
-                # Remove accents
-                final_column_text = unidecode.unidecode(final_column_text)
-                text_ok = True
-
-    if not final_column_text in column_list:
-        column_list[column_text.lower()] = final_column_text
-    if final_column_text != column_text:
-        logger.info(f"For {seq}, '{column}' column: changed '{column_text}' to '{final_column_text}'.")
-        # Update information
-        line[column] = final_column_text
-
-
-def check_mandatory_field(line, column, column_list, alert=False, user_check=False):
+            asked = True
+            print(f"------{column.upper()} checking-----")
+            answer = input(f"{question} Y/new_text:\n")
+            # If user answered yes, we keep what we already have
+            if not answer or answer.lower() in ["y", "yes", ""]:
+                final_column_text = column_text
+            # If answer is a new string (not 'no'), this is the new text
+            # User should not answer 'no', but let's check
+            elif answer and answer.lower() not in ["no", "n"]:
+                final_column_text = answer
+            else:
+                answer_ok = False
+            # If he answered no, will be asked again
+        # If user confirmed or gave new text, format text (see rules.Rule.format)
+        if answer_ok:
+            final_column_text = rule.format(final_column_text)
+            text_ok = True
+            if asked and decisions is not None:
+                decisions.record(column, column_text.lower(), final_column_text)
+
+    column_list[column_text.lower()] = final_column_text
+    return final_column_text
+
+
+def check_mandatory_field(text, seq, column, column_list, decisions=None):
     """
     For a mandatory field, check that there is something in it. If not, ask submitter 
     to fill it.
 
-    Works for:
-    - originating lab (alert=True, user_check=False)
-    - address originating lab (alert=True, user_check=False)
-    - submitting lab (alert=True, user_check=False)
-    - address submitting lab (alert=True, user_check=False)
-    - assembly (alert=False, user_check=True)
-    - seq techno (alert=False, user_check=True)
-    - authors (alert=True, user_check=True)
+    Works for (see rules.RULES):
+    - originating lab (severity ERROR)
+    - address originating lab (severity ERROR)
+    - submitting lab (severity ERROR)
+    - address submitting lab (severity ERROR)
+    - assembly (severity WARNING, confirm)
+    - seq techno (severity WARNING, confirm)
+    - authors (severity ERROR, confirm)
 
-    line: whole line
+    text: text to check
+    seq: first sequence with this text
     column: header of column
     column_list: {text: new_text} for each 'text' already seen and checked
-    alert: true: if info empty or unknwon, or curator says that it is not ok:
-                 curator must contact submitter AND NO release. 
-                 ex: orig_lab, orig_lab_address, sub_lab, sub_lab_address
-           false: if info empty or unknown, or curator says that it is not ok:
-                  contact submitter but can release
-    user_check: true: if not empty or unknown, ask user if this text is ok or not. 
-                      User can answer 's' to skip this column starting from this sequence.
-                false: if not empty or unknown, just keep text, do not ask user. (so, no possibility to skip)
+    decisions: DecisionStore, answers already given by curators
 
-    return bool: if column will be skipped after or not
+    The rule of the column says:
+    severity: ERROR: if info empty or unknwon, or curator says that it is not ok:
+                     curator must contact submitter AND NO release. 
+                     ex: orig_lab, orig_lab_address, sub_lab, sub_lab_address
+              WARNING: if info empty or unknown, or curator says that it is not ok:
+                       contact submitter but can release
+    confirm: true: if not empty or unknown, ask user if this text is ok or not. 
+                   User can answer 's' to skip this column starting from this sequence.
+             false: if not empty or unknown, just keep text, do not ask user. (so, no possibility to skip)
 
-    """
-    text = line[column]
-    seq = line["covv_virus_name"]
+    return str or None: checked text, or None if column will be skipped starting from 
+    this sequence
 
+    """
+    rule = RULES[column]
+    alert = rule.severity == "ERROR"
+    user_check = rule.confirm
     new_text = text
 
     # Checkpoint 1:
     # already seen and checked
     if text in column_list:
-        new_text = column_list[text]
-        line[column] = new_text
-        return False
+        # None: curator skipped this column at this text, in a previous session (resumed)
+        if column_list[text] is None:
+            logger.error(f"TO CURATOR: You skipped {column} starting from sequence {seq}. "
+                         "Please check it yourself.", extra=change(column, seq=seq))
+        return column_list[text]
 
     # Checkpoint 2:
     # If new text is empty, or filled with unknown, and it is the first time we are 
     # in this case (did not end with first check point), write warning, or error according to 
-    # 'alert' flag
-    if not new_text or new_text.lower() == "unknown":
+    # the severity of the rule
+    if rule.fix(new_text)[1] == "unknown":
         if alert:
             logger.error(f"For {seq}, '{column}' is unknown. "
-                          "Ask submitter to give this information. NO RELEASE")
+                         "Ask submitter to give this information. NO RELEASE",
+                         extra=change(column, text, "unknown", seq))
             new_text = "unknown"
         else:
             logger.warning(f"{seq} has no {column} text. Filled to unknown. "
-                           "Inform submitter he could give this information. Can be released.")
+                           "Inform submitter he could give this information. Can be released.",
+                           extra=change(column, text, "unknown", seq))
             new_text = "unknown"
 
     # Checkpoint 3:
     # If there is something (not unknown), ask user_check = True
     # Ask user if this text is ok or not 
-    if new_text != "unknown" and user_check:
+    known = None
+    if new_text != "unknown" and user_check and decisions is not None:
+        known = decisions.get(column, text)
+    # Already answered by a curator in a previous run: 'no' answers must be reported again
+    if known:
+        new_text, accepted = known
+        if not accepted:
+            if alert:
+                logger.error(f"Sequence {seq}: Wrong text for {column} column. Ask submitter more details. "
+                             "NO release", extra=change(column, text, new_text, seq))
+            else:
+                logger.warning(f"Sequence {seq}: Wrong text for {column} column. Ask submitter. Can be released.",
+                               extra=change(column, text, new_text, seq))
+    elif new_text != "unknown" and user_check and ask_later(
+            decisions, column, text, to_ascii(new_text), seq,
+            f"Is '{new_text}' fine for column {column}? 'y', 'n' (not correct: keep it, and "
+            "inform submitter) or new value."):
+        pass
+    elif new_text != "unknown" and user_check:
         print(f"\n------{column.upper()} checking-----")
         answer = input(f"For seq '{seq}', is '{new_text}' fine for column {column}? \nAnswers:\n"
                         "\t* 'Y' (default) to accept this text. Following lines with the "
@@ -468,182 +1281,162 @@ def check_mandatory_field(line, column, column_list, alert=False, user_check=Fal
         # user asks to ignore this column starting from this line
         if answer.lower() in ['s', 'skip']:
             logger.error(f"TO CURATOR: You skipped {column} starting from sequence {seq}. Please check it "
-                         "yourself.")
-            return True
+                         "yourself.", extra=change(column, seq=seq))
+            return None
         # if user said no, write warning or alert, and keep same text
         elif answer.lower() in ['no', 'n']:
+            if decisions is not None:
+                decisions.record(column, text, new_text, accepted=False)
             if alert:
                 logger.error(f"Sequence {seq}: Wrong text for {column} column. Ask submitter more details. "
-                                "NO release")
+                             "NO release", extra=change(column, text, new_text, seq))
             else:
-                logger.warning(f"Sequence {seq}: Wrong text for {column} column. Ask submitter. Can be released." )
+                logger.warning(f"Sequence {seq}: Wrong text for {column} column. Ask submitter. Can be released.",
+                               extra=change(column, text, new_text, seq))
         # User entered a value:
         # if not yes and not no (and not skip), new_text = new_value
         elif answer.lower() not in ['y', 'yes', '', 'n', 'no']:
             new_text = answer
         # if user said yes -> keep new_text (as for 'no', but without any warning)
+        if answer.lower() not in ['no', 'n'] and decisions is not None:
+            decisions.record(column, text, to_ascii(new_text))
 
-    # Remove accents
-    new_text = unidecode.unidecode(new_text)
+    # Remove accents (see rules.Rule.format)
+    new_text = rule.format(new_text)
     if text != new_text:
-        logger.info(f"For sequence {seq}, '{column}' column: changed '{text}' to '{new_text}'.")
-        # Update information
+        logger.info(f"For sequence {seq}, '{column}' column: changed '{text}' to '{new_text}'.",
+                    extra=change(column, text, new_text, seq))
     column_list[text] = new_text
-    line[column] = new_text
-    return False
+    return new_text
 
 
-def check_date(line, dates_list):
+def check_date(ori_date, seq, dates_list, decisions=None):
     """
-    line = pandas.core.series.Series
+    ori_date: str, collection date to check
+    seq: str, first sequence with this date
+    decisions: DecisionStore, answers already given by curators
+
+    Valid dates are normalized all at once (see curate_date_column) before calling this,
+    so only invalid dates are checked here.
+
+    return str: checked date
     """
     # Save original field to write changes if there are
-    ori_date = line["covv_collection_date"].strip() 
-    new_date = ori_date
-    # Try to convert date to string, if it was in date format in excel
-    try:
-        # if complete date: written as 2020-03-01 00:00:00
-        # if YYYY-MM -> written as is, so no need to change
-        if "00:00:00" in new_date:
-            new_date = str(pd.to_datetime(ori_date, yearfirst=True).strftime("%Y-%m-%d"))
-    # If not able to convert, date is already a string, so stay as it is, and it will be checked as a string
-    except:
-        pass
-    new_date = unidecode.unidecode(new_date)
-    seq = line["covv_virus_name"]
+    ori_date = ori_date.strip()
     # If we already saw and checked this, reuse what has been done
-    if new_date in dates_list:
-        line["covv_collection_date"] = dates_list[new_date]
-    # If no date given, put unknown (empty field is 'NA filled up')
-    if not new_date or new_date.lower() == "unknown":
-        line["covv_collection_date"] = "unknown"
-        dates_list[new_date] = "unknown"
-        return
-
-    # Date given and never seen before: check format
-    correct_format = False
-    numbers = new_date
-    date = new_date
-    while not correct_format:
-        try:
-            # get year, month, day
-            numbers = numbers.split("-")
-            # Try to convert each field to int. If it does not work -> error in date format
-            numbers_int = [int(n.strip()) for n in numbers]
-            if len(numbers) == 0 or len(numbers) > 3:
-                raise ValueError
-            if len(str(numbers[0])) != 4:
-                raise ValueError("Year not in YYYY format")
-            if len(numbers) > 1 and len(str(numbers[1])) != 2:
-                raise ValueError("Month not in MM format")
-            if len(numbers)> 2 and len(str(numbers[2])) != 2:
-                raise ValueError("Day not in DD format")
-            correct_format = True
-        except ValueError as e:
-            print("------COLLECTION DATE checking-----")
-            numbers = input(f"For sequence {seq}, wrong format for collection date: {date}. \n"
-                            "Please enter correct collection date in YYYY or "
-                            "YYYY-MM or YYYY-MM-DD format:\n")
-            new_date = numbers
-    str_numbers = [str(n) for n in numbers]
-    date_ok = "-".join(str_numbers)
+    if ori_date in dates_list:
+        return dates_list[ori_date]
+    date = to_ascii(ori_date)
+    date_ok, reason = normalize_date(date)
+    # Wrong date already corrected by a curator in a previous run
+    known = known_answer(decisions, "covv_collection_date", ori_date)
+    if date_ok is None and known:
+        date_ok, reason = normalize_date(known)
+    asked = False
+    while date_ok is None:
+        # No proposal: the date is invalid, the curator must give the right one
+        if ask_later(decisions, "covv_collection_date", ori_date, "", seq,
+                     f"Wrong collection date ({reason}): {date}. Please give correct "
+                     "collection date in YYYY or YYYY-MM or YYYY-MM-DD format."):
+            date_ok = date
+            break
+        print("------COLLECTION DATE checking-----")
+        date = input(f"For sequence {seq}, wrong collection date ({reason}): {date}. \n"
+                     "Please enter correct collection date in YYYY or "
+                     "YYYY-MM or YYYY-MM-DD format:\n").strip()
+        date_ok, reason = normalize_date(date)
+        asked = True
     dates_list[ori_date] = date_ok
-    line["covv_collection_date"] = date_ok
+    if asked and decisions is not None:
+        decisions.record("covv_collection_date", ori_date, date_ok)
     if date_ok != ori_date:
-        logger.info(f"'Collection date' column: changed '{ori_date}' to '{date_ok}'.")
+        logger.info(f"'Collection date' column: changed '{ori_date}' to '{date_ok}'.",
+                    extra=change("covv_collection_date", ori_date, date_ok))
+    return date_ok
 
 
-def check_gender(line, genders_list):
+def check_gender(ori_gender, seq, genders_list, decisions=None):
     """
-    check gender: must be Male, Female or unknown
+    check gender with its rule (see rules.RULES): must be Male, Female or unknown
+    decisions: DecisionStore, answers already given by curators
+
+    return str: checked gender
     """
     gender_checked = False
-    ori_gender = line['covv_gender']
-    seq = line["covv_virus_name"]
+    asked = False
     gender = ori_gender
     if gender in genders_list:
-        line['covv_gender'] = genders_list[gender]
-        return
+        return genders_list[gender]
+    rule = RULES["covv_gender"]
+    known = known_answer(decisions, "covv_gender", ori_gender)
     while not gender_checked:
-        if not gender or "unknown" in gender.lower() or "u" in gender.lower():
-            final_gender = "unknown"
-            gender_checked = True
-        elif gender == "Female" or gender == "Male":
-            final_gender = gender
-            gender_checked = True
-        elif gender.lower() in ["m", "male"]:
-            final_gender = "Male"
+        # Male, Female (m, f...) or unknown (empty, 'u'...): see rules.RULES
+        final_gender, status = rule.fix(gender)
+        if status != "wrong":
             gender_checked = True
-        elif gender.lower() in ["f", "female"]:
-            final_gender = "Female"
+        # Already answered by a curator in a previous run
+        elif known:
+            gender, known = known, None
+        elif ask_later(decisions, "covv_gender", ori_gender, "unknown", seq,
+                       f"Wrong format for gender: {gender}. Please give Male (m), "
+                       "Female (f) or unknown (u)."):
+            final_gender = ori_gender
             gender_checked = True
         else:
             print("------GENDER checking-----")
+            asked = True
             gender = input(f"For {seq}, wrong format for gender: {gender}. \n"
                             "Please enter Male (m), Female (f) or unkown (u)\n")
     if final_gender != ori_gender:
-        logger.info(f"For {seq}, 'Gender' column: changed '{ori_gender}' to '{final_gender}'.")
-    line['covv_gender'] = final_gender
+        logger.info(f"For {seq}, 'Gender' column: changed '{ori_gender}' to '{final_gender}'.",
+                    extra=change("covv_gender", ori_gender, final_gender, seq))
     genders_list[ori_gender] = final_gender
+    if asked and decisions is not None:
+        decisions.record("covv_gender", ori_gender, final_gender)
+    return final_gender
           
 
-def check_coverage(line, cov_list):
+def check_coverage(ori_cov, seq, cov_list, decisions=None):
     """
-    Check coverage format: 
+    Check coverage format (see coverage.parse_coverages):
     * ',' if > 1000
     * lower 'x' after the number
 
     If not given: unknown, contact submitter but release
-    """
-    cov_ok = False
-    ori_cov = line["covv_coverage"]  # keep original value
-    seq = line["covv_virus_name"]
-    cov = ori_cov
+    decisions: DecisionStore, answers already given by curators
 
+    return str: checked coverage
+    """
     if ori_cov in cov_list:
-        cov = cov_list[ori_cov]
-        cov_ok = True
-
-    while not cov_ok:
-        # If empty, fill with unknown and contact submitter
-        if not cov or cov.lower() == "unknown":
-            cov = "unknown"
-            cov_ok = True
-        # First, keep only coverage number (no 'x')
-        else:
-            cov = cov.lower().strip().split('x')[0]
-            # try to convert to int.
-            try:
-                if cov.replace(",", "").isdigit():
-                    int_cov = int(cov)
-                    cov = str(f"{int_cov:,}x")
-                    cov_ok = True
-                else:
-                    float_cov = float(cov)
-                    cov = str(f"{float_cov:,}x")
-                    cov_ok = True
-            except ValueError as e:
-                print("------COVERAGE checking-----")
-                cov = input(f"Given coverage ({cov}) for {seq} is not an int or a float. "
-                             "Please provide an int/float value for coverage. "
-                             "If coverage is unkown, type 'U' (default):\n")
-                if cov == "u":
-                    cov = "unknown"
-
-    # If there was something in coverage but it was changed, log it
-    # If it was empty, we just replaced by unknown. Already logged.
-    if ori_cov != cov and ori_cov:
-        logger.warning(f"For {seq} 'Coverage' column: changed '{ori_cov}' to "
-                       f"'{cov}'. Sequence can be released")
-    elif not ori_cov:
-        logger.warning(f"For {seq}, coverage not given. Filled with unknown "
-                        "(Sequence can be released)")
+        return cov_list[ori_cov]
+    asked = False
+    cov = parse_coverage(ori_cov)
+    # Coverage already corrected by a curator in a previous run: check his answer
+    known = known_answer(decisions, "covv_coverage", ori_cov)
+    if cov is None and known:
+        cov = parse_coverage(known)
+    given = ori_cov
+    while cov is None:
+        if ask_later(decisions, "covv_coverage", ori_cov, "unknown", seq,
+                     f"Given coverage ({given}) cannot be read. Please provide coverage "
+                     "(e.g. 4,000x), or 'unknown'."):
+            cov = ori_cov
+            break
+        print("------COVERAGE checking-----")
+        asked = True
+        given = input(f"Given coverage ({given}) for {seq} cannot be read. "
+                      "Please provide coverage (e.g. 4,000x). "
+                      "If coverage is unkown, type 'U' (default):\n").strip()
+        if given.lower() in ["", "u"]:
+            given = "unknown"
+        cov = parse_coverage(given)
+
     cov_list[ori_cov] = cov
-    line["covv_coverage"] = cov
+    if asked and decisions is not None:
+        decisions.record("covv_coverage", ori_cov, cov)
+    return cov
 
 
 if __name__ == '__main__':
-    parsed = utils.make_parser(sys.argv[1:])
-    metadata = parsed.xls_file
-    logger = utils.init_logger(metadata, "gisaid_curation")
-    cure_metadata(metadata)
+    # Same as bin/gisaid_curation
+    utils.main(sys.argv[1:])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Normalize collection dates, all at once.
+
+Accepted dates:
+- YYYY, YYYY-MM or YYYY-MM-DD (month and day can be given with 1 digit)
+- Excel dates, read as 'YYYY-MM-DD 00:00:00'
+- Excel serial numbers (number of days since 1899-12-30, e.g. 43891 for 2020-03-01)
+- empty or 'unknown': unknown date
+
+Dates are put in YYYY, YYYY-MM or YYYY-MM-DD format. Dates which do not exist (month 13,
+April 31...), or which are in the future, are invalid.
+
+normalize_dates checks many dates at once (with pandas), normalize_date checks a single
+date (in pure python, without pandas).
+"""
+
+import re
+import calendar
+import datetime
+
+
+DATE = (r"^(?:(?P<year>\d{4})(?:-(?P<month>\d{1,2})(?:-(?P<day>\d{1,2})(?: 00:00:00)?)?)?"
+        r"|(?P<serial>\d{5})(?:\.0+)?)$")
+# Excel serial numbers are days since this date
+EXCEL_ORIGIN = "1899-12-30"
+# No sample was collected before this year
+MIN_YEAR = 1900
+
+
+def normalize_dates(values, today=None):
+    """
+    Normalize and check all given dates at once.
+
+    Parameters
+    ----------
+    values: iterable of str
+        collection dates, as given by the submitter
+    today: datetime.date
+        dates after this one are invalid (default: today)
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        normalized dates ('unknown' if no date given, None if invalid), and the reason why
+        each date is invalid (None if valid)
+    """
+    import numpy as np
+    import pandas as pd
+
+    today = today or datetime.date.today()
+    texts = pd.Series(list(values), dtype=object).fillna("").astype(str).str.strip()
+    if texts.empty:
+        return np.array([], dtype=object), np.array([], dtype=object)
+    parts = texts.str.extract(DATE).apply(pd.to_numeric)
+    # Excel serial numbers: convert to year, month, day
+    serial = pd.to_datetime(parts["serial"], unit="D", origin=EXCEL_ORIGIN, errors="coerce")
+    from_serial = serial.notna()
+    year = parts["year"].mask(from_serial, serial.dt.year)
+    month = parts["month"].mask(from_serial, serial.dt.month)
+    day = parts["day"].mask(from_serial, serial.dt.day)
+
+    unknown = (texts == "") | (texts.str.lower() == "unknown")
+    matched = year.notna()
+    month_ok = month.isna() | month.between(1, 12)
+    # Number of days in each month (of its year)
+    with_month = matched & month.notna() & month_ok & (year >= MIN_YEAR)
+    firsts = pd.to_datetime(pd.DataFrame({"year": year.where(with_month, 2000),
+                                          "month": month.where(with_month, 1), "day": 1}))
+    day_ok = day.isna() | ((day >= 1) & (day <= firsts.dt.days_in_month))
+    possible = matched & month_ok & day_ok & (year >= MIN_YEAR)
+    # Compare with today, with the precision of the given date
+    future = ((year > today.year)
+              | ((year == today.year) & (month > today.month))
+              | ((year == today.year) & (month == today.month) & (day > today.day)))
+
+    reasons = np.select([unknown, ~matched, ~possible, future],
+                        [None, "wrong format", "impossible date", "date in the future"],
+                        None).astype(object)
+    dates = (year.fillna(0).astype(int).astype(str).str.zfill(4)
+             + ("-" + month.fillna(0).astype(int).astype(str).str.zfill(2)).where(month.notna(), "")
+             + ("-" + day.fillna(0).astype(int).astype(str).str.zfill(2)).where(day.notna(), ""))
+    dates = dates.to_numpy(dtype=object)
+    dates[~pd.isna(reasons)] = None
+    dates[unknown.to_numpy()] = "unknown"
+    return dates, reasons
+
+
+def normalize_date(value, today=None):
+    """
+    Normalize and check a single date (same rules as normalize_dates)
+
+    Returns
+    -------
+    (str, str)
+        normalized date (None if invalid), reason why it is invalid (None if valid)
+    """
+    today = today or datetime.date.today()
+    text = "" if value is None or value != value else str(value).strip()
+    if text == "" or text.lower() == "unknown":
+        return "unknown", None
+    match = re.match(DATE, text)
+    if not match:
+        return None, "wrong format"
+    if match["serial"]:
+        date = (datetime.date.fromisoformat(EXCEL_ORIGIN)
+                + datetime.timedelta(days=int(match["serial"])))
+        year, month, day = date.year, date.month, date.day
+    else:
+        year, month, day = [int(part) if part else None
+                            for part in match.group("year", "month", "day")]
+    if (year < MIN_YEAR or (month is not None and not 1 <= month <= 12)
+            or (day is not None and not 1 <= day <= calendar.monthrange(year, month)[1])):
+        return None, "impossible date"
+    if ((year, month or 0, day or 0)
+            > (today.year, today.month if month else 0, today.day if day else 0)):
+        return None, "date in the future"
+    date = f"{year:04d}"
+    if month is not None:
+        date += f"-{month:02d}"
+    if day is not None:
+        date += f"-{day:02d}"
+    return date, None
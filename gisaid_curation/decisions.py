@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Persistent store of curator decisions, shared across runs and curators.
+
+Each answer given by a curator to a question ("Is location 'Europe / France / Paris' ok?",
+"is 'Illumina MiSeq' fine for covv_seq_technology?" etc.) is saved in a SQLite file, with
+the time and the name of the curator. When the same value is found again, in this run or
+in a next one, the saved answer is replayed instead of asking the question again.
+"""
+
+import time
+import sqlite3
+import getpass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    field TEXT NOT NULL,
+    original TEXT NOT NULL,
+    value TEXT NOT NULL,
+    accepted INTEGER NOT NULL DEFAULT 1,
+    curator TEXT,
+    time REAL NOT NULL,
+    PRIMARY KEY (field, original)
+);
+CREATE INDEX IF NOT EXISTS decisions_time ON decisions (time);
+"""
+
+
+class DecisionStore:
+    """
+    Decisions of curators, saved in a SQLite file.
+
+    All decisions are loaded in memory when opening the store, so that looking for an
+    answer does not need any request to the database. Each new decision is written
+    directly to the file, so that nothing is lost if the program is stopped.
+
+    Parameters
+    ----------
+    path: str
+        SQLite file containing decisions (created if it does not exist)
+    curator: str
+        name of the curator answering questions (default: login name)
+    """
+
+    def __init__(self, path, curator=None):
+        self.path = path
+        self.curator = curator or getpass.getuser()
+        self.con = sqlite3.connect(path)
+        self.con.executescript(SCHEMA)
+        # {(field, original): (value, accepted)}
+        self.answers = {}
+        # Questions.Questions in non-interactive mode: questions are saved instead of asked
+        self.questions = None
+        self.load()
+
+    def load(self):
+        """
+        (Re)load all saved decisions in memory
+        """
+        cur = self.con.execute("SELECT field, original, value, accepted FROM decisions")
+        self.answers = {(field, original): (value, bool(accepted))
+                        for field, original, value, accepted in cur}
+        if self.path != ":memory:":
+            print(f"Loaded {len(self.answers)} decisions from {self.path}.")
+
+    def get(self, field, original):
+        """
+        Get decision already taken for this original value of the given field
+
+        Returns
+        -------
+        (str, bool) or None
+            (value to put instead of original one, whether curator accepted this value),
+            or None if this value was never seen before
+        """
+        return self.answers.get((field, original))
+
+    def record(self, field, original, value, accepted=True):
+        """
+        Save a new curator answer.
+
+        Parameters
+        ----------
+        field: str
+            header of column
+        original: str
+            value found in submitted metadata
+        value: str
+            value given/accepted by the curator
+        accepted: bool
+            False if the curator said this value is not correct (submitter must be
+            contacted each time it is found)
+        """
+        self.answers[(field, original)] = (value, accepted)
+        with self.con:
+            self.con.execute("INSERT OR REPLACE INTO decisions "
+                             "(field, original, value, accepted, curator, time) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             (field, original, value, int(accepted), self.curator, time.time()))
+
+    def evict(self, max_age=None, fields=None):
+        """
+        Remove decisions older than max_age days, and/or all decisions for the given fields.
+
+        Parameters
+        ----------
+        max_age: float
+            remove decisions taken more than max_age days ago
+        fields: list of str
+            remove all decisions for these columns
+
+        Returns
+        -------
+        int
+            number of removed decisions
+        """
+        removed = 0
+        with self.con:
+            if max_age is not None:
+                limit = time.time() - max_age * 24 * 3600
+                removed += self.con.execute("DELETE FROM decisions WHERE time < ?",
+                                            (limit,)).rowcount
+            for field in fields or []:
+                removed += self.con.execute("DELETE FROM decisions WHERE field = ?",
+                                            (field,)).rowcount
+        if removed:
+            print(f"Removed {removed} decisions from {self.path}.")
+            self.load()
+        return removed
+
+    def close(self):
+        self.con.close()
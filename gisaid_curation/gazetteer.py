@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Gazetteer of known places (continents, countries, and regions of some countries), used to
+fix locations without asking the curator.
+
+It is read from a tsv file (by default data/gazetteer.tsv, bundled with the package), with
+columns 'continent', 'country', 'region' (empty for a country), 'aliases' (other names
+of the same place, separated by '|') and 'codes' (ISO codes of a country, separated by
+'|', optional). A country found in several continents (Russia, Turkey...) has one line per
+continent.
+
+Names are indexed in a prefix trie (exact and truncated names), and in BK-trees
+(names with a few typos). Only exact names (or aliases) are sure: truncated names and
+names with typos are fixed, but the fixed location is proposed to the curator. All names, aliases and codes of countries are also indexed
+without accents nor punctuation (country_index), to compare the country of a virus name
+with its location (see CountryMatcher).
+"""
+
+import os
+import functools
+
+from gisaid_curation.transliteration import to_ascii
+
+
+GAZETTEER = os.path.join(os.path.dirname(__file__), "data", "gazetteer.tsv")
+# Shortest truncated name which can be completed
+MIN_PREFIX = 4
+
+
+def name_key(name):
+    """
+    Key used to look for a name: case, spaces and hyphens do not matter
+    """
+    return " ".join(name.replace("-", " ").split()).casefold()
+
+
+def country_key(name):
+    """
+    Key used to look for a country in the country index: accents, case, spaces, hyphens,
+    dots and apostrophes do not matter ('U.S.' is 'US', 'Côte d’Ivoire' is 'Cote d'Ivoire')
+    """
+    folded = to_ascii(name).replace(".", "").replace("'", "")
+    return name_key(folded)
+
+
+def max_typos(key):
+    """
+    Maximum number of typos accepted for a name of this length
+    """
+    if len(key) < 4:
+        return 0
+    if len(key) < 8:
+        return 1
+    return 2
+
+
+def distance(word1, word2):
+    """
+    Edit distance between 2 words: number of insertions, deletions, substitutions and
+    transpositions of 2 adjacent characters ('Frnace' is 1 typo away from 'France')
+    """
+    before = None
+    previous = list(range(len(word2) + 1))
+    for i, char1 in enumerate(word1, 1):
+        current = [i]
+        for j, char2 in enumerate(word2, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char1 != char2)))
+            if i > 1 and j > 1 and char1 == word2[j - 2] and word1[i - 2] == char2:
+                current[j] = min(current[j], before[j - 2] + 1)
+        before, previous = previous, current
+    return previous[-1]
+
+
+class Trie:
+    """
+    Prefix tree of keys, each key giving a set of values
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key, value):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        # Values are stored under None, which is never a character
+        node.setdefault(None, set()).add(value)
+
+    def node(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def get(self, key):
+        """
+        Values of this exact key
+        """
+        node = self.node(key)
+        return node.get(None, set()) if node else set()
+
+    def complete(self, prefix):
+        """
+        Values of all keys starting with prefix
+        """
+        values = set()
+        stack = [self.node(prefix)] if self.node(prefix) else []
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    values |= child
+                else:
+                    stack.append(child)
+        return values
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree: find all keys at a given maximum edit distance of a word,
+    without computing the distance to all keys.
+    """
+
+    def __init__(self, keys=()):
+        # (key, {distance: child})
+        self.root = None
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        if self.root is None:
+            self.root = (key, {})
+            return
+        node = self.root
+        while True:
+            dist = distance(key, node[0])
+            if dist == 0:
+                return
+            if dist not in node[1]:
+                node[1][dist] = (key, {})
+                return
+            node = node[1][dist]
+
+    def search(self, word, max_dist):
+        """
+        All keys at most at max_dist of word
+
+        Returns
+        -------
+        list
+            [(distance, key)]
+        """
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            key, children = stack.pop()
+            dist = distance(word, key)
+            if dist <= max_dist:
+                found.append((dist, key))
+            # Triangle inequality: only children at distance [dist - max, dist + max] of
+            # this node can be close enough to word
+            stack.extend(child for child_dist, child in children.items()
+                         if dist - max_dist <= child_dist <= dist + max_dist)
+        return found
+
+
+class Names:
+    """
+    Index of names of a kind of place (continents, countries, regions of a country)
+    """
+
+    def __init__(self):
+        self.trie = Trie()
+        self.keys = {}  # {key: {names}}
+        self._bktree = None
+
+    def add(self, name, aliases=()):
+        for alias in [name, *aliases]:
+            key = name_key(alias)
+            self.trie.add(key, name)
+            self.keys.setdefault(key, set()).add(name)
+        self._bktree = None
+
+    @property
+    def bktree(self):
+        # Built at the first fuzzy search only
+        if self._bktree is None:
+            self._bktree = BKTree(self.keys)
+        return self._bktree
+
+    def find(self, text):
+        """
+        Find which place this text is: same name (except case), truncated name, or name
+        with a few typos.
+
+        Returns
+        -------
+        (str, bool)
+            (name of the place, True if same name), or (None, False) if not found, or
+            ambiguous
+        """
+        key = name_key(text)
+        if not key:
+            return None, False
+        names = self.trie.get(key)
+        if len(names) == 1:
+            return next(iter(names)), True
+        if names:
+            return None, False
+        if len(key) >= MIN_PREFIX:
+            names = self.trie.complete(key)
+            if len(names) == 1:
+                return next(iter(names)), False
+            if names:
+                return None, False
+        found = self.bktree.search(key, max_typos(key))
+        if not found:
+            return None, False
+        best = min(dist for dist, _ in found)
+        names = set().union(*(self.keys[key] for dist, key in found if dist == best))
+        if len(names) == 1:
+            return next(iter(names)), False
+        return None, False
+
+
+class Gazetteer:
+    """
+    Known continents, countries, and regions
+
+    Parameters
+    ----------
+    path: str
+        gazetteer tsv file (see module documentation)
+    """
+
+    def __init__(self, path=GAZETTEER):
+        self.path = path
+        self.continents = Names()
+        self.countries = Names()
+        # {country: [continents]}
+        self.country_continents = {}
+        # Other names and ISO codes of each country: {country: {names}}
+        self.country_names = {}
+        self._country_index = None
+        # {country: Names of its regions}
+        self.regions = {}
+        # Regions of all countries: {region: {countries}}
+        self.all_regions = Names()
+        self.region_countries = {}
+        with open(path) as gf:
+            next(gf)
+            for line in gf:
+                continent, country, region, aliases, codes = (line.rstrip("\n").split("\t")
+                                                              + ["", ""])[:5]
+                aliases = [alias for alias in aliases.split("|") if alias]
+                self.continents.add(continent)
+                if not region:
+                    self.countries.add(country, aliases)
+                    self.country_names.setdefault(country, set()).update(
+                        aliases + [code for code in codes.split("|") if code])
+                    continents = self.country_continents.setdefault(country, [])
+                    if continent not in continents:
+                        continents.append(continent)
+                    continue
+                self.regions.setdefault(country, Names()).add(region, aliases)
+                self.all_regions.add(region, aliases)
+                self.region_countries.setdefault(region, set()).add(country)
+
+    @property
+    def country_index(self):
+        """
+        Country of each name, alias and ISO code of countries: {country_key: country}.
+        Keys of several countries are left out.
+        """
+        # Built the first time it is used only
+        if self._country_index is None:
+            countries = {}
+            for country, names in self.country_names.items():
+                for name in [country, *names]:
+                    countries.setdefault(country_key(name), set()).add(country)
+            self._country_index = {key: next(iter(found)) for key, found in countries.items()
+                                   if len(found) == 1}
+        return self._country_index
+
+    def normalize(self, fields):
+        """
+        Fix a location with known places: missing continent, case, truncated names and
+        typos in continent, country and region. Truncated names and typos may be another
+        place: they are fixed, but the location is not sure.
+
+        Parameters
+        ----------
+        fields: list of str
+            location split by '/' (continent, country, region, others)
+
+        Returns
+        -------
+        (list of str, bool)
+            fixed fields, and whether the location is sure (continent, country and region
+            are all known with their name or an alias, and there is no ambiguity). If not
+            sure, the fixed location must be checked by the curator.
+        """
+        fields = list(fields)
+        if not fields:
+            return fields, False
+        continent, continent_exact = self.continents.find(fields[0])
+        rest = fields[1:] if continent else fields
+        if not rest:
+            return [continent], False
+        country, exact = self.countries.find(rest[0])
+        if country is None:
+            return self.complete_region(continent, rest), False
+        sure = exact and (continent is None or continent_exact)
+        continents = self.country_continents[country]
+        if continent not in continents:
+            # Continent missing: added only if there is no doubt. Continent given, but
+            # not the one of this country: the curator must check which one is wrong.
+            sure = sure and continent is None and len(continents) == 1
+            continent = continents[0]
+        regions = rest[1:]
+        if regions:
+            region, region_exact = None, False
+            if country in self.regions:
+                region, region_exact = self.regions[country].find(regions[0])
+            if region is not None:
+                regions[0] = region
+            sure = sure and region_exact
+        return [continent, country, *regions], sure
+
+    def complete_region(self, continent, fields):
+        """
+        Location without known country: if its first field is a region of only one
+        country, add this country (and its continent).
+        """
+        region, exact = self.all_regions.find(fields[0])
+        if region is None or not exact or len(self.region_countries[region]) > 1:
+            return ([continent] if continent else []) + fields
+        country = next(iter(self.region_countries[region]))
+        return [self.country_continents[country][0], country, region, *fields[1:]]
+
+
+class CountryMatcher:
+    """
+    Tell if the country given in a virus name corresponds to the location of the sequence:
+    it is one of the places of the location ('England' for 'Europe / United Kingdom /
+    England'), or another name or ISO code of the country of the location ('UK', 'GB',
+    'Great Britain' for 'United Kingdom'). A country which is only a part of the name of
+    the location country ('Niger' for 'Africa / Nigeria') does not correspond.
+
+    Results are kept for each (country, location) pair.
+
+    Parameters
+    ----------
+    gazetteer: Gazetteer
+        known countries, with their aliases and ISO codes
+    """
+
+    def __init__(self, gazetteer):
+        self.index = gazetteer.country_index
+        # {(country, location): bool}
+        self.known = {}
+
+    def __call__(self, country, location):
+        pair = (country.strip(), location)
+        if pair not in self.known:
+            keys = [country_key(field) for field in location.split("/")]
+            key = country_key(country)
+            self.known[pair] = key in keys or (
+                len(keys) >= 2 and self.index.get(key) is not None
+                and self.index.get(key) == self.index.get(keys[1]))
+        return self.known[pair]
+
+    def add_all(self, countries, locations):
+        """
+        Compare many pairs at once (e.g. all virus names of a bulk): distinct pairs are
+        compared with pandas, keys of each distinct name being computed only once.
+
+        countries, locations: iterables of str, country of each virus name, and location of
+        the same sequence
+        """
+        import pandas as pd
+
+        pairs = pd.DataFrame({"country": list(countries), "location": list(locations)},
+                             dtype=object).fillna("").astype(str)
+        pairs["country"] = pairs["country"].str.strip()
+        pairs = pairs.drop_duplicates(ignore_index=True)
+        if pairs.empty:
+            return
+        split = pairs["location"].str.split("/")
+        fields = split.explode()
+        keys = {text: country_key(text) for text in pd.unique(pd.concat([pairs["country"],
+                                                                           fields]))}
+        country_keys = pairs["country"].map(keys)
+        # Country is one of the places of the location
+        in_location = ((fields.map(keys) == country_keys.reindex(fields.index))
+                       .groupby(level=0).any())
+        # Country is another name of the country of the location (unknown: NaN, never equal)
+        found = country_keys.map(self.index)
+        same = found == split.str[1].map(keys).map(self.index)
+        self.known.update(zip(zip(pairs["country"], pairs["location"]),
+                              (in_location | same).to_numpy(dtype=bool).tolist()))
+
+
+@functools.lru_cache(maxsize=None)
+def load_gazetteer(path=GAZETTEER):
+    """
+    Read a gazetteer file (only once for each file)
+    """
+    return Gazetteer(path)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Journal of all changes done to a metadata file.
+
+Each log message is saved as a structured record (row, sequence, column, old value, new
+value, severity, reason). Records are sent to the journal through a queue, by a background
+thread, and kept in memory. They are written to disk in bulk, when enough of them are
+waiting, and when the logger is closed:
+- {file}.changes.log: all messages
+- {file}.contact_sub.log: warnings (inform submitter) and errors (do not release)
+- {file}.virus_IDs.txt: renamed sequences (original name, tab, new name)
+- {file}.changes.jsonl: all records, one json object per line
+"""
+
+import json
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Number of records kept in memory before writing them
+BUFFER_SIZE = 10000
+
+
+def change(column, old=None, new=None, seq=None, row=None):
+    """
+    Structured information about a log message, to give as 'extra' to a logger call:
+    logger.info(message, extra=change(column, old, new, seq))
+
+    Parameters
+    ----------
+    column: str
+        column concerned
+    old, new: str
+        original and new values (same if the value is kept but must be checked)
+    seq: str
+        sequence concerned (None if it concerns all sequences having this value)
+    row: int
+        line of the Submissions sheet (index of metadata)
+    """
+    if row is not None:
+        row = int(row)
+    return {"change": {"row": row, "sequence": seq, "column": column, "old": old, "new": new}}
+
+
+class Journal:
+    """
+    Records of all messages logged for a metadata file
+
+    Parameters
+    ----------
+    prefix: str
+        metadata file: journal files are {prefix}.changes.log etc.
+    buffer_size: int
+        number of records kept in memory before writing them
+    """
+
+    def __init__(self, prefix, buffer_size=BUFFER_SIZE):
+        self.prefix = prefix
+        self.buffer_size = buffer_size
+        self.records = []
+        # Empty journal files if already existing
+        for path in self.paths().values():
+            open(path, "w").close()
+
+    def paths(self):
+        return {"changes": f"{self.prefix}.changes.log",
+                "contact": f"{self.prefix}.contact_sub.log",
+                "vnames": f"{self.prefix}.virus_IDs.txt",
+                "jsonl": f"{self.prefix}.changes.jsonl"}
+
+    def add(self, severity, reason, row=None, sequence=None, column=None, old=None, new=None):
+        """
+        Save a record (written to disk when the buffer is full)
+        """
+        self.records.append({"row": row, "sequence": sequence, "column": column, "old": old,
+                             "new": new, "severity": severity, "reason": reason})
+        if len(self.records) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all records in memory to journal files
+        """
+        if not self.records:
+            return
+        paths = self.paths()
+        lines = [f"{rec['severity']} :: {rec['reason']}\n" for rec in self.records]
+        contact = [line for line, rec in zip(lines, self.records)
+                   if logging.getLevelName(rec["severity"]) >= logging.WARNING]
+        vnames = [f"{rec['old']}\t{rec['new']}\n" for rec in self.records
+                  if rec["column"] == "covv_virus_name" and rec["old"] != rec["new"]]
+        with open(paths["changes"], "a") as changes_file:
+            changes_file.writelines(lines)
+        with open(paths["contact"], "a") as contact_file:
+            contact_file.writelines(contact)
+        with open(paths["vnames"], "a") as vnames_file:
+            vnames_file.writelines(vnames)
+        with open(paths["jsonl"], "a") as jsonl_file:
+            jsonl_file.writelines(json.dumps(rec, default=str) + "\n" for rec in self.records)
+        self.records = []
+
+
+class JournalHandler(logging.Handler):
+    """
+    Log handler saving each message as a record of the journal
+    """
+
+    def __init__(self, journal):
+        super().__init__()
+        self.journal = journal
+
+    def emit(self, record):
+        self.journal.add(record.levelname, record.getMessage(),
+                         **getattr(record, "change", {}))
+
+
+class QueueJournalHandler(QueueHandler):
+    """
+    Log handler putting messages in a queue: they are added to the journal by a background
+    thread, so that logging does not slow down curation. When closed, all messages are
+    written to journal files.
+    """
+
+    def __init__(self, journal):
+        log_queue = queue.SimpleQueue()
+        super().__init__(log_queue)
+        self.journal = journal
+        self.listener = QueueListener(log_queue, JournalHandler(journal))
+        self.listener.start()
+
+    def close(self):
+        # Can be called twice: by utils.close_logger, and at exit
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.journal.flush()
+        super().close()
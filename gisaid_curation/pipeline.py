@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Work done in the background while the curator answers questions.
+
+Questions are asked by the main thread, column after column. While it waits for the
+curator:
+- a reader thread (Lookahead) reads the next chunks of the file, and normalizes their
+  distinct locations, dates and coverages (pure functions, which do not need the
+  curator): values which can be fixed without asking anything are then already known
+  when their column is curated
+- a writer thread (BackgroundWriter) writes chunks already curated to the curated file,
+  so that it is almost ready when the last question is answered
+
+Only these threads run in the background: everything using the answers of the curator
+(memos, decisions, logs) stays in the main thread, so questions are asked in the same
+order, and give the same curated file, as without them.
+
+Questions themselves (check_column, check_mandatory_field...) are not produced in
+advance: an answer changes the next ones (a location fixed by the curator gives the
+country expected in virus names, 's' skips the rest of a column, a new value is reused
+for the following lines), so they can only be found once the previous ones are answered.
+What is done in advance is everything which does not depend on answers.
+"""
+
+import queue
+import threading
+
+from gisaid_curation.coverage import parse_coverages
+from gisaid_curation.dates import normalize_dates
+from gisaid_curation.transliteration import is_ascii, to_ascii
+from gisaid_curation.workbook import categorize
+
+
+# Number of chunks read in advance, and of curated chunks waiting to be written
+DEPTH = 2
+# Columns normalized in advance
+PREPARED = ["covv_location", "covv_collection_date", "covv_coverage"]
+_END = object()
+
+
+def prepare(values, gazetteer=None):
+    """
+    Normalize distinct dates, coverages and locations of lines of metadata, without
+    asking anything. Columns are given one after the other: locations last, as they are
+    curated first (see Prepared.get), so dates and coverages are ready while the first
+    location questions are answered.
+
+    Parameters
+    ----------
+    values: pandas.DataFrame
+        columns PREPARED of the lines to curate (2nd header line excluded)
+    gazetteer: gazetteer.Gazetteer
+        known places (None: locations are not normalized)
+
+    Returns
+    -------
+    iterator of (str, dict)
+        column, and {original value: normalized value}:
+        - covv_location: (fields, sure), see gazetteer.Gazetteer.normalize
+        - covv_collection_date: (date, reason), see dates.normalize_dates
+        - covv_coverage: coverage, or None if it cannot be read
+    """
+    dates = values["covv_collection_date"].str.strip().unique()
+    yield "covv_collection_date", dict(zip(dates, zip(*normalize_dates(dates))))
+    covs = values["covv_coverage"].unique()
+    yield "covv_coverage", dict(zip(covs, parse_coverages(covs)))
+    if gazetteer is not None:
+        locations = values["covv_location"].drop_duplicates()
+        # Fields of ASCII locations are kept as they are: no need to check them one by one
+        yield "covv_location", {
+            location: gazetteer.normalize([field.strip() if plain else to_ascii(field.strip())
+                                           for field in location.strip().split("/")])
+            for location, plain in zip(locations, is_ascii(locations))}
+
+
+class Prepared:
+    """
+    Result of 'prepare' for a chunk, computed by the reader thread column by column.
+    Asking for a column waits until it is ready.
+    """
+
+    def __init__(self):
+        self.ready = threading.Condition()
+        self.values = {}
+        self.done = False
+        self.error = None
+
+    def set(self, column, values):
+        with self.ready:
+            self.values[column] = values
+            self.ready.notify_all()
+
+    def finish(self, error=None):
+        with self.ready:
+            self.done = True
+            self.error = error
+            self.ready.notify_all()
+
+    def get(self, column, wait=True):
+        """
+        Normalized values of this column: {original value: normalized value} (empty if
+        not prepared). If wait is False, do not wait: None if not ready yet.
+        """
+        with self.ready:
+            if not wait and column not in self.values and not self.done:
+                return None
+            self.ready.wait_for(lambda: column in self.values or self.done)
+            if column not in self.values and self.error is not None:
+                raise self.error
+            return self.values.get(column, {})
+
+
+class Lookahead:
+    """
+    Read chunks of metadata in a background thread, DEPTH chunks in advance, and prepare
+    them (see 'prepare').
+
+    Parameters
+    ----------
+    chunks: iterable of pandas.DataFrame
+        chunks of Submissions sheet, as read (see workbook.iter_workbook)
+    gazetteer: gazetteer.Gazetteer
+        known places, to normalize locations
+    depth: int
+        maximum number of chunks read in advance
+
+    Iterating gives (chunk, Prepared): chunks are given as soon as they are read, empty
+    cells filled with "" and low-cardinality columns stored as categoricals (see
+    workbook.categorize), and prepared while the main thread curates their first columns.
+    """
+
+    def __init__(self, chunks, gazetteer=None, depth=DEPTH):
+        self.chunks = chunks
+        self.gazetteer = gazetteer
+        self.queue = queue.Queue(depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read, name="lookahead", daemon=True)
+        self.thread.start()
+
+    def read(self):
+        try:
+            for md in self.chunks:
+                md = categorize(md.fillna(""))
+                prepared = Prepared()
+                # Copy of columns to prepare: the main thread may change md meanwhile
+                rows = ~md["fn"].str.contains("filename", regex=False)
+                values = md.loc[rows, PREPARED].copy()
+                if not self.put((md, prepared)):
+                    return
+                try:
+                    for column, normalized in prepare(values, self.gazetteer):
+                        prepared.set(column, normalized)
+                    prepared.finish()
+                except Exception as err:
+                    prepared.finish(err)
+            self.put(_END)
+        except BaseException as err:
+            self.put(err)
+
+    def put(self, item):
+        """
+        Give an item to the main thread, unless it stopped reading (False)
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop reading (e.g. curation stopped before the end)
+        """
+        self.stopped.set()
+
+
+class BackgroundWriter:
+    """
+    Write curated chunks with a workbook.StreamingWriter, in a background thread.
+
+    Chunks given to 'append' must not be changed afterwards. Errors while writing are
+    raised by the next call to 'append' or 'close'.
+    """
+
+    def __init__(self, writer, depth=DEPTH):
+        self.writer = writer
+        self.path = writer.path
+        self.queue = queue.Queue(depth)
+        self.error = None
+        self.thread = threading.Thread(target=self.write, name="writer", daemon=True)
+        self.thread.start()
+
+    def write(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if self.error is None:
+                try:
+                    self.writer.append(*item)
+                except BaseException as err:
+                    self.error = err
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def append(self, md, original=None):
+        self.check()
+        self.queue.put((md, original))
+
+    def finish(self):
+        """
+        Wait until all chunks are written
+        """
+        self.queue.put(_END)
+        self.thread.join()
+        self.check()
+
+    def close(self):
+        self.finish()
+        self.writer.close()
+
+    def discard(self):
+        self.queue.put(_END)
+        self.thread.join()
+        self.writer.discard()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Profile a curation run (--profile): where does the time go?
+
+- wall time of each phase: reading the file, curating, writing the curated file
+- wall time and number of calls of each check function, and the part of it spent waiting
+  for the curator (input)
+- hits and misses of memos (values already checked, see data_curation.CurationState)
+- number of distinct values of each column which needed transliteration, and hits and
+  misses of the transliteration cache (see transliteration)
+- total time spent waiting for the curator
+
+The summary is printed at the end of the run, and can be saved in json format. A cProfile
+dump (to read with pstats or snakeviz) can also be saved.
+"""
+
+import json
+import time
+import builtins
+import cProfile
+import contextlib
+
+from gisaid_curation import transliteration
+
+
+def make_profiler(parsed):
+    """
+    Profiler asked in command line arguments (--profile, --profile-json, --profile-stats),
+    None if no profiling
+    """
+    if not (parsed.profile or parsed.profile_json or parsed.profile_stats):
+        return None
+    return Profiler(cprofile=bool(parsed.profile_stats))
+
+
+class CountingDict(dict):
+    """
+    Memo counting lookups ('value in memo'): hit if the value was already checked
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        found = super().__contains__(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+
+class Profiler:
+    """
+    Timings of a curation run
+
+    Parameters
+    ----------
+    cprofile: bool
+        also run cProfile (slower), to save its stats with dump_stats
+    """
+
+    def __init__(self, cprofile=False):
+        self.phases = {}  # {phase: seconds}
+        self.checks = {}  # {function: {"calls", "seconds", "input_seconds"}}
+        self.memos = {}   # {memo name: CountingDict}
+        self.input_seconds = 0
+        self.questions = 0
+        self.start = time.perf_counter()
+        self.total = None
+        # Check functions running (a check can call another one)
+        self.running = []
+        self.cprofile = cProfile.Profile() if cprofile else None
+        transliteration.reset()
+        if self.cprofile:
+            self.cprofile.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Add time spent in this block to phase 'name'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def timed_iter(self, name, iterable):
+        """
+        Add time spent getting each item of iterable (e.g. reading chunks) to phase 'name'
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def watch_memos(self, state):
+        """
+        Count hits and misses of all memos of a data_curation.CurationState
+        """
+        for name in [*state.MEMOS.values(), "countries"]:
+            counting = CountingDict(getattr(state, name))
+            setattr(state, name, counting)
+            self.memos[name] = counting
+
+    def timed_check(self, name, func):
+        """
+        Timed version of a check function
+        """
+        def run(*args, **kwargs):
+            stats = self.checks.setdefault(name, {"calls": 0, "seconds": 0,
+                                                  "input_seconds": 0})
+            stats["calls"] += 1
+            self.running.append(name)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.running.pop()
+                stats["seconds"] += time.perf_counter() - start
+        return run
+
+    def timed_input(self, ori_input):
+        """
+        Timed version of input(): time is added to all check functions running
+        """
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return ori_input(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                self.input_seconds += seconds
+                self.questions += 1
+                for name in set(self.running):
+                    self.checks[name]["input_seconds"] += seconds
+        return run
+
+    @contextlib.contextmanager
+    def instrument(self, module):
+        """
+        While in this block, time all check functions of module (check_*, checked_*) and
+        all questions asked to the curator.
+        """
+        names = [name for name in vars(module)
+                 if name.startswith(("check_", "checked_")) and callable(getattr(module, name))]
+        originals = {name: getattr(module, name) for name in names}
+        ori_input = builtins.input
+        try:
+            for name, func in originals.items():
+                setattr(module, name, self.timed_check(name, func))
+            builtins.input = self.timed_input(ori_input)
+            yield self
+        finally:
+            for name, func in originals.items():
+                setattr(module, name, func)
+            builtins.input = ori_input
+
+    def stop(self, json_file=None, stats_file=None):
+        """
+        End of profiled run: print summary, and save it to json_file and cProfile stats to
+        stats_file if given
+        """
+        self.total = time.perf_counter() - self.start
+        if self.cprofile:
+            self.cprofile.disable()
+        print(self.report())
+        if json_file:
+            self.save(json_file)
+        if stats_file:
+            self.dump_stats(stats_file)
+
+    def summary(self):
+        """
+        All timings and counts, as a dict (saved in json format by 'save')
+        """
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        return {"total_seconds": total,
+                "input_seconds": self.input_seconds,
+                "questions": self.questions,
+                "phases": dict(self.phases),
+                "checks": {name: dict(stats) for name, stats in self.checks.items()},
+                "memos": {name: {"hits": memo.hits, "misses": memo.misses, "size": len(memo)}
+                          for name, memo in self.memos.items()},
+                "transliteration": transliteration.summary()}
+
+    def report(self):
+        """
+        Summary, as text
+        """
+        summary = self.summary()
+        total = summary["total_seconds"]
+        lines = ["------PROFILE-----",
+                 f"Total: {total:.2f} s, of which {summary['input_seconds']:.2f} s waiting "
+                 f"for the curator ({summary['questions']} questions)",
+                 "Phases:"]
+        for name, seconds in summary["phases"].items():
+            lines.append(f"\t{name:30} {seconds:10.3f} s {100 * seconds / total:6.1f}%")
+        lines.append("Check functions (calls, time, time waiting for the curator):")
+        for name, stats in sorted(summary["checks"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"\t{name:30} {stats['calls']:10} {stats['seconds']:10.3f} s "
+                         f"{stats['input_seconds']:10.3f} s")
+        lines.append("Memos (hits, misses, distinct values):")
+        for name, stats in summary["memos"].items():
+            lines.append(f"\t{name:30} {stats['hits']:10} {stats['misses']:10} {stats['size']:10}")
+        lines.append("Transliteration (distinct values, non-ASCII ones):")
+        for name, stats in summary["transliteration"]["columns"].items():
+            lines.append(f"\t{name:30} {stats['values']:10} {stats['transliterated']:10}")
+        cache = summary["transliteration"]["cache"]
+        lines.append(f"\t{'cache (hits, misses, size)':30} {cache['hits']:10} "
+                     f"{cache['misses']:10} {cache['size']:10}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        """
+        Save summary to a json file
+        """
+        with open(path, "w") as out:
+            json.dump(self.summary(), out, indent=2)
+
+    def dump_stats(self, path):
+        """
+        Save cProfile stats (see pstats module)
+        """
+        self.cprofile.dump_stats(path)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Non-interactive curation: instead of asking the curator, questions are collected during
+a first run, and written to a 'questions' file (one line per distinct value to check).
+The curator fills the 'answer' column of this file, and gives it back with --answers to
+a second run, which applies all answers at once.
+
+Answers:
+- empty: not answered yet (question will be asked again)
+- 'y': accept proposed value
+- 'n': value is wrong. For lab, address, authors, assembly and sequencing technology
+  columns, keep it and inform submitter. For the country of a virus name, keep the
+  country given in the virus name.
+- anything else: new value to put instead of the original one
+
+The country of a virus name (column 'vname_country') is asked once for each pair of
+countries 'country in virus name / country in location'.
+
+Near-identical labs, addresses and authors (column '<column>_cluster', e.g.
+'covv_orig_lab_cluster') are asked together: value is the list of values of the group,
+separated by ' | '. 'y' puts the proposal for all of them, 'n' means they are not the same
+(they are then asked one by one), anything else is put for all of them.
+"""
+
+import csv
+
+
+HEADER = ["column", "rows", "sequence", "value", "proposal", "question", "answer"]
+
+
+class Questions:
+    """
+    Questions collected during a non-interactive run, deduplicated by (column, value).
+    """
+
+    def __init__(self):
+        # {(column, value): {"rows": int, "sequence": str, "proposal": str, "question": str}}
+        self.questions = {}
+        # questions added since last call to 'add_rows'
+        self.new = []
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __contains__(self, key):
+        return key in self.questions
+
+    def add(self, column, value, proposal, seq, question):
+        """
+        Save a question to ask later.
+
+        Parameters
+        ----------
+        column: str
+            header of column (key used to save the answer)
+        value: str
+            original value (key used to save the answer)
+        proposal: str
+            value which will be put if the curator accepts it
+        seq: str
+            first sequence with this value
+        question: str
+            question to ask
+        """
+        key = (column, value)
+        if key not in self.questions:
+            self.questions[key] = {"rows": 0, "sequence": seq, "proposal": proposal,
+                                   "question": question}
+        self.new.append(key)
+
+    def add_rows(self, nb_rows):
+        """
+        Add nb_rows lines to the questions added since last call (the lines having the
+        value which was just checked)
+        """
+        for key in set(self.new):
+            self.questions[key]["rows"] += int(nb_rows)
+        self.new = []
+
+    def merge(self, other):
+        """
+        Add questions of another Questions object (e.g. from another file). Questions
+        already there are not duplicated, their numbers of lines are added.
+        """
+        for key, info in other.questions.items():
+            if key in self.questions:
+                self.questions[key]["rows"] += info["rows"]
+            else:
+                self.questions[key] = dict(info)
+
+    def grouped(self):
+        """
+        All questions, grouped by column. Columns are kept in the order in which they
+        were checked.
+
+        Returns
+        -------
+        list
+            [((column, value), info)]
+        """
+        order = {}
+        for column, _ in self.questions:
+            order.setdefault(column, len(order))
+        return sorted(self.questions.items(), key=lambda item: order[item[0][0]])
+
+    def write(self, path):
+        """
+        Write all questions to a tsv file, grouped by column.
+        """
+        with open(path, "w", newline="") as qf:
+            writer = csv.writer(qf, delimiter="\t")
+            writer.writerow(HEADER)
+            for (column, value), info in self.grouped():
+                writer.writerow([column, info["rows"], info["sequence"], value,
+                                 info["proposal"], info["question"], ""])
+
+
+def read_answers(path, decisions):
+    """
+    Read a questions file filled by a curator, and save all answers to decisions.
+
+    Parameters
+    ----------
+    path: str
+        questions file, with 'answer' column filled
+    decisions: DecisionStore
+        where to save answers
+
+    Returns
+    -------
+    int
+        number of answers read
+    """
+    nb_answers = 0
+    with open(path, newline="") as af:
+        for line in csv.DictReader(af, delimiter="\t"):
+            answer = (line.get("answer") or "").strip()
+            if not answer:
+                continue
+            try:
+                record_answer(decisions, line["column"], line["value"], line["proposal"],
+                              answer)
+            except ValueError as err:
+                print(f"Answer ignored: {err}")
+                continue
+            nb_answers += 1
+    return nb_answers
+
+
+def record_answer(decisions, column, value, proposal, answer):
+    """
+    Save the answer to a question in decisions ('y': proposal is accepted, 'n': value is
+    wrong, anything else: new value)
+
+    Raises ValueError if 'y' is given without proposal (e.g. duplicated virus name: a new
+    value must be given)
+    """
+    if answer.lower() in ["y", "yes"] and not proposal:
+        raise ValueError(f"No proposal for '{value}' ({column}): give the new value.")
+    if answer.lower() in ["y", "yes"]:
+        decisions.record(column, value, proposal)
+    elif answer.lower() in ["n", "no"]:
+        decisions.record(column, value, proposal, accepted=False)
+    else:
+        decisions.record(column, value, answer)
+
+
+def ask_questions(questions, decisions):
+    """
+    Ask questions to the curator, one by one, and save answers in decisions.
+
+    Parameters
+    ----------
+    questions: Questions
+        questions to ask (already deduplicated: each one is asked only once, whatever
+        the number of lines or files concerned)
+    decisions: DecisionStore
+        where to save answers
+    """
+    for (column, value), info in questions.grouped():
+        print(f"\n------{column.upper()} checking-----")
+        print(f"{info['question']} ({info['rows']} line(s), first one: {info['sequence']})")
+        while True:
+            if info["proposal"]:
+                answer = input(f"'Y' (default) to accept '{info['proposal']}', 'n' if this "
+                               "value is wrong, or new value:\n").strip()
+            else:
+                answer = input("New value:\n").strip()
+            try:
+                record_answer(decisions, column, value, info["proposal"], answer or "y")
+                break
+            except ValueError as err:
+                print(err)
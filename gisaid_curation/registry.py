@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Registry of all virus names already released, saved in a SQLite file.
+
+Virus names must be unique in the whole database, not only in the current bulk. Names
+of a new bulk are checked against the registry all at once when the file is loaded,
+and names of the curated bulk are added to it at the end of the run.
+"""
+
+import time
+import sqlite3
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vnames (
+    name TEXT PRIMARY KEY,
+    time REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class VirusNameRegistry:
+    """
+    Virus names already released
+
+    Parameters
+    ----------
+    path: str
+        SQLite file containing released virus names (created if it does not exist)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Several processes may add names at the same time: wait for each other
+        self.con = sqlite3.connect(path, timeout=60)
+        self.con.executescript(SCHEMA)
+        # {name: True if released} for all names already looked for
+        self.known = {}
+
+    def __contains__(self, name):
+        if name not in self.known:
+            found = self.con.execute("SELECT 1 FROM vnames WHERE name = ?", (name,)).fetchone()
+            self.known[name] = found is not None
+        return self.known[name]
+
+    def released(self, names):
+        """
+        Find, in one request, which of the given names were already released.
+
+        Parameters
+        ----------
+        names: iterable of str
+            virus names of the bulk
+
+        Returns
+        -------
+        set
+            names already released
+        """
+        names = set(names)
+        with self.con:
+            self.con.execute("CREATE TEMP TABLE IF NOT EXISTS batch (name TEXT PRIMARY KEY) "
+                             "WITHOUT ROWID")
+            self.con.execute("DELETE FROM batch")
+            self.con.executemany("INSERT OR IGNORE INTO batch VALUES (?)",
+                                 ((name,) for name in names))
+            found = {name for (name,) in self.con.execute(
+                "SELECT batch.name FROM batch JOIN vnames ON batch.name = vnames.name")}
+            self.con.execute("DELETE FROM batch")
+        self.known.update((name, name in found) for name in names)
+        return found
+
+    def add(self, names):
+        """
+        Add names of a curated bulk to the registry. All names are added in a single
+        transaction: if anything fails, none of them is added.
+        """
+        now = time.time()
+        with self.con:
+            self.con.executemany("INSERT OR IGNORE INTO vnames (name, time) VALUES (?, ?)",
+                                 ((name, now) for name in names))
+        self.known.update((name, True) for name in names)
+
+    def close(self):
+        self.con.close()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Declarative rules of the columns which are checked value by value (type, passage, host,
+gender, patient age, labs, addresses, authors, assembly method and sequencing technology).
+
+Each column has a Rule (see RULES), saying which values are unknown, which ones are
+accepted (vocabulary, format), how they are written (capital letter, without accents),
+and what to do with the others (ask the curator, or keep them and inform the submitter).
+
+Rules are compiled once (regular expressions, vocabulary), and applied to all distinct
+values of a column at once with pandas (Rule.fix_all): only values which need the curator
+are then checked one by one by the check functions of data_curation. Rule.fix applies the
+same rules to a single value, in pure python (see validate).
+
+To check a new column, add its rule to RULES, and curate it with
+data_curation.curate_rule_column.
+"""
+
+import re
+
+from gisaid_curation.transliteration import to_ascii, to_ascii_all
+
+
+UNKNOWN = "unknown"
+
+
+class Rule:
+    """
+    Rule of a column
+
+    Parameters
+    ----------
+    unknown: str
+        regular expression (case insensitive) of values meaning 'unknown', searched in the
+        value without leading and trailing spaces. By default, empty or 'unknown'.
+    vocabulary: dict
+        {lower case value: value to put}, e.g. {"m": "Male"}
+    pattern: str
+        regular expression (case insensitive) of accepted values (other than vocabulary).
+        None: all values are accepted. '' : only vocabulary is accepted.
+    capital: bool
+        accepted values are written with a capital first letter, and lower case letters
+    required: bool
+        'unknown' values must be reported to the submitter, with this severity
+    severity: str
+        'ERROR' (sequence cannot be released) or 'WARNING' (submitter informed, sequence can
+        be released), for wrong values, and unknown values of required columns
+    message: str
+        why a value is wrong, for the curator and the submitter
+    confirm: bool
+        accepted values must still be confirmed by the curator
+    prompt: bool
+        wrong values are asked to the curator. If False, they are replaced by 'fill' and
+        reported with 'severity'.
+    fill: str
+        value put instead of wrong values which are not asked (None: kept as is)
+    """
+
+    def __init__(self, unknown=r"^(?:unknown)?$", vocabulary=None, pattern=None, capital=False,
+                 required=False, severity="WARNING", message="wrong value", confirm=False,
+                 prompt=True, fill=None):
+        self.unknown = re.compile(unknown, re.I) if unknown else None
+        self.vocabulary = dict(vocabulary or {})
+        self.pattern = re.compile(pattern, re.I) if pattern else None
+        self.accept_all = pattern is None
+        self.capital = capital
+        self.required = required
+        self.severity = severity
+        self.message = message
+        self.confirm = confirm
+        self.prompt = prompt
+        self.fill = fill
+
+    def fix_all(self, values):
+        """
+        Apply the rule to values, all at once.
+
+        Parameters
+        ----------
+        values: iterable of str
+            values of the column (usually distinct ones)
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            fixed values, and status of each value:
+            - 'unknown': value is unknown, fixed to 'unknown'
+            - 'ok': value accepted, fixed to its right form
+            - 'wrong': value not accepted, fixed to 'fill' (or kept as is)
+        """
+        import numpy as np
+        import pandas as pd
+
+        texts = pd.Series(list(values), dtype=object).fillna("").astype(str)
+        if texts.empty:
+            return np.array([], dtype=object), np.array([], dtype=object)
+        stripped = texts.str.strip()
+        unknown = (stripped.str.contains(self.unknown) if self.unknown is not None
+                   else pd.Series(False, index=texts.index))
+        known = stripped.str.lower().map(self.vocabulary)
+        in_vocabulary = known.notna() & ~unknown
+        if self.accept_all:
+            matched = ~unknown & ~in_vocabulary
+        elif self.pattern is not None:
+            matched = stripped.str.fullmatch(self.pattern) & ~unknown & ~in_vocabulary
+        else:
+            matched = pd.Series(False, index=texts.index)
+        formatted = stripped.str.capitalize() if self.capital else stripped.copy()
+        # Remove accents (only non-ASCII values are transliterated)
+        formatted = formatted.astype(object)
+        formatted[matched] = to_ascii_all(formatted[matched])
+
+        fixed = texts.to_numpy(dtype=object).copy()
+        if self.fill is not None:
+            fixed[:] = self.fill
+        fixed[unknown.to_numpy()] = UNKNOWN
+        fixed[in_vocabulary.to_numpy()] = known[in_vocabulary].to_numpy(dtype=object)
+        fixed[matched.to_numpy()] = formatted[matched].to_numpy(dtype=object)
+        status = np.select([unknown.to_numpy(), (in_vocabulary | matched).to_numpy()],
+                           ["unknown", "ok"], "wrong").astype(object)
+        return fixed, status
+
+    def fix(self, value):
+        """
+        Apply the rule to a single value (same rules as fix_all)
+
+        Returns
+        -------
+        (str, str)
+            fixed value, and status ('unknown', 'ok' or 'wrong')
+        """
+        text = "" if value is None or value != value else str(value)
+        stripped = text.strip()
+        if self.unknown is not None and self.unknown.search(stripped):
+            return UNKNOWN, "unknown"
+        if stripped.lower() in self.vocabulary:
+            return self.vocabulary[stripped.lower()], "ok"
+        if self.accept_all or (self.pattern is not None and self.pattern.fullmatch(stripped)):
+            return self.format(stripped), "ok"
+        return (text if self.fill is None else self.fill), "wrong"
+
+    def format(self, value):
+        """
+        Write a value as accepted values are written (capital letter, without accents),
+        e.g. a value confirmed or given by the curator
+        """
+        return to_ascii(value.capitalize() if self.capital else value)
+
+    def final(self, status):
+        """
+        True if a value with this status (see fix_all) is fixed without asking the curator
+        """
+        if status == "ok":
+            return not self.confirm
+        if status == "unknown":
+            return not self.required
+        return not self.prompt
+
+    def problems(self, value):
+        """
+        Problems of a value, to report before curation (see validate)
+
+        Returns
+        -------
+        list of (str, str)
+            severity and message of each problem
+        """
+        fixed, status = self.fix(value)
+        if status == "unknown" and self.required:
+            if self.severity == "ERROR":
+                return [("ERROR", "not given: ask submitter (NO release)")]
+            return [("WARNING", "not given: inform submitter (can be released)")]
+        if status == "wrong":
+            return [(self.severity, self.message)]
+        if fixed != value and status == "ok":
+            return [("WARNING", f"will be changed to '{fixed}'")]
+        return []
+
+
+def mandatory(severity, confirm=False):
+    """
+    Rule of a mandatory column: anything accepted, but it must be given (see
+    data_curation.check_mandatory_field)
+    """
+    return Rule(required=True, severity=severity, confirm=confirm)
+
+
+RULES = {
+    "covv_type": Rule(unknown=None, vocabulary={"betacoronavirus": "betacoronavirus"},
+                      pattern="", prompt=False, fill="betacoronavirus",
+                      message="will be changed to 'betacoronavirus'"),
+    # Passage is always confirmed by the curator
+    "covv_passage": Rule(pattern=r"(?:original|vero)\b.*", capital=True, confirm=True,
+                         message="passage should start with Original or Vero"),
+    "covv_host": Rule(capital=True),
+    # 'u', 'unk'... are unknown
+    "covv_gender": Rule(unknown=r"^$|u", pattern="", severity="ERROR",
+                        vocabulary={"m": "Male", "male": "Male", "f": "Female",
+                                    "female": "Female"},
+                        message="gender must be Male, Female or unknown"),
+    # Age in years, or with its unit ('8 months'). Wrong ages are kept, and reported
+    "covv_patient_age": Rule(pattern=r"(?:1[01]\d|120|[1-9]?\d)"
+                                     r"(?:\s*(?:years?|months?|weeks?|days?))?",
+                             prompt=False,
+                             message="age must be a number of years (or months, weeks, "
+                                     "days), or unknown"),
+    # If not given: contact submitter, and DO NOT release
+    "covv_orig_lab": mandatory("ERROR"),
+    "covv_orig_lab_addr": mandatory("ERROR"),
+    "covv_subm_lab": mandatory("ERROR"),
+    "covv_subm_lab_addr": mandatory("ERROR"),
+    "covv_authors": mandatory("ERROR", confirm=True),
+    # If not given: contact submitter, but release
+    "covv_assembly_method": mandatory("WARNING", confirm=True),
+    "covv_seq_technology": mandatory("WARNING", confirm=True),
+}
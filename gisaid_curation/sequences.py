@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+
+"""
+Sequence curation: FASTA file of a bulk, matched to its curated metadata.
+
+The FASTA file is read record by record (buffered reader: it is never loaded in memory),
+and written again to {fasta}.curated.fasta, each header being replaced by the curated virus
+name of its sequence:
+- headers are matched to virus names with a hash index (see NameIndex): original names of
+  the metadata (renamed sequences are read from {metadata}.curated.diff.tsv), and curated
+  names
+- sequences without metadata line, sequences given several times, and metadata lines
+  without sequence, are logged (contact submitter)
+
+Length, number of N, of other ambiguous bases (IUPAC) and of invalid characters of each
+sequence are counted with numpy on its bytes, and written to {fasta}.sequences.tsv. Big
+files are counted in parallel, batch by batch, in a process pool.
+"""
+
+import os
+import csv
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import logging
+logger = logging.getLogger("gisaid_curation.sequences")
+
+from gisaid_curation.journal import change
+
+
+# Number of sequences counted at once (by a worker of the process pool)
+BATCH_SIZE = 500
+# Files smaller than this (in bytes, about 1,000 SARS-CoV-2 genomes) are counted without
+# process pool
+PARALLEL_SIZE = 30_000_000
+# Columns of {fasta}.sequences.tsv
+HEADER = ["sequence", "header", "length", "n", "n_fraction", "ambiguous", "invalid"]
+
+# Class of each byte of a sequence
+BASE, N, AMBIGUOUS, GAP, SPACE, INVALID = range(6)
+
+
+def byte_classes():
+    """
+    Class of each of the 256 possible bytes (upper or lower case): bases, N, other
+    ambiguous bases, gaps, spaces and line breaks (not part of the sequence), invalid
+    """
+    classes = np.full(256, INVALID, dtype=np.uint8)
+    for cls, chars in [(BASE, b"ACGTU"), (N, b"N"), (AMBIGUOUS, b"RYSWKMBDHV"), (GAP, b"-"),
+                       (SPACE, b" \t\r\n")]:
+        for char in chars + chars.lower():
+            classes[char] = cls
+    return classes
+
+
+CLASSES = byte_classes()
+
+
+def count_bases(sequence):
+    """
+    Count bases of a sequence
+
+    Parameters
+    ----------
+    sequence: bytes
+        sequence lines, as read in the FASTA file (line breaks included)
+
+    Returns
+    -------
+    (int, int, int, int)
+        length (line breaks and spaces excluded), number of N, of other ambiguous bases,
+        and of invalid characters
+    """
+    counts = np.bincount(CLASSES[np.frombuffer(sequence, dtype=np.uint8)],
+                         minlength=len(CLASSES))
+    return (int(len(sequence) - counts[SPACE]), int(counts[N]), int(counts[AMBIGUOUS]),
+            int(counts[INVALID]))
+
+
+def count_batch(sequences):
+    """
+    count_bases of each sequence of a batch (run by a worker of the process pool)
+    """
+    return [count_bases(sequence) for sequence in sequences]
+
+
+def iter_fasta(path):
+    """
+    Read a FASTA file record by record (buffered: only one sequence is in memory)
+
+    Returns
+    -------
+    iterator of (str, bytes)
+        header (without '>' nor spaces around), and sequence lines as read
+    """
+    header, lines = None, []
+    with open(path, "rb", buffering=1 << 20) as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, b"".join(lines)
+                header = line[1:].strip().decode("utf-8", errors="replace")
+                lines = []
+            elif header is not None:
+                lines.append(line)
+    if header is not None:
+        yield header, b"".join(lines)
+
+
+def read_renames(diff_file):
+    """
+    Virus names changed by curation, from the cells changed in the curated metadata (see
+    workbook.DiffWriter), in the order of lines
+
+    Returns
+    -------
+    list of (str, str)
+        original and curated virus names
+    """
+    with open(diff_file, newline="") as diff:
+        return [(line["original"], line["curated"])
+                for line in csv.DictReader(diff, delimiter="\t")
+                if line["column"] == "covv_virus_name"]
+
+
+class NameIndex:
+    """
+    Hash index of the sequences expected in the FASTA file: {header: [curated names]}.
+    A sequence is found with its original virus name, or its curated name. A name is
+    given for several curated names when several lines of metadata had the same
+    original name: they are given in the order of lines.
+
+    Parameters
+    ----------
+    vnames: iterable of str
+        curated virus names of all lines of metadata
+    renames: list of (str, str)
+        original and curated virus names, for renamed sequences (see read_renames)
+    """
+
+    def __init__(self, vnames, renames):
+        self.vnames = list(vnames)
+        self.names = {name: [name] for name in self.vnames}
+        for original, curated in renames:
+            if original != curated:
+                self.names.setdefault(original, []).append(curated)
+        self.found = set()
+
+    def match(self, header):
+        """
+        Curated name of the sequence with this header
+
+        Returns
+        -------
+        (str, bool)
+            curated name (None if not found), and whether the header is known (if it is
+            known but without curated name left, the sequence is given several times)
+        """
+        candidates = self.names.get(header, [])
+        for name in candidates:
+            if name not in self.found:
+                self.found.add(name)
+                return name, True
+        return None, bool(candidates)
+
+    def missing(self):
+        """
+        Curated names without sequence
+        """
+        return [name for name in self.vnames if name not in self.found]
+
+
+def cure_fasta(fasta_in, vnames, renames, jobs=None):
+    """
+    Rename sequences of a FASTA file with their curated virus names, count their bases,
+    and log sequences missing, extra, or given several times.
+
+    Parameters
+    ----------
+    fasta_in: str
+        FASTA file of the bulk. Curated sequences are written to {fasta_in}.curated.fasta
+        (same sequences and lines, renamed headers), and counts of bases to
+        {fasta_in}.sequences.tsv
+    vnames: iterable of str
+        curated virus names of all lines of metadata
+    renames: list of (str, str)
+        original and curated virus names, for renamed sequences (see read_renames)
+    jobs: int
+        number of processes counting bases of big files (default: number of CPUs)
+
+    Returns
+    -------
+    dict
+        number of sequences, of renamed, extra, duplicated and missing ones
+    """
+    index = NameIndex(vnames, renames)
+    jobs = jobs or os.cpu_count() or 1
+    parallel = jobs > 1 and os.path.getsize(fasta_in) >= PARALLEL_SIZE
+    summary = {"sequences": 0, "renamed": 0, "extra": 0, "duplicated": 0, "missing": 0}
+    with open(f"{fasta_in}.curated.fasta", "wb") as fasta_out, \
+            open(f"{fasta_in}.sequences.tsv", "w", newline="") as stats_out, \
+            (ProcessPoolExecutor(jobs) if parallel else contextlib.nullcontext()) as pool:
+        stats = csv.writer(stats_out, delimiter="\t")
+        stats.writerow(HEADER)
+        # Batches being counted, written in the order of the file
+        pending = deque()
+        for batch in iter_batches(iter_fasta(fasta_in), BATCH_SIZE):
+            names = []
+            for header, sequence in batch:
+                name = curate_record(header, index, fasta_in, summary)
+                fasta_out.write(b">" + (name or header).encode() + b"\n")
+                fasta_out.write(sequence if sequence.endswith(b"\n") or not sequence
+                                else sequence + b"\n")
+                names.append((name or header, header))
+            sequences = [sequence for _, sequence in batch]
+            counts = (pool.submit(count_batch, sequences) if parallel
+                      else FinishedBatch(count_batch(sequences)))
+            pending.append((names, counts))
+            while len(pending) > 2 * jobs or (pending and not parallel):
+                write_counts(stats, *pending.popleft())
+        while pending:
+            write_counts(stats, *pending.popleft())
+    for name in index.missing():
+        summary["missing"] += 1
+        logger.error(f"Sequence {name}: no sequence in {fasta_in}. NO release",
+                     extra=change("fasta", seq=name))
+    return summary
+
+
+def curate_record(header, index, fasta_in, summary):
+    """
+    Curated name of a sequence of the FASTA file (None if it has no metadata line, or is
+    given several times), logging renamed, extra and duplicated sequences
+    """
+    summary["sequences"] += 1
+    name, known = index.match(header)
+    if name is None and known:
+        summary["duplicated"] += 1
+        logger.error(f"Sequence {header} is given several times in {fasta_in}. NO release",
+                     extra=change("fasta", seq=header))
+    elif name is None:
+        summary["extra"] += 1
+        logger.warning(f"Sequence {header} of {fasta_in} has no metadata line. Ask submitter.",
+                       extra=change("fasta", seq=header))
+    elif name != header:
+        summary["renamed"] += 1
+        logger.info(f"For sequence {name}, FASTA header changed from '{header}' to '{name}'.",
+                    extra=change("fasta", header, name, name))
+    return name
+
+
+class FinishedBatch:
+    """
+    Counts of a batch counted without process pool (same interface as a Future)
+    """
+
+    def __init__(self, counts):
+        self.counts = counts
+
+    def result(self):
+        return self.counts
+
+
+def write_counts(stats, names, counts):
+    """
+    Write counts of bases of a batch of sequences (waiting for its worker)
+    """
+    for (name, header), (length, nb_n, ambiguous, invalid) in zip(names, counts.result()):
+        n_fraction = round(nb_n / length, 4) if length else 0
+        stats.writerow([name, header, length, nb_n, n_fraction, ambiguous, invalid])
+
+
+def iter_batches(records, size):
+    """
+    Group records by batches of 'size' records
+    """
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Local curation server (--serve): a long-running process, shared by several curators.
+
+The curation engine (pandas...), the gazetteer, the decisions store and the registry of
+released names are loaded once, when the server starts. Each file is curated in
+non-interactive mode (see questions): the server sends back the questions left, the
+curator answers them, and curates the file again, as with -q/-a. Answers of all curators
+are saved in the same decisions store, so a value checked by one curator is not asked to
+the others.
+
+Requests (HTTP, json answers), on a TCP port of localhost or on a Unix socket:
+- POST /curate, json body {"path": metadata file}: curate a file of the data directory
+  (--data-root), or of the upload directory. Other paths are refused (403): the server
+  reads these files, and writes outputs next to them.
+- POST /curate?filename=bulk.xlsx, body = content of the file: curate an uploaded file
+  (saved in the upload directory: curate it again with its "file" path)
+  Both return {"file", "questions": [...], "curated", "diff", "logs"}: "curated" is null
+  while some questions are left. Outputs of uploaded files are downloaded with
+  GET /download?file= (links given in "curated_download" and "diff_download")
+- POST /answers, json body {"answers": [{"column", "value", "answer"}]}: save answers to
+  questions sent back by /curate ('y' to accept their proposal, 'n' or new value, see
+  questions.record_answer)
+- GET /status: number of decisions, files curated, requests waiting
+
+Files are curated one at a time, in a single engine thread (pandas, SQLite connections and
+loggers are not shared between threads): requests sent while a file is curated wait for
+their turn, and answers are never saved while a file is being curated.
+
+Questions sent back by /curate, and not answered yet, are only kept in memory: if the
+server is restarted, curate the file again before sending answers (answers already saved
+are kept in the decisions store).
+
+    gisaid_curation --serve -d decisions.sqlite --port 8765 --data-root /data
+    curl -X POST localhost:8765/curate -d '{"path": "/data/bulk.xlsx"}'
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+logger = logging.getLogger("gisaid_curation.server")
+
+from gisaid_curation import utils
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.gazetteer import GAZETTEER, load_gazetteer
+from gisaid_curation.questions import record_answer
+from gisaid_curation.registry import VirusNameRegistry
+from gisaid_curation.workbook import CACHE_SIZE, EXTENSIONS
+
+
+# Default TCP port
+PORT = 8765
+# Maximum size of an uploaded file, in MB
+MAX_UPLOAD = 500
+STATUS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+          405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """
+    Error sent back to the client, with its HTTP status
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class CurationServer:
+    """
+    Curation engine kept in memory, and the requests it answers.
+
+    Parameters
+    ----------
+    decisions: str
+        SQLite file where answers of all curators are saved (None to keep them in memory,
+        as long as the server runs)
+    curator: str
+        name saved with answers (default: login name of the server)
+    registry: str
+        SQLite file of virus names already released (see registry.VirusNameRegistry)
+    upload_dir: str
+        directory where uploaded files, and their outputs, are saved
+    cache_dir, cache_size, chunk_size, gazetteer:
+        see data_curation.cure_metadata
+    data_root: str
+        directory whose files (and subdirectories) can be curated with their path. If not
+        given, only uploaded files can be curated.
+    """
+
+    def __init__(self, decisions=None, curator=None, registry=None, upload_dir="uploads",
+                 cache_dir=None, cache_size=CACHE_SIZE, chunk_size=None, gazetteer=GAZETTEER,
+                 data_root=None):
+        self.decisions_file = decisions or ":memory:"
+        self.curator = curator
+        self.registry_file = registry
+        self.upload_dir = upload_dir
+        self.data_root = data_root
+        self.options = {"cache_dir": cache_dir, "cache_size": cache_size,
+                        "chunk_size": chunk_size, "gazetteer": gazetteer}
+        # All curation work is done by this thread
+        self.engine = ThreadPoolExecutor(1, thread_name_prefix="curation")
+        self.decisions = None
+        self.registry = None
+        self.cure_metadata = None
+        # Questions sent to curators, not answered yet: {(column, value): proposal}
+        # Only in memory: lost if the server is restarted (files must be curated again)
+        self.pending = {}
+        self.curated = 0
+        self.waiting = 0
+        self.start = time.time()
+
+    def load(self):
+        """
+        Load everything needed to curate files (run in the engine thread)
+        """
+        # Imported here: pandas is loaded once, when the server starts
+        from gisaid_curation.data_curation import cure_metadata
+
+        self.cure_metadata = cure_metadata
+        if self.options["gazetteer"]:
+            load_gazetteer(self.options["gazetteer"])
+        self.decisions = DecisionStore(self.decisions_file, self.curator)
+        if self.registry_file:
+            self.registry = VirusNameRegistry(self.registry_file)
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def close(self):
+        """
+        Close decisions store and registry (run in the engine thread)
+        """
+        if self.decisions is not None:
+            self.decisions.close()
+        if self.registry is not None:
+            self.registry.close()
+
+    async def run_engine(self, func, *args):
+        """
+        Run func in the engine thread, after all requests already waiting
+        """
+        self.waiting += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.engine, func, *args)
+        finally:
+            self.waiting -= 1
+
+    def curate(self, file_in):
+        """
+        Curate a file in non-interactive mode (run in the engine thread)
+
+        Returns
+        -------
+        dict
+            questions left, and output files (curated file only if there is no question)
+        """
+        if not os.path.isfile(file_in):
+            raise HTTPError(404, f"{file_in} not found")
+        if os.path.splitext(file_in)[1].lower() not in EXTENSIONS:
+            raise HTTPError(400, f"{file_in}: unknown format (expected one of "
+                                 f"{', '.join(EXTENSIONS)})")
+        utils.init_logger(file_in, "gisaid_curation")
+        try:
+            questions = self.cure_metadata(file_in, self.decisions, f"{file_in}.questions.tsv",
+                                           self.registry, **self.options)
+        finally:
+            utils.close_logger("gisaid_curation")
+        self.pending.update({key: info["proposal"] for key, info in questions.questions.items()})
+        result = {"file": file_in,
+                  "questions": [{"column": column, "value": value, **info}
+                                for (column, value), info in questions.grouped()],
+                  "curated": None, "diff": None,
+                  "logs": [f"{file_in}.changes.log", f"{file_in}.contact_sub.log"]}
+        if not len(questions):
+            self.curated += 1
+            result["curated"] = f"{file_in}.curated.xlsx"
+            result["diff"] = f"{file_in}.curated.diff.tsv"
+        print(f"{file_in}: {len(questions)} questions left.")
+        return result
+
+    def answer(self, answers):
+        """
+        Save answers to questions (run in the engine thread). Only questions sent back by
+        /curate can be answered: their proposal is the one of the question, whatever the
+        client sends. Nothing is saved if one of the answers is wrong.
+        """
+        checked = []
+        for answer in answers:
+            try:
+                key = (answer["column"], answer["value"])
+                text = str(answer["answer"]).strip() or "y"
+            except (KeyError, TypeError) as err:
+                raise HTTPError(400, f"answer without {err}: {answer}")
+            if key not in self.pending:
+                raise HTTPError(400, f"no question for '{key[1]}' ({key[0]}): curate the "
+                                     "file first")
+            if text.lower() in ["y", "yes"] and not self.pending[key]:
+                raise HTTPError(400, f"no proposal for '{key[1]}' ({key[0]}): give the new "
+                                     "value")
+            checked.append((key, text))
+        for (column, value), text in checked:
+            record_answer(self.decisions, column, value, self.pending.pop((column, value)),
+                          text)
+        return {"recorded": len(checked)}
+
+    def status(self):
+        return {"decisions": len(self.decisions.answers) if self.decisions else 0,
+                "curated": self.curated, "waiting": self.waiting,
+                "uptime": time.time() - self.start}
+
+    def check_path(self, file_in):
+        """
+        Real path of a file sent with its path: it must be in the data root or in the upload
+        directory (links and '..' resolved), otherwise it is refused
+        """
+        path = os.path.realpath(file_in)
+        roots = [os.path.realpath(root) for root in [self.upload_dir, self.data_root] if root]
+        if not any(os.path.commonpath([path, root]) == root for root in roots):
+            raise HTTPError(403, f"{file_in}: only files of "
+                                 f"{' or '.join(roots)} can be curated")
+        return path
+
+    def save_upload(self, filename, body):
+        """
+        Save an uploaded file in the upload directory (under a unique name)
+        """
+        name = os.path.basename(filename or "")
+        if os.path.splitext(name)[1].lower() not in EXTENSIONS:
+            raise HTTPError(400, f"'{name}': unknown format (expected one of "
+                                 f"{', '.join(EXTENSIONS)})")
+        path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex[:12]}-{name}")
+        with open(path, "wb") as out:
+            out.write(body)
+        return path
+
+    async def dispatch(self, method, target, body):
+        """
+        Answer a request
+
+        Returns
+        -------
+        (int, dict or bytes)
+            HTTP status, and json answer (or content of a downloaded file)
+        """
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == "/status":
+            return 200, self.status()
+        if url.path == "/download":
+            path = os.path.join(self.upload_dir, os.path.basename(query.get("file", "")))
+            if not os.path.isfile(path):
+                raise HTTPError(404, f"{query.get('file')} not found")
+            with open(path, "rb") as fi:
+                return 200, fi.read()
+        if method != "POST":
+            raise HTTPError(405 if url.path in ["/curate", "/answers"] else 404,
+                            f"{method} {url.path} not available")
+        if url.path == "/curate":
+            if "filename" in query:
+                file_in = self.save_upload(query["filename"], body)
+            else:
+                file_in = parse_json(body).get("path")
+                if not file_in or not isinstance(file_in, str):
+                    raise HTTPError(400, "give the path of a metadata file, or upload it")
+            file_in = self.check_path(file_in)
+            result = await self.run_engine(self.curate, file_in)
+            # Outputs of uploaded files are downloaded with their name
+            if os.path.dirname(file_in) == os.path.realpath(self.upload_dir):
+                for key in ["curated", "diff"]:
+                    if result[key]:
+                        name = os.path.basename(result[key])
+                        result[f"{key}_download"] = f"/download?file={name}"
+            return 200, result
+        request = parse_json(body)
+        if url.path == "/answers":
+            return 200, await self.run_engine(self.answer, request.get("answers", []))
+        raise HTTPError(404, f"{url.path} not available")
+
+    async def handle(self, reader, writer):
+        """
+        Read a request from a client, and send the answer (one request per connection)
+        """
+        try:
+            try:
+                method, target, body = await read_request(reader)
+                status, answer = await self.dispatch(method, target, body)
+                answer = encode(answer)
+            except HTTPError as err:
+                status, answer = err.status, encode({"error": str(err)})
+            except Exception as err:
+                logger.exception("Error while answering request")
+                status, answer = 500, encode({"error": f"{type(err).__name__}: {err}"})
+            await send_response(writer, status, *answer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=PORT, socket_path=None):
+        """
+        Load the engine, then answer requests until stopped (Ctrl-C)
+        """
+        await self.run_engine(self.load)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+            where = socket_path
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Curation server ready on {where}, with {len(self.decisions.answers)} "
+              "decisions loaded.")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.run_engine(self.close)
+            self.engine.shutdown()
+
+
+def parse_json(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError as err:
+        raise HTTPError(400, f"wrong json: {err}")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "json object expected")
+    return request
+
+
+async def read_request(reader):
+    """
+    Read an HTTP request
+
+    Returns
+    -------
+    (str, str, bytes)
+        method, target (path and query) and body
+    """
+    line = (await reader.readline()).decode("latin-1").split()
+    if len(line) != 3:
+        raise HTTPError(400, "wrong request line")
+    method, target = line[0].upper(), line[1]
+    headers = {}
+    while True:
+        header = (await reader.readline()).decode("latin-1").strip()
+        if not header:
+            break
+        name, _, value = header.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_UPLOAD * 2**20:
+        raise HTTPError(413, f"file bigger than {MAX_UPLOAD} MB")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, body
+
+
+def encode(answer):
+    """
+    Body and content type of an answer: json, or content of a file (bytes)
+    """
+    if isinstance(answer, bytes):
+        return answer, "application/octet-stream"
+    return json.dumps(answer).encode(), "application/json"
+
+
+async def send_response(writer, status, body, content_type):
+    """
+    Send an HTTP response
+    """
+    writer.write(f"HTTP/1.1 {status} {STATUS.get(status, '')}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 "Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+def serve(parsed):
+    """
+    Start the server with command line options (see utils.make_parser)
+    """
+    server = CurationServer(parsed.decisions, parsed.curator, parsed.registry,
+                            parsed.upload_dir, parsed.cache_dir, parsed.cache_size,
+                            parsed.chunk_size, parsed.gazetteer, parsed.data_root)
+    try:
+        asyncio.run(server.serve(parsed.host, parsed.port, parsed.socket))
+    except KeyboardInterrupt:
+        print("Curation server stopped.")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+
+"""
+Removal of accents and non-ASCII characters (unidecode), shared by all checks.
+
+Most values of a bulk are plain ASCII, and are kept as they are: they are found on a whole
+column at once (vectorized 'str.isascii'), or with a single 'str.isascii' for a single
+value. Only non-ASCII values are transliterated, each distinct value once: results are kept
+in a bounded LRU cache (the same lab, author or city with accents is found in many lines
+and bulks).
+
+The number of distinct values of each curated column, and of those which needed
+transliteration, are counted in STATS (shown by --profile).
+"""
+
+import functools
+
+import unidecode
+
+
+# Maximum number of transliterated values kept in cache
+CACHE_SIZE = 65536
+
+# {column: {"values": distinct values checked, "transliterated": non-ASCII ones}}
+STATS = {}
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def transliterate(text):
+    """
+    Text with non-ASCII characters replaced by their closest ASCII (see unidecode)
+    """
+    return unidecode.unidecode(text)
+
+
+def to_ascii(text):
+    """
+    Text without accents nor non-ASCII characters. unidecode is only called (once per
+    distinct text) if the text is not already plain ASCII.
+    """
+    return text if text.isascii() else transliterate(text)
+
+
+def is_ascii(values):
+    """
+    Which values are plain ASCII, for a whole column at once
+
+    Parameters
+    ----------
+    values: pandas.Series
+        values of a column (str, categorical or object). Values which are not str are
+        considered as ASCII (nothing to transliterate)
+
+    Returns
+    -------
+    numpy.ndarray of bool
+    """
+    import numpy as np
+
+    try:
+        return values.str.isascii().fillna(True).to_numpy(dtype=bool)
+    except AttributeError:
+        # No str value at all (e.g. numbers)
+        return np.ones(len(values), dtype=bool)
+
+
+def to_ascii_all(values):
+    """
+    Values of a column without accents nor non-ASCII characters: ASCII values are found at
+    once, and only distinct non-ASCII ones are transliterated (see to_ascii).
+
+    Parameters
+    ----------
+    values: pandas.Series
+        values of a column
+
+    Returns
+    -------
+    pandas.Series
+        same index, ASCII values
+    """
+    import pandas as pd
+
+    converted = values.to_numpy(dtype=object).copy()
+    non_ascii = ~is_ascii(values)
+    if non_ascii.any():
+        texts = pd.Series(converted[non_ascii], dtype=object)
+        ascii_texts = {text: transliterate(text) for text in texts.unique()}
+        converted[non_ascii] = texts.map(ascii_texts).to_numpy(dtype=object)
+    return pd.Series(converted, index=values.index, name=values.name, dtype=object)
+
+
+def count(column, values):
+    """
+    Add distinct values of a curated column, and those which are not ASCII, to STATS
+
+    values: pandas.Series of distinct values
+    """
+    stats = STATS.setdefault(column, {"values": 0, "transliterated": 0})
+    stats["values"] += len(values)
+    stats["transliterated"] += int((~is_ascii(values)).sum())
+
+
+def summary():
+    """
+    STATS, and hits and misses of the transliteration cache
+    """
+    info = transliterate.cache_info()
+    return {"columns": {column: dict(stats) for column, stats in STATS.items()},
+            "cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize}}
+
+
+def reset():
+    """
+    Empty STATS (start of a new run). Cached values are kept.
+    """
+    STATS.clear()
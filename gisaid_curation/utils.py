@@ -26,52 +26,208 @@
 
 import sys
 import logging
-from logging import FileHandler
+import contextlib
 import argparse
 
+from gisaid_curation.gazetteer import GAZETTEER
+from gisaid_curation.journal import Journal, QueueJournalHandler
+
+
 def init_logger(logfile, logname):
     """
-    Start logger with appropriate format
+    Start logger: all messages are saved in the journal of logfile (see journal.Journal),
+    and written to:
+    - logfile.changes.log: all changes done
+    - logfile.contact_sub.log: things that must be sent to submitter (warning), and if
+      sequence cannot be released (error)
+    - logfile.virus_IDs.txt: changed virus names
+    - logfile.changes.jsonl: all changes, in json format
     """
+    # Write logs of a previous file (several files curated by the same process)
+    close_logger(logname)
     logger = logging.getLogger(logname)
-    level = logging.DEBUG
-    logger.setLevel(level)
-    # create formatter for log messages (only logs in logfile)
-    formatterFile = logging.Formatter('%(levelname)s :: %(message)s')
-    # formatterStream = logging.Formatter('  * %(message)s')
-
-    # Create logfile handler: writing to 'logfile'. mode 'write'.
-    # To write all changes done
-    logfile_log = logfile + ".changes.log"
-    open(logfile_log, "w").close()  # empty logfile if already existing
-    logfile_handler1 = FileHandler(logfile_log, 'w')
-
-    # Create logfile handler: writing to 'logfile'. mode 'write'.
-    # To write things that must be sent to submitter (warning), and if 
-    # sequence cannot be released (error)
-    logfile_contact = logfile + ".contact_sub.log"
-    open(logfile_contact, "w").close()  # empty logfile if already existing
-    logfile_handler2 = FileHandler(logfile_contact, 'w')
-
-    # set level of changes.log to the same as the logger level
-    logfile_handler1.setLevel(level)
-    logfile_handler1.setFormatter(formatterFile)  # add formatter
-    logger.addHandler(logfile_handler1)  # add handler to logger
-
-    # set level of contact_sub.log to warning level
-    logfile_handler2.setLevel(logging.WARNING)
-    logfile_handler2.setFormatter(formatterFile)  # add formatter
-    logger.addHandler(logfile_handler2)  # add handler to logger
-
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(QueueJournalHandler(Journal(logfile)))
     return logger
 
 
+def close_logger(logname):
+    """
+    Stop logger, and write all messages not written yet
+    """
+    logger = logging.getLogger(logname)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
 def make_parser(argu):
     """
     generate args parser
     """
     my_parser = argparse.ArgumentParser(description="help for GISAID metadata curation")
-    my_parser.add_argument("-f", dest="xls_file",
-                           help="xls file containing metadata of your bulk.", required=True)
+    my_parser.add_argument("-f", dest="xls_file", nargs="+",
+                           help="xls file containing metadata of your bulk (xlsx, or csv/tsv/parquet "
+                                "export of the Submissions sheet, are also accepted). Several "
+                                "files, or directories containing them, can be given: questions "
+                                "are then asked once for all files, and files are curated in "
+                                "parallel. Required, except with --serve.")
+    my_parser.add_argument("-j", "--jobs", dest="jobs", type=int,
+                           help="Number of files curated in parallel, when several files are "
+                                "given, or of processes counting bases of a big FASTA file "
+                                "(default: number of CPUs).")
+    my_parser.add_argument("-d", "--decisions", dest="decisions",
+                           help="SQLite file where curator answers are saved, and reused for "
+                                "next runs (created if it does not exist).")
+    my_parser.add_argument("--curator", dest="curator",
+                           help="Name of the curator, saved with each answer in the decisions "
+                                "file (default: login name).")
+    my_parser.add_argument("--forget-older-than", dest="max_age", type=float,
+                           help="Remove, from the decisions file, answers given more than "
+                                "this number of days ago.")
+    my_parser.add_argument("--forget-column", dest="forget_columns", action="append",
+                           metavar="COLUMN",
+                           help="Remove, from the decisions file, all answers for this column "
+                                "(e.g. covv_location). Can be used several times.")
+    my_parser.add_argument("-q", "--questions", dest="questions",
+                           help="Non-interactive mode: do not ask anything, but write all "
+                                "questions to this file (one line per distinct value to "
+                                "check). Fill its 'answer' column, and give it back with -a.")
+    my_parser.add_argument("-a", "--answers", dest="answers",
+                           help="Questions file (written with -q) filled by the curator: "
+                                "apply all its answers.")
+    my_parser.add_argument("-r", "--registry", dest="registry",
+                           help="SQLite file containing all virus names already released "
+                                "(created if it does not exist). Virus names must not be in "
+                                "it, and curated names are added to it at the end.")
+    my_parser.add_argument("--cache", dest="cache_dir",
+                           help="Directory where parsed metadata files are cached: running "
+                                "again on the same (unchanged) file does not parse it again.")
+    my_parser.add_argument("--cache-size", dest="cache_size", type=float, default=500,
+                           help="Maximum size of the cache directory, in MB. Least recently "
+                                "used files are removed when it is bigger (default: 500).")
+    my_parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                           help="Streaming mode, for very big files: read and curate lines by "
+                                "chunks of this size, and write each curated chunk to "
+                                "<metadatafile>.curated.xlsx before reading the next one.")
+    my_parser.add_argument("--gazetteer", dest="gazetteer", default=GAZETTEER,
+                           help="tsv file of known places (columns continent, country, region, "
+                                "aliases). Locations made of known places are fixed without "
+                                "asking anything. Default: gazetteer bundled with the package.")
+    my_parser.add_argument("--validate-only", dest="validate_only", action="store_true",
+                           help="Only check format rules (quick, without asking anything nor "
+                                "writing any file), and report problems found. Exit code is 1 "
+                                "if some values must be fixed.")
+    my_parser.add_argument("--fasta", dest="fasta",
+                           help="FASTA file of the bulk: once metadata are curated, its "
+                                "sequences are renamed with the curated virus names (to "
+                                "<fastafile>.curated.fasta), their length, N and ambiguous "
+                                "bases are counted (<fastafile>.sequences.tsv), and missing or "
+                                "extra sequences are reported.")
+    my_parser.add_argument("--resume", dest="resume", action="store_true",
+                           help="Resume the session stopped on this file (STOP, Ctrl-C...): "
+                                "answers already given are replayed, and questions start "
+                                "where the session stopped.")
+    my_parser.add_argument("--profile", dest="profile", action="store_true",
+                           help="Print, at the end, time spent reading, curating and writing "
+                                "the file, in each check function and waiting for the "
+                                "curator, and how often already checked values were reused.")
+    my_parser.add_argument("--profile-json", dest="profile_json",
+                           help="Save this profile (see --profile) to this json file.")
+    my_parser.add_argument("--profile-stats", dest="profile_stats",
+                           help="Also run cProfile, and save its stats to this file (to read "
+                                "with pstats or snakeviz).")
+    my_parser.add_argument("--serve", dest="serve", action="store_true",
+                           help="Start a local curation server, shared by several curators: "
+                                "files are sent to it, and it sends back the questions left "
+                                "and the curated file (see gisaid_curation/server.py).")
+    my_parser.add_argument("--host", dest="host", default="127.0.0.1",
+                           help="Address where the server listens (default: 127.0.0.1).")
+    my_parser.add_argument("--port", dest="port", type=int, default=8765,
+                           help="TCP port where the server listens (default: 8765).")
+    my_parser.add_argument("--socket", dest="socket",
+                           help="Unix socket where the server listens, instead of a TCP port.")
+    my_parser.add_argument("--upload-dir", dest="upload_dir", default="uploads",
+                           help="Directory where the server saves uploaded files and their "
+                                "outputs (default: ./uploads).")
+    my_parser.add_argument("--data-root", dest="data_root",
+                           help="Directory whose files the server curates when their path is "
+                                "sent (default: only uploaded files are curated).")
     args = my_parser.parse_args(argu)
+    if not args.xls_file and not args.serve:
+        my_parser.error("the following arguments are required: -f")
     return args
+
+
+def main(argu):
+    """
+    Run gisaid_curation with command line arguments argu (see make_parser): entry point
+    of bin/gisaid_curation, and of 'python -m gisaid_curation.data_curation'
+    """
+    from gisaid_curation import batch
+    from gisaid_curation.decisions import DecisionStore
+    from gisaid_curation.profiling import make_profiler
+    from gisaid_curation.questions import read_answers
+    from gisaid_curation.registry import VirusNameRegistry
+
+    parsed = make_parser(argu)
+    if parsed.serve:
+        from gisaid_curation.server import serve
+
+        serve(parsed)
+        sys.exit(0)
+    metadata = batch.list_files(parsed.xls_file)
+    if parsed.validate_only:
+        # Quick check of format rules, without pandas: nothing asked, nothing written
+        from gisaid_curation.validate import validate
+
+        errors = 0
+        for file_in in metadata:
+            report = validate(file_in, parsed.gazetteer)
+            report.print()
+            errors += report.count("ERROR")
+        sys.exit(1 if errors else 0)
+    decisions = None
+    if parsed.decisions:
+        decisions = DecisionStore(parsed.decisions, parsed.curator)
+        decisions.evict(parsed.max_age, parsed.forget_columns)
+    if parsed.answers:
+        if decisions is None:
+            decisions = DecisionStore(":memory:", parsed.curator)
+        read_answers(parsed.answers, decisions)
+    if len(metadata) > 1:
+        # Several files: curated in parallel, questions asked once for all files
+        if parsed.resume:
+            sys.exit("--resume is only available when curating a single file. To keep your "
+                     "answers for a batch, give a decisions file (-d).")
+        if make_profiler(parsed):
+            print("--profile is only available when curating a single file.")
+        if parsed.fasta:
+            print("--fasta is only available when curating a single file.")
+        batch.cure_batch(metadata, decisions, parsed.questions, parsed.registry, parsed.jobs,
+                         cache_dir=parsed.cache_dir, cache_size=parsed.cache_size,
+                         chunk_size=parsed.chunk_size, gazetteer=parsed.gazetteer)
+        sys.exit(0)
+    # Imported here, as it loads pandas
+    from gisaid_curation import data_curation
+
+    metadata = metadata[0]
+    profiler = make_profiler(parsed)
+    init_logger(metadata, "gisaid_curation")
+    registry = None
+    if parsed.registry:
+        registry = VirusNameRegistry(parsed.registry)
+    # Cure metadatas
+    try:
+        with profiler.instrument(data_curation) if profiler else contextlib.nullcontext():
+            data_curation.cure_metadata(metadata, decisions, parsed.questions, registry,
+                                        parsed.cache_dir, parsed.cache_size, parsed.chunk_size,
+                                        parsed.gazetteer, profiler, parsed.resume,
+                                        parsed.fasta, parsed.jobs)
+    finally:
+        # Write all logs, even if stopped by the curator
+        with profiler.phase("logs") if profiler else contextlib.nullcontext():
+            close_logger("gisaid_curation")
+    if profiler:
+        profiler.stop(parsed.profile_json, parsed.profile_stats)
+
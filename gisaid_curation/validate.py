@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Quick check of a metadata file (--validate-only), before curating it.
+
+All format rules used by curation are checked, line by line, without pandas, without
+asking anything and without writing any file. Problems are reported once per distinct
+value, with the number of lines concerned:
+- ERROR: value which cannot be used as is (the curator will have to give a new one,
+  or the submitter must be contacted)
+- WARNING: value which will be fixed or checked during curation
+"""
+
+from gisaid_curation.coverage import parse_coverage
+from gisaid_curation.dates import normalize_date
+from gisaid_curation.gazetteer import load_gazetteer, CountryMatcher
+from gisaid_curation.rules import RULES
+from gisaid_curation.transliteration import to_ascii
+from gisaid_curation.workbook import iter_rows
+
+
+# Columns checked by curation
+COLUMNS = ["fn", "covv_virus_name", "covv_type", "covv_passage", "covv_collection_date",
+           "covv_location", "covv_host", "covv_gender", "covv_patient_age",
+           "covv_seq_technology", "covv_assembly_method", "covv_coverage", "covv_orig_lab",
+           "covv_orig_lab_addr", "covv_subm_lab", "covv_subm_lab_addr", "covv_authors"]
+
+
+class Report:
+    """
+    Problems found in a metadata file: {(severity, column, value, message): [lines]}
+    (only the first line is kept, with the number of lines)
+    """
+
+    def __init__(self, file_in):
+        self.file_in = file_in
+        self.problems = {}
+
+    def add(self, line, column, value, severity, message):
+        problem = self.problems.setdefault((severity, column, value, message), [0, line])
+        problem[0] += 1
+
+    def count(self, severity):
+        """
+        Number of distinct problems of this severity
+        """
+        return sum(1 for problem in self.problems if problem[0] == severity)
+
+    def print(self):
+        print(f"------VALIDATION of {self.file_in}-----")
+        for (severity, column, value, message), (count, line) in self.problems.items():
+            print(f"{severity}\t{column}\t'{value or ''}'\t{message}\t"
+                  f"{count} line(s), first one: line {line}")
+        print(f"{self.count('ERROR')} errors, {self.count('WARNING')} warnings.")
+
+
+def validate(file_in, gazetteer=None):
+    """
+    Check all lines of a metadata file
+
+    Parameters
+    ----------
+    file_in: str
+        metadata file (xls, xlsx, csv, tsv or parquet, see workbook.iter_rows)
+    gazetteer: str
+        file of known places (see gazetteer.Gazetteer): locations which are not made of
+        known places are reported. None to only check the format of locations.
+
+    Returns
+    -------
+    Report
+        problems found
+    """
+    report = Report(file_in)
+    gazetteer = load_gazetteer(gazetteer) if gazetteer else None
+    matcher = CountryMatcher(gazetteer or load_gazetteer())
+    rows = iter_rows(file_in)
+    header = next(rows, [])
+    missing = [column for column in COLUMNS if column not in header]
+    for column in missing:
+        report.add(1, column, None, "ERROR", "column missing")
+    if missing:
+        return report
+    index = {column: header.index(column) for column in COLUMNS}
+    # Problems of each value already checked: {(column, value): [(severity, message)]}
+    checked = {}
+    vnames = {}  # {virus name: first line}
+    # Line 1 is the header
+    for line, row in enumerate(rows, start=2):
+        values = {column: row[i] if i < len(row) and row[i] is not None else ""
+                  for column, i in index.items()}
+        # 2nd header line of the template
+        if "filename" in values["fn"]:
+            continue
+        for column, value in values.items():
+            if (column, value) not in checked:
+                checked[(column, value)] = check_value(column, value, gazetteer)
+            for severity, message in checked[(column, value)]:
+                report.add(line, column, value, severity, message)
+        vname = values["covv_virus_name"].strip()
+        if vname in vnames:
+            report.add(line, "covv_virus_name", vname, "ERROR",
+                       f"virus name already used (line {vnames[vname]})")
+        vnames.setdefault(vname, line)
+        fields = [field.strip() for field in vname.split("/")]
+        if len(fields) == 4 and not matcher(fields[1], values["covv_location"]):
+            report.add(line, "covv_virus_name", vname, "WARNING",
+                       f"country '{fields[1]}' is not in location "
+                       f"'{values['covv_location']}'")
+    return report
+
+
+def check_value(column, value, gazetteer=None):
+    """
+    Problems of a value of a column (same rules as data_curation check functions)
+
+    Returns
+    -------
+    list of (str, str)
+        severity and message of each problem
+    """
+    text = value.strip()
+    # Columns checked value by value: see rules
+    if column in RULES:
+        return RULES[column].problems(value)
+    if column == "covv_virus_name":
+        fields = [field.strip() for field in text.split("/")]
+        if len(fields) != 4:
+            return [("ERROR", "virus name must be hCoV-19/Country/Identifier/Year")]
+        if fields[0] != "hCoV-19" or fields[3] != "2020" or "/".join(fields) != value:
+            return [("WARNING", "will be changed to "
+                                f"'hCoV-19/{fields[1]}/{fields[2]}/2020'")]
+    if column == "covv_location":
+        return check_location(text, gazetteer)
+    if column == "covv_collection_date":
+        date, reason = normalize_date(text)
+        if date is None:
+            return [("ERROR", f"wrong collection date ({reason})")]
+        if date != text and date != "unknown":
+            return [("WARNING", f"will be changed to '{date}'")]
+    if column == "covv_coverage" and parse_coverage(text) is None:
+        return [("ERROR", "coverage cannot be read")]
+    return []
+
+
+def check_location(location, gazetteer=None):
+    """
+    Problems of a location (see data_curation.check_location). As during curation, it is
+    first normalized with the gazetteer: locations made of known places are fixed without
+    asking the curator, even if they have a single field (e.g. 'France').
+    """
+    fields = [to_ascii(field.strip()) for field in location.split("/")]
+    if gazetteer is not None:
+        fixed, sure = gazetteer.normalize(fields)
+        if sure and " / ".join(fixed) != location:
+            return [("WARNING", f"will be changed to '{' / '.join(fixed)}'")]
+        if sure:
+            return []
+    if len(fields) < 2:
+        return [("ERROR", "location must be 'Continent / Country [/ Region]'")]
+    if gazetteer is not None:
+        return [("WARNING", "unknown place, the curator will check it")]
+    return []
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+#############################################################################
+# This program provides some help for GISAID bulk data curation             #
+#                                                                           #
+# Authors: Amandine PERRIN                                                  #
+# Copyright (c) 2020  Institut Pasteur, Paris                               #
+#                                                                           #
+# This program is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU Affero General Public License as            #
+# published by the Free Software Foundation, either version 3 of the        #
+# License, or (at your option) any later version.                           #
+#                                                                           #
+# This program is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of            #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the             #
+# GNU Affero General Public License for more details.                       #
+#                                                                           #
+# You should have received a copy of the GNU Affero General Public License  #
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.    #
+#                                                                           #
+#############################################################################
+
+"""
+Read GISAID bulk metadata files.
+
+The GISAID template is a workbook with 2 sheets: 'instructions' (1st sheet), and
+'Submissions' (2nd sheet) containing metadata. It can be given as:
+- legacy xls workbook
+- xlsx workbook
+- csv or tsv export of the Submissions sheet
+- parquet export of the Submissions sheet
+
+Parsed sheets can be cached (in feather format) so that running again on the same
+file does not need to parse it again.
+
+Very big files can also be read, and curated metadata written, by chunks of lines.
+Curated workbooks are always written in xlsx format, in write-only (streaming) mode,
+with a tsv file listing the cells changed by curation.
+
+pandas is only imported when a file is read into a DataFrame: iter_rows reads lines of the
+Submissions sheet without it (quick checks, see validate).
+"""
+
+import os
+import csv
+import glob
+import hashlib
+
+
+# Default maximum size of the cache directory, in MB
+CACHE_SIZE = 500
+# Extensions of metadata files which can be read
+EXTENSIONS = [".xls", ".xlsx", ".xlsm", ".csv", ".tsv", ".parquet", ".pq"]
+# Columns with at most this share of distinct values are stored as categoricals
+CATEGORICAL_RATIO = 0.5
+# Columns whose values must be unique: never stored as categoricals
+UNIQUE_COLUMNS = ["covv_virus_name"]
+
+
+def read_workbook(file_in, cache_dir=None, cache_size=CACHE_SIZE):
+    """
+    Read instructions and Submissions sheets, opening the file only once.
+
+    Parameters
+    ----------
+    file_in: str
+        metadata file (xls, xlsx, csv, tsv or parquet)
+    cache_dir: str
+        if given, directory where parsed sheets are cached. If this file (same content
+        and modification time) was already read, sheets are read from the cache.
+    cache_size: float
+        maximum size of the cache directory, in MB. Least recently used files are removed
+        when it is bigger.
+
+    Returns
+    -------
+    (pandas.DataFrame, pandas.DataFrame)
+        instructions (None for csv/tsv/parquet exports, which only contain Submissions)
+        and Submissions sheets. All cells are read as str.
+    """
+    import pandas as pd
+
+    if cache_dir:
+        return read_cached_workbook(file_in, cache_dir, cache_size)
+    ext = os.path.splitext(file_in)[1].lower()
+    if ext in [".xlsx", ".xlsm"]:
+        instructions, md = read_xlsx(file_in)
+    elif ext in [".csv", ".tsv", ".txt"]:
+        sep = "," if ext == ".csv" else "\t"
+        instructions, md = None, pd.read_csv(file_in, sep=sep, header=0, dtype=str)
+    elif ext in [".parquet", ".pq"]:
+        md = pd.read_parquet(file_in)
+        instructions, md = None, md.apply(lambda col: col.map(cell_text, na_action="ignore"))
+    else:
+        sheets = pd.read_excel(file_in, sheet_name=[0, 1], header=0, dtype=str)
+        instructions, md = sheets[0], sheets[1]
+    return instructions, md
+
+
+def read_xlsx(file_in):
+    """
+    Read instructions and Submissions sheets of a xlsx workbook, in read-only mode:
+    rows are streamed from the file instead of loading the whole workbook in memory.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_in, read_only=True, data_only=True)
+    try:
+        instructions, md = [sheet_to_df(sheet) for sheet in wb.worksheets[:2]]
+    finally:
+        wb.close()
+    return instructions, md
+
+
+def sheet_to_df(sheet):
+    """
+    Convert a read-only openpyxl sheet to a DataFrame of str (1st row is the header)
+    """
+    import pandas as pd
+
+    rows = sheet.iter_rows(values_only=True)
+    header = sheet_header(next(rows, ()))
+    index, data = [], []
+    for line, row in numbered(rows):
+        index.append(line)
+        data.append([cell_text(cell) for cell in row])
+    return pd.DataFrame(data, columns=header, dtype=object, index=pd.Index(index, dtype=int))
+
+
+def filled(rows):
+    """
+    Lines which are not empty: as pandas.read_excel, lines whose cells are all empty
+    (e.g. formatted, but without any value) are ignored
+    """
+    return (row for _, row in numbered(rows))
+
+
+def numbered(rows):
+    """
+    Lines which are not empty (see filled), with their position in the sheet (0 for the
+    line after the header). DataFrames of xlsx sheets are indexed by this position, so that
+    lines are numbered as in the sheet even when empty lines are ignored (see DiffWriter).
+    """
+    return ((line, row) for line, row in enumerate(rows)
+            if any(cell is not None and cell != "" for cell in row))
+
+
+def sheet_header(row):
+    """
+    Column names from 1st row of a sheet. Same names as pandas for columns without header.
+    """
+    header = [cell_text(cell) for cell in row]
+    return [name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+
+def cell_text(cell):
+    """
+    Text of a cell, as given by pandas.read_excel with dtype=str (None for empty cells)
+    """
+    if cell is None:
+        return None
+    # integers are stored as float in Excel
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return str(cell)
+
+
+def iter_workbook(file_in, chunk_size):
+    """
+    Read Submissions sheet by chunks of lines.
+
+    xlsx, csv, tsv and parquet files are streamed: only one chunk is in memory at a time.
+    Legacy xls files cannot be streamed (xlrd parses the whole file), they are read at once
+    and then split into chunks.
+
+    Parameters
+    ----------
+    file_in: str
+        metadata file (xls, xlsx, csv, tsv or parquet)
+    chunk_size: int
+        number of lines per chunk
+
+    Returns
+    -------
+    (pandas.DataFrame, iterator of pandas.DataFrame)
+        instructions sheet (None for csv/tsv/parquet exports), and chunks of Submissions
+        sheet. All cells are read as str.
+    """
+    import pandas as pd
+
+    ext = os.path.splitext(file_in)[1].lower()
+    if ext in [".xlsx", ".xlsm"]:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(file_in, read_only=True, data_only=True)
+        instructions = sheet_to_df(wb.worksheets[0])
+        return instructions, iter_sheet(wb, chunk_size)
+    if ext in [".csv", ".tsv", ".txt"]:
+        sep = "," if ext == ".csv" else "\t"
+        return None, pd.read_csv(file_in, sep=sep, header=0, dtype=str, chunksize=chunk_size)
+    if ext in [".parquet", ".pq"]:
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(file_in).iter_batches(batch_size=chunk_size)
+        return None, iter_batches(batches)
+    instructions, md = read_workbook(file_in)
+    return instructions, (md.iloc[start:start + chunk_size].copy()
+                          for start in range(0, len(md), chunk_size))
+
+
+def iter_batches(batches):
+    """
+    Convert pyarrow record batches to DataFrames of str, numbering lines from the start of
+    the file (as for other formats)
+    """
+    start = 0
+    for batch in batches:
+        md = batch.to_pandas().apply(lambda col: col.map(cell_text, na_action="ignore"))
+        md.index = range(start, start + len(md))
+        start += len(md)
+        yield md
+
+
+def iter_sheet(wb, chunk_size):
+    """
+    Read Submissions sheet (2nd sheet) of a read-only openpyxl workbook by chunks of lines.
+    Workbook is closed once all lines are read.
+    """
+    import pandas as pd
+
+    try:
+        rows = wb.worksheets[1].iter_rows(values_only=True)
+        header = sheet_header(next(rows, ()))
+        index, chunk = [], []
+        for line, row in numbered(rows):
+            index.append(line)
+            chunk.append([cell_text(cell) for cell in row])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=header, dtype=object,
+                                   index=pd.Index(index, dtype=int))
+                index, chunk = [], []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header, dtype=object,
+                               index=pd.Index(index, dtype=int))
+    finally:
+        wb.close()
+
+
+def iter_rows(file_in):
+    """
+    Read Submissions sheet line by line, without pandas.
+
+    Returns
+    -------
+    iterator of lists
+        header, then each line (cells as given by read_workbook: str, or None if empty)
+    """
+    ext = os.path.splitext(file_in)[1].lower()
+    if ext in [".xlsx", ".xlsm"]:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(file_in, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[1].iter_rows(values_only=True)
+            yield sheet_header(next(rows, ()))
+            for row in filled(rows):
+                yield [cell_text(cell) for cell in row]
+        finally:
+            wb.close()
+    elif ext in [".csv", ".tsv", ".txt"]:
+        with open(file_in, newline="") as fi:
+            rows = csv.reader(fi, delimiter="," if ext == ".csv" else "\t")
+            yield next(rows, [])
+            for row in filled(rows):
+                yield [cell if cell != "" else None for cell in row]
+    elif ext in [".parquet", ".pq"]:
+        import pyarrow.parquet as pq
+
+        pfile = pq.ParquetFile(file_in)
+        yield pfile.schema_arrow.names
+        for batch in pfile.iter_batches():
+            for row in batch.to_pylist():
+                yield [cell_text(cell) for cell in row.values()]
+    else:
+        import xlrd
+
+        sheet = xlrd.open_workbook(file_in).sheet_by_index(1)
+        yield sheet_header(sheet.row_values(0) if sheet.nrows else ())
+        for row in filled(sheet.row_values(i) for i in range(1, sheet.nrows)):
+            yield [cell_text(cell) if cell != "" else None for cell in row]
+
+
+def categorize(md, ratio=CATEGORICAL_RATIO):
+    """
+    Store low-cardinality columns of metadata (empty cells already filled) as pandas
+    categoricals: each distinct value is kept once, and lines only hold its code. Most
+    columns of a bulk (location, lab, authors, type...) have few distinct values, so this
+    cuts memory by their repetition factor, and lets curation check categories instead
+    of lines (see data_curation.curate_column).
+
+    Parameters
+    ----------
+    md: pandas.DataFrame
+        metadata (Submissions sheet)
+    ratio: float
+        maximum share of distinct values in a column to store it as a categorical
+
+    Returns
+    -------
+    pandas.DataFrame
+        same metadata, with low-cardinality columns as categoricals
+    """
+    import pandas as pd
+
+    columns = {}
+    for column in md.columns:
+        dtype = md[column].dtype
+        if column in UNIQUE_COLUMNS:
+            continue
+        if not (dtype == object or isinstance(dtype, pd.StringDtype)):
+            continue
+        if md[column].nunique() <= ratio * len(md):
+            columns[column] = md[column].astype("category")
+    return md.assign(**columns) if columns else md
+
+
+class StreamingWriter:
+    """
+    Write curated metadata to a xlsx workbook chunk by chunk, with the list of cells
+    changed by curation.
+
+    The workbook is opened in openpyxl write-only mode: each line is written to disk when
+    it is added, so that the whole sheet is never kept in memory. The instructions sheet
+    is copied from the original file (cell values as stored, not as read by pandas, see
+    copy_instructions). Lines are written at their place in the original sheet (index of
+    md, see numbered): empty lines of the original sheet are kept empty.
+
+    Parameters
+    ----------
+    path: str
+        xlsx file to create
+    file_in: str
+        original metadata file, whose instructions sheet is copied (empty sheet for
+        csv/tsv/parquet exports)
+    diff: str
+        if given, tsv file where each cell changed by curation is written (see DiffWriter)
+    """
+
+    def __init__(self, path, file_in, diff=None):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        copy_instructions(file_in, self.wb.create_sheet("instructions"))
+        self.sheet = self.wb.create_sheet("Submissions")
+        self.header = False
+        self.next_line = 0  # position of the next line after the header
+        self.diff = DiffWriter(diff) if diff else None
+
+    def append(self, md, original=None):
+        """
+        Add lines of md to Submissions sheet (with header for the first chunk). If the
+        original lines are given, changed cells are added to the diff.
+        """
+        self.next_line = append_df(self.sheet, md, header=not self.header,
+                                   start=self.next_line)
+        self.header = True
+        if self.diff is not None and original is not None:
+            self.diff.append(original, md)
+
+    def close(self):
+        self.wb.save(self.path)
+        if self.diff is not None:
+            self.diff.close()
+
+    def discard(self):
+        """
+        Close without keeping the workbook: lines written so far are removed
+        """
+        # Saving closes the temporary files where lines were written
+        self.wb.save(self.path)
+        os.remove(self.path)
+        if self.diff is not None:
+            self.diff.close()
+            os.remove(self.diff.path)
+
+
+def copy_instructions(file_in, sheet):
+    """
+    Copy instructions sheet (1st sheet) of a xlsx or xls workbook to a write-only
+    openpyxl sheet, line by line, keeping cell values as they are stored (numbers, dates).
+    Nothing is copied for csv/tsv/parquet exports, which have no instructions sheet.
+
+    For xlsx workbooks, the layout of the sheet is copied too: style of each cell (font,
+    fill, border, alignment, number format, protection), merged cells, column widths and
+    row heights (see copy_layout). The sheet part of the original archive is not copied
+    as it is: its cells refer to the shared strings and styles of the original workbook,
+    which are not the ones of the curated workbook. Legacy xls workbooks are read with
+    xlrd, which only gives values.
+    """
+    ext = os.path.splitext(file_in)[1].lower()
+    if ext in [".xlsx", ".xlsm"]:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(file_in, read_only=True, data_only=True)
+        try:
+            source = wb.worksheets[0]
+            # Columns and rows must be set before the first line is written
+            copy_layout(file_in, source._worksheet_path, sheet)
+            for row in source.iter_rows():
+                sheet.append([styled_cell(sheet, cell) for cell in row])
+        finally:
+            wb.close()
+    elif ext == ".xls":
+        import xlrd
+
+        book = xlrd.open_workbook(file_in, on_demand=True)
+        try:
+            source = book.sheet_by_index(0)
+            for i in range(source.nrows):
+                sheet.append([cell if cell != "" else None for cell in source.row_values(i)])
+        finally:
+            book.release_resources()
+
+
+def styled_cell(sheet, cell):
+    """
+    Copy of a cell of a read-only openpyxl sheet, with its style, for a write-only sheet
+    """
+    from openpyxl.cell import WriteOnlyCell
+
+    copied = WriteOnlyCell(sheet, value=cell.value)
+    # Empty cells of read-only sheets have no style
+    if getattr(cell, "has_style", False):
+        copied.font = cell.font
+        copied.fill = cell.fill
+        copied.border = cell.border
+        copied.alignment = cell.alignment
+        copied.number_format = cell.number_format
+        copied.protection = cell.protection
+    return copied
+
+
+def copy_layout(file_in, part, sheet):
+    """
+    Copy column widths, row heights and merged cells of a sheet of a xlsx workbook to a
+    write-only openpyxl sheet. Read-only openpyxl sheets do not give them: they are read
+    from the xml part of the sheet in the archive, element by element.
+
+    Parameters
+    ----------
+    file_in: str
+        xlsx workbook
+    part: str
+        path of the sheet in the archive (e.g. 'xl/worksheets/sheet1.xml')
+    sheet: openpyxl.worksheet._write_only.WriteOnlyWorksheet
+        sheet where the layout is copied, before any line is written
+    """
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+    from openpyxl.utils import get_column_letter
+
+    with zipfile.ZipFile(file_in) as archive, archive.open(part) as xml:
+        for _, element in iterparse(xml):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag == "col" and element.get("width") is not None:
+                first, last = int(element.get("min")), int(element.get("max"))
+                dimension = sheet.column_dimensions[get_column_letter(first)]
+                dimension.min, dimension.max = first, last
+                dimension.width = float(element.get("width"))
+                dimension.hidden = element.get("hidden") in ["1", "true"]
+            elif tag == "row":
+                if element.get("r") is not None and element.get("ht") is not None:
+                    sheet.row_dimensions[int(element.get("r"))].height = float(
+                        element.get("ht"))
+                # Cells are read by openpyxl: only the row attributes are needed
+                element.clear()
+            elif tag == "mergeCell":
+                sheet.merged_cells.add(element.get("ref"))
+
+
+class DiffWriter:
+    """
+    Cells changed by curation, written to a tsv file chunk by chunk: one line per changed
+    cell, with its line in the original and curated workbooks (as numbered in Excel, empty
+    lines included: see numbered), the original virus name of the sequence, the column,
+    and the original and curated values.
+
+    Parameters
+    ----------
+    path: str
+        tsv file to create
+    """
+
+    HEADER = ["line", "sequence", "column", "original", "curated"]
+
+    def __init__(self, path):
+        self.path = path
+        self.out = open(path, "w", newline="")
+        self.writer = csv.writer(self.out, delimiter="\t")
+        self.writer.writerow(self.HEADER)
+        self.changes = 0
+
+    def append(self, original, curated):
+        """
+        Add cells which differ between original and curated lines (same index and columns)
+        """
+        import numpy as np
+
+        # Column by column: categorical columns are not copied to a whole object table
+        rows, cols, old, new = [], [], [], []
+        for col, column in enumerate(original.columns):
+            old_values = original[column].to_numpy(dtype=object)
+            new_values = curated[column].to_numpy(dtype=object)
+            changed = np.flatnonzero(old_values != new_values)
+            rows.append(changed)
+            cols.append(np.full(len(changed), col))
+            old.append(old_values[changed])
+            new.append(new_values[changed])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        if not len(rows):
+            return
+        # Line by line, in the order of columns
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        old, new = np.concatenate(old)[order], np.concatenate(new)[order]
+        # Excel lines: 1 for header, and index (position in the sheet) starts at 0
+        lines = original.index.to_numpy()[rows] + 2
+        columns = original.columns.to_numpy()[cols]
+        if "covv_virus_name" in original.columns:
+            seqs = original["covv_virus_name"].to_numpy(dtype=object)[rows]
+        else:
+            seqs = [""] * len(rows)
+        self.writer.writerows(zip(lines.tolist(), seqs, columns, old, new))
+        self.changes += len(rows)
+
+    def close(self):
+        self.out.close()
+
+
+def append_df(sheet, df, header=False, start=None):
+    """
+    Add lines of a DataFrame to a write-only openpyxl sheet (empty cells for empty values)
+
+    start: if given, position of the next line of the sheet (0 for the line after the
+           header): each line is written at the position given by its index, after empty
+           lines if needed (see numbered). Returns the position of the next line.
+    """
+    import pandas as pd
+
+    if header:
+        sheet.append([str(name) for name in df.columns])
+    for line, *row in df.itertuples(index=True, name=None):
+        while start is not None and start < line:
+            sheet.append([])
+            start += 1
+        sheet.append([cell if cell != "" and not pd.isna(cell) else None for cell in row])
+        start = line + 1 if start is not None else None
+    return start
+
+
+def file_key(file_in):
+    """
+    Key identifying a file in the cache: hash of its content and modification time
+    """
+    sha = hashlib.sha256()
+    with open(file_in, "rb") as fi:
+        for block in iter(lambda: fi.read(1 << 20), b""):
+            sha.update(block)
+    sha.update(str(os.stat(file_in).st_mtime_ns).encode())
+    return sha.hexdigest()
+
+
+def read_cached_workbook(file_in, cache_dir, cache_size=CACHE_SIZE):
+    """
+    Read sheets from the cache if this file was already parsed. Otherwise, parse it, and
+    save sheets to the cache.
+
+    See read_workbook for parameters
+    """
+    import pandas as pd
+
+    key = file_key(file_in)
+    md_file = os.path.join(cache_dir, f"{key}.md.feather")
+    instructions_file = os.path.join(cache_dir, f"{key}.instructions.feather")
+    if os.path.isfile(md_file):
+        md = pd.read_feather(md_file)
+        instructions = None
+        if os.path.isfile(instructions_file):
+            instructions = pd.read_feather(instructions_file)
+        # Most recently used files are kept in cache
+        for cached in glob.glob(os.path.join(cache_dir, f"{key}.*")):
+            os.utime(cached)
+        return instructions, md
+
+    instructions, md = read_workbook(file_in)
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        # Write instructions first: sheets are only read from cache if md file exists
+        if instructions is not None:
+            write_feather(instructions, instructions_file)
+        write_feather(md, md_file)
+    # pyarrow not installed, or sheet cannot be saved in feather format
+    except (ImportError, ValueError) as err:
+        print(f"Could not cache {file_in}: {err}")
+    evict_cache(cache_dir, cache_size)
+    return instructions, md
+
+
+def write_feather(df, path):
+    """
+    Write df to a feather file. File is first written to a temporary file, so that an
+    incomplete file is never read.
+    """
+    df.to_feather(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def evict_cache(cache_dir, cache_size=CACHE_SIZE):
+    """
+    Remove least recently used files from cache directory, until its size is at most
+    cache_size MB.
+    """
+    # {key: [last use, size, files]}
+    entries = {}
+    for cached in glob.glob(os.path.join(cache_dir, "*.feather")):
+        key = os.path.basename(cached).split(".")[0]
+        stat = os.stat(cached)
+        entry = entries.setdefault(key, [0, 0, []])
+        entry[0] = max(entry[0], stat.st_mtime)
+        entry[1] += stat.st_size
+        entry[2].append(cached)
+    total = sum(entry[1] for entry in entries.values())
+    for last_use, size, files in sorted(entries.values()):
+        if total <= cache_size * 1024 * 1024:
+            break
+        for cached in files:
+            os.remove(cached)
+        total -= size
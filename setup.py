@@ -64,12 +64,14 @@ setup(
     author_email='amandine.perrin@pasteur.fr',
     license='AGPL v3',
     platforms='OS Independent',
-    package_data={'': ['LICENSE']},
+    package_data={'': ['LICENSE'], 'gisaid_curation': ['data/gazetteer.tsv']},
     download_url='https://github.com/asetGem/gisaid-curation',
     url='https://github.com/asetGem/gisaid-curation',
     scripts=scripts,
     include_package_data=True,
     install_requires=requires,
+    # parquet/feather metadata files, and --cache
+    extras_require={'parquet': ['pyarrow']},
     tests_require=['pytest'],
     cmdclass={'test': PyTest},
     classifiers=classifiers
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Small bulks written on disk, to run curation on real files.
+"""
+
+import csv
+
+import pytest
+
+from gisaid_curation import utils
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.questions import Questions
+
+
+COLUMNS = ["fn", "covv_virus_name", "covv_type", "covv_passage", "covv_collection_date",
+           "covv_location", "covv_host", "covv_gender", "covv_patient_age",
+           "covv_seq_technology", "covv_assembly_method", "covv_coverage", "covv_orig_lab",
+           "covv_orig_lab_addr", "covv_subm_lab", "covv_subm_lab_addr", "covv_authors"]
+# 2nd header line of the GISAID template
+DESCRIPTIONS = ["filename", "Virus name", "Type", "Passage details/history",
+                "Collection date", "Location", "Host", "Gender", "Patient age",
+                "Sequencing technology", "Assembly method", "Coverage", "Originating lab",
+                "Address", "Submitting lab", "Address", "Authors"]
+# A line without anything to fix
+LINE = {"fn": "all.fasta", "covv_type": "betacoronavirus", "covv_passage": "Original",
+        "covv_collection_date": "2020-03-01", "covv_location": "Europe / France / Paris",
+        "covv_host": "Human", "covv_gender": "Male", "covv_patient_age": "45",
+        "covv_seq_technology": "Illumina MiSeq", "covv_assembly_method": "BWA-MEM",
+        "covv_coverage": "1,000x", "covv_orig_lab": "Institut Pasteur",
+        "covv_orig_lab_addr": "28 rue du Docteur Roux, Paris",
+        "covv_subm_lab": "Institut Pasteur", "covv_subm_lab_addr": "28 rue du Docteur Roux, Paris",
+        "covv_authors": "Jane Doe, John Doe"}
+
+
+def write_bulk(path, lines):
+    """
+    Write a bulk (csv export of Submissions sheet). 'lines': changes to LINE for each line,
+    with at least its virus name
+    """
+    with open(path, "w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        writer.writerow(DESCRIPTIONS)
+        for line in lines:
+            values = {**LINE, **line}
+            writer.writerow([values[column] for column in COLUMNS])
+    return str(path)
+
+
+def vname(i, country="France"):
+    return f"hCoV-19/{country}/IPP{i:05}/2020"
+
+
+def questions_run(file_in, decisions, **kwargs):
+    """
+    Non-interactive run (-q) of file_in: questions left, keyed by (column, value)
+    """
+    from gisaid_curation import data_curation
+
+    utils.init_logger(file_in, "gisaid_curation")
+    try:
+        questions = data_curation.cure_metadata(file_in, decisions, f"{file_in}.questions.tsv",
+                                                **kwargs)
+    finally:
+        utils.close_logger("gisaid_curation")
+    return questions if questions is not None else Questions()
+
+
+@pytest.fixture
+def decisions(tmp_path):
+    store = DecisionStore(str(tmp_path / "decisions.sqlite"), "tester")
+    yield store
+    store.close()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for batch: several files curated in parallel, with virus names unique across files.
+"""
+
+import os
+import csv
+import sys
+import subprocess
+
+from gisaid_curation.batch import cure_batch
+from gisaid_curation.questions import read_answers
+from gisaid_curation.registry import VirusNameRegistry
+
+from conftest import write_bulk, vname
+from test_questions import answer_all
+
+
+def curated_names(file_in):
+    """
+    {original: curated} virus names changed in the curated file
+    """
+    with open(f"{file_in}.curated.diff.tsv", newline="") as diff:
+        return {line["original"]: line["curated"] for line in csv.DictReader(diff, delimiter="\t")
+                if line["column"] == "covv_virus_name"}
+
+
+def test_same_name_in_two_files(tmp_path, decisions):
+    first = write_bulk(tmp_path / "a.csv", [{"covv_virus_name": vname(1)},
+                                            {"covv_virus_name": vname(2)}])
+    second = write_bulk(tmp_path / "b.csv", [{"covv_virus_name": vname(3)},
+                                             {"covv_virus_name": vname(1)}])
+    registry = str(tmp_path / "registry.sqlite")
+    questions_file = str(tmp_path / "questions.tsv")
+    assert cure_batch([first, second], decisions, questions_file, registry, jobs=2) == [
+        first, second]
+    answer_all(questions_file, {})
+    read_answers(questions_file, decisions)
+
+    # Both files can be curated, but the name of the first one is taken by the second
+    assert cure_batch([first, second], decisions, questions_file, registry, jobs=2) == [second]
+    assert os.path.exists(f"{first}.curated.xlsx")
+    assert not os.path.exists(f"{second}.curated.xlsx")
+    with open(questions_file, newline="") as qf:
+        questions = [(line["column"], line["value"], line["proposal"])
+                     for line in csv.DictReader(qf, delimiter="\t")]
+    assert questions == [("covv_virus_name", vname(1), "")]
+    # Names of the curated file only are released
+    released = VirusNameRegistry(registry)
+    assert released.released([vname(1), vname(2), vname(3)]) == {vname(1), vname(2)}
+    released.close()
+
+    answer_all(questions_file, {"covv_virus_name": vname(4)})
+    read_answers(questions_file, decisions)
+    assert cure_batch([second], decisions, questions_file, registry, jobs=2) == []
+    assert curated_names(second) == {vname(1): vname(4)}
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_resume_refused_for_batch(tmp_path):
+    files = [write_bulk(tmp_path / f"{name}.csv", [{"covv_virus_name": vname(i)}])
+             for i, name in enumerate("ab")]
+    run = subprocess.run([sys.executable, os.path.join(ROOT, "bin", "gisaid_curation"),
+                          "-f", *files, "--resume"],
+                         capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT})
+    assert run.returncode == 1
+    assert "--resume is only available when curating a single file" in run.stderr
+    assert not os.path.exists(f"{files[0]}.curated.xlsx")
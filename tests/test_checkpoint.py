@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for checkpoint: interactive session stopped, then resumed (--resume) without asking
+the questions already answered.
+"""
+
+import os
+import sys
+import csv
+import subprocess
+
+import pytest
+
+from conftest import write_bulk, vname
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+# Virus names without identifier: the curator must type them (or STOP)
+LINES = [{"covv_virus_name": vname(1)},
+         {"covv_virus_name": "hCoV-19/France/2020"},
+         {"covv_virus_name": "hCoV-19/Spain/2020"}]
+
+
+def session(bulk, answers, resume=False):
+    """
+    Interactive session (decisions only kept in memory): answers typed by the curator,
+    end of input if answers are missing (as Ctrl-D)
+    """
+    return subprocess.run([sys.executable, os.path.join(ROOT, "bin", "gisaid_curation"),
+                           "-f", bulk] + (["--resume"] if resume else []),
+                          input="".join(f"{answer}\n" for answer in answers),
+                          capture_output=True, text=True,
+                          env={**os.environ, "PYTHONPATH": ROOT})
+
+
+@pytest.mark.parametrize("stop", ["STOP", None])
+def test_resume(tmp_path, stop):
+    bulk = write_bulk(tmp_path / "bulk.csv", LINES)
+    # Location accepted, 1st name typed, then stopped at the 2nd name (STOP or Ctrl-D)
+    first = session(bulk, ["", vname(2)] + ([stop] if stop else []))
+    assert first.returncode != 0
+    assert os.path.isfile(f"{bulk}.checkpoint.json")
+    assert not os.path.isfile(f"{bulk}.curated.xlsx")
+
+    # Only the 2nd name is asked again, then passage, authors, assembly, technology
+    second = session(bulk, [vname(3), "", "", "", ""], resume=True)
+    assert second.returncode == 0, second.stderr
+    assert "Resuming session" in second.stdout
+    assert "Is location" not in second.stdout
+    assert second.stdout.count("Please give correct virus name") == 1
+    assert not os.path.isfile(f"{bulk}.checkpoint.json")
+    with open(f"{bulk}.curated.diff.tsv", newline="") as diff:
+        names = [(line["original"], line["curated"]) for line in csv.DictReader(
+            diff, delimiter="\t") if line["column"] == "covv_virus_name"]
+    assert names == [("hCoV-19/France/2020", vname(2)), ("hCoV-19/Spain/2020", vname(3))]
+
+
+def test_changed_line_checked_again(tmp_path):
+    bulk = write_bulk(tmp_path / "bulk.csv", LINES)
+    session(bulk, ["", vname(2), "STOP"])
+    # Line of the typed name changed in between: its name is asked again
+    write_bulk(bulk, [LINES[0], {"covv_virus_name": "hCoV-19/Italy/2020"}, LINES[2]])
+    second = session(bulk, [vname(4), vname(3), "", "", "", ""], resume=True)
+    assert second.returncode == 0, second.stderr
+    assert "1 lines changed since the session was stopped" in second.stdout
+    assert second.stdout.count("Please give correct virus name") == 2
+    assert "Is location" not in second.stdout
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for chunked mode (--chunk-size): files read, curated and written chunk by chunk give
+the same curated file as when they are read at once.
+"""
+
+import csv
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from gisaid_curation.questions import record_answer
+from gisaid_curation.workbook import iter_workbook
+
+from conftest import COLUMNS, DESCRIPTIONS, LINE, write_bulk, vname, questions_run
+
+
+# Values fixed by curation, repeated across chunks
+LINES = [{"covv_virus_name": vname(i), "covv_host": ["human", "Human", "cat"][i % 3],
+          "covv_gender": ["m", "Female", "unknown"][i % 4 % 3],
+          "covv_coverage": ["1000x", "1,000x", "250 X"][i % 3],
+          "covv_location": ["Europe / France / Paris", "europe/ france"][i % 2]}
+         for i in range(1, 12)]
+
+
+def write(tmp_path, ext):
+    """
+    Write LINES in a bulk of this format
+    """
+    path = write_bulk(tmp_path / "bulk.csv", LINES)
+    if ext == ".csv":
+        return path
+    md = pd.read_csv(path, dtype=str)
+    path = str(tmp_path / f"bulk{ext}")
+    if ext == ".parquet":
+        md.to_parquet(path)
+        return path
+    wb = Workbook()
+    wb.active.title = "Instructions"
+    sheet = wb.create_sheet("Submissions")
+    for row in [COLUMNS, *md.itertuples(index=False, name=None)]:
+        sheet.append(list(row))
+    wb.save(path)
+    return path
+
+
+def curate(file_in, decisions, chunk_size):
+    """
+    Curate file_in, accepting all proposals: curated lines, and lines of the diff
+    """
+    questions = questions_run(file_in, decisions, chunk_size=chunk_size)
+    for (column, value), info in questions.questions.items():
+        record_answer(decisions, column, value, info["proposal"], "y")
+    assert len(questions_run(file_in, decisions, chunk_size=chunk_size)) == 0
+    sheet = load_workbook(f"{file_in}.curated.xlsx", read_only=True)["Submissions"]
+    lines = [list(row) for row in sheet.iter_rows(values_only=True)]
+    with open(f"{file_in}.curated.diff.tsv", newline="") as diff:
+        changes = [tuple(line) for line in csv.reader(diff, delimiter="\t")]
+    return lines, changes
+
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx", ".parquet"])
+def test_chunks(tmp_path, ext):
+    path = write(tmp_path, ext)
+    _, chunks = iter_workbook(path, 5)
+    chunks = list(chunks)
+    assert [len(chunk) for chunk in chunks] == [5, 5, 2]
+    # Lines numbered from the start of the file, 2nd header line included
+    assert [line for chunk in chunks for line in chunk.index] == list(range(12))
+    assert chunks[0].iloc[0].tolist() == DESCRIPTIONS
+    assert chunks[2].iloc[-1]["covv_virus_name"] == vname(11)
+
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx"])
+@pytest.mark.parametrize("chunk_size", [1, 4])
+def test_same_as_whole_file(tmp_path, decisions, ext, chunk_size):
+    whole = tmp_path / "whole"
+    chunked = tmp_path / "chunked"
+    whole.mkdir()
+    chunked.mkdir()
+    lines, changes = curate(write(whole, ext), decisions, None)
+    assert (lines, changes) == curate(write(chunked, ext), decisions, chunk_size)
+    # Sanity check: the file was curated
+    assert [line[COLUMNS.index("covv_host")] for line in lines[2:5]] == ["Human", "Cat", "Human"]
+    assert ("covv_gender", "m", "Male") in {change[2:] for change in changes}
+    assert all(line[COLUMNS.index("covv_type")] == LINE["covv_type"] for line in lines[2:])
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for clusters: grouping of near-identical labs, addresses and authors.
+"""
+
+from gisaid_curation.clusters import cluster_key, find_clusters
+
+
+def test_cluster_key():
+    assert cluster_key("Institut Pasteur, Paris") == "institut pasteur paris"
+    assert cluster_key(" institut  pasteur - PARIS ") == "institut pasteur paris"
+    assert cluster_key("Hôpital Bichat_Claude-Bernard") == "hopital bichat claude bernard"
+    assert cluster_key(" - ") == ""
+
+
+def test_find_clusters():
+    values = ["Institut Pasteur, Paris", "Hopital Necker", "Institut Pasteur Paris",
+              "Hôpital Necker", "institut pasteur - paris", "Institut Pastuer, Paris",
+              "Institut Curie"]
+    assert find_clusters(values) == [
+        ["Institut Pasteur, Paris", "Institut Pasteur Paris", "institut pasteur - paris",
+         "Institut Pastuer, Paris"],
+        ["Hopital Necker", "Hôpital Necker"],
+    ]
+
+
+def test_find_clusters_numbers():
+    values = ["Laboratory 1", "Laboratory 12", "12 rue du Docteur Roux, Paris",
+              "13 rue du Docteur Roux, Paris", "12, rue du docteur Roux Paris"]
+    assert find_clusters(values) == [["12 rue du Docteur Roux, Paris",
+                                      "12, rue du docteur Roux Paris"]]
+
+
+def test_find_clusters_none():
+    assert find_clusters([]) == []
+    assert find_clusters(["", " ", "Smith J", "Doe A"]) == []
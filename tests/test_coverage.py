@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for coverage: numbers, comparison signs and ranges read and formatted, checked with
+parse_coverages (many coverages at once) and parse_coverage (one coverage).
+"""
+
+import pytest
+
+from gisaid_curation.coverage import parse_coverages, parse_coverage
+
+
+def parse(value):
+    """
+    Formatted coverage of value, checking both functions give it
+    """
+    cov = parse_coverages([value])[0]
+    assert parse_coverage(value) == cov
+    return cov
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("4000", "4,000x"), ("4000X", "4,000x"), ("4,000", "4,000x"), ("4,000 x", "4,000x"),
+    (" 4000x ", "4,000x"), ("1234567x", "1,234,567x"), ("0x", "0x"),
+    ("12.5x", "12.5x"), ("12.50x", "12.5x"), ("4,000.5x", "4,000.5x"),
+])
+def test_numbers(value, expected):
+    assert parse(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    # Decimals or exponent given: kept as a float, as before coverages were parsed at once
+    # ('4.000' is 4, not 4,000 written with a '.' as thousands separator)
+    ("4.000", "4.0x"), ("4.0x", "4.0x"), ("4.5e3", "4,500.0x"), ("4.5E3x", "4,500.0x"),
+    ("1e+3", "1,000.0x"),
+])
+def test_floats(value, expected):
+    assert parse(value) == expected
+
+
+@pytest.mark.parametrize("value", ["4,00x", "40,00", "4 000x", "4000xx", "x4000"])
+def test_wrong_separators(value):
+    assert parse(value) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    (">1000x", ">1,000x"), (">=1000x", ">=1,000x"), ("> 1000 x", ">1,000x"),
+    ("<100", "<100x"), ("~ 500x", "~500x"), ("=100x", None),
+])
+def test_signs(value, expected):
+    assert parse(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("100-200x", "100-200x"), ("100x-200x", "100-200x"), ("100 - 200", "100-200x"),
+    ("100x to 200x", "100-200x"), ("100 TO 200", "100-200x"), ("100-100x", "100-100x"),
+    ("1,000-2,000x", "1,000-2,000x"), ("100.5-200x", "100.5-200x"),
+    # Reversed or incomplete ranges
+    ("200-100x", None), ("100-", None), ("-100", None),
+])
+def test_ranges(value, expected):
+    assert parse(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", "unknown"), ("unknown", "unknown"), ("UNKNOWN", "unknown"), (None, "unknown"),
+    (float("nan"), "unknown"),
+    # Text, even the text of a missing value, cannot be read
+    ("nan", None), ("high", None), ("N/A", None),
+])
+def test_unknown(value, expected):
+    assert parse(value) == expected
+
+
+def test_many_coverages():
+    values = ["4000", "", "200-100x", "4000", "4.000", ">1000x"]
+    # One result per value, in the same order, duplicates included
+    assert list(parse_coverages(values)) == ["4,000x", "unknown", None, "4,000x", "4.0x",
+                                             ">1,000x"]
+    assert len(parse_coverages([])) == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for curate_column: a column stored as a categorical (see workbook.categorize) must be
+checked, and curated, as the same column stored as strings.
+"""
+
+import pandas as pd
+import pytest
+
+from gisaid_curation.data_curation import curate_column
+from gisaid_curation.workbook import categorize
+
+
+def metadata():
+    hosts = ["Host", "human", "Human", "human", "cat", "Human", "dog", "human", "cat", "Human"]
+    return pd.DataFrame({
+        "fn": ["filename"] + ["a.fasta"] * (len(hosts) - 1),
+        "covv_virus_name": ["Virus name"] + [f"v{i}" for i in range(1, len(hosts))],
+        "covv_host": hosts,
+    })
+
+
+def curate(md, skip=None):
+    """
+    Curate host column, capitalizing each value ('skip': value from which the column is
+    skipped). Returns values checked (with the first sequence having them), and results
+    """
+    checked = []
+
+    def cure_value(value, seq):
+        checked.append((value, seq))
+        return None if value == skip else value.capitalize()
+
+    rows = md["fn"] != "filename"
+    ori_values, new_values = curate_column(md, rows, "covv_host", cure_value)
+    return checked, list(ori_values), list(new_values), list(md["covv_host"])
+
+
+@pytest.mark.parametrize("skip", [None, "cat", "human"])
+def test_categorical_same_as_strings(skip):
+    md = metadata()
+    md_cat = categorize(metadata())
+    assert isinstance(md_cat["covv_host"].dtype, pd.CategoricalDtype)
+    assert curate(md_cat, skip) == curate(md, skip)
+
+
+def test_categorical_recoded():
+    md = categorize(metadata())
+    curate(md)
+    assert isinstance(md["covv_host"].dtype, pd.CategoricalDtype)
+    assert sorted(md["covv_host"].cat.categories) == ["Cat", "Dog", "Host", "Human"]
+
+
+def test_categorize():
+    md = categorize(metadata())
+    # Unique values are never stored as categoricals
+    assert not isinstance(md["covv_virus_name"].dtype, pd.CategoricalDtype)
+    assert isinstance(md["fn"].dtype, pd.CategoricalDtype)
+    assert list(md["fn"]) == list(metadata()["fn"])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for dates: formats accepted, impossible dates, dates in the future and Excel serial
+numbers, checked with normalize_dates (many dates at once) and normalize_date (one date).
+"""
+
+import datetime
+
+import pytest
+
+from gisaid_curation.dates import normalize_dates, normalize_date
+
+
+TODAY = datetime.date(2021, 3, 15)
+
+
+def normalize(value):
+    """
+    Normalized date and reason of value, checking both functions give them
+    """
+    dates, reasons = normalize_dates([value], TODAY)
+    assert normalize_date(value, TODAY) == (dates[0], reasons[0])
+    return dates[0], reasons[0]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2020", "2020"), ("2020-03", "2020-03"), ("2020-3-1", "2020-03-01"),
+    # Read by Excel as a date
+    ("2020-03-01 00:00:00", "2020-03-01"),
+    (" 2020-03-01 ", "2020-03-01"),
+])
+def test_formats(value, expected):
+    assert normalize(value) == (expected, None)
+
+
+@pytest.mark.parametrize("value", [
+    "01/03/2020", "2020/03/01", "20-03-01", "March 2020", "2020-", "202", "2020-003-01",
+    # Time of the day: not only a date read by Excel
+    "2020-03-01 12:00:00",
+    # Text of a missing value, not a missing value
+    "nan",
+])
+def test_wrong_format(value):
+    assert normalize(value) == (None, "wrong format")
+
+
+@pytest.mark.parametrize("value", ["", "  ", "unknown", "UNKNOWN", " Unknown ", None,
+                                   float("nan")])
+def test_unknown(value):
+    assert normalize(value) == ("unknown", None)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2020-02-29", "2020-02-29"), ("2000-02-29", "2000-02-29"),
+    # Not leap years: every 4 years, but not every 100 years unless every 400 years
+    ("2021-02-29", None), ("1900-02-29", None),
+])
+def test_leap_days(value, expected):
+    assert normalize(value) == (expected, None if expected else "impossible date")
+
+
+@pytest.mark.parametrize("value", ["2020-13-01", "2020-00", "2020-04-31", "2020-01-00",
+                                   "2020-01-32", "1899-12-31", "0999"])
+def test_impossible(value):
+    assert normalize(value) == (None, "impossible date")
+
+
+@pytest.mark.parametrize("value, future", [
+    # Compared with today at the precision of the date given: the current year or month
+    # can be given, even if it is not over yet
+    ("2021", False), ("2022", True), ("2021-03", False), ("2021-04", True),
+    ("2021-03-15", False), ("2021-03-16", True), ("2021-12-31", True),
+])
+def test_future(value, future):
+    assert normalize(value) == ((None, "date in the future") if future else (value, None))
+
+
+def test_future_default_today():
+    next_year = str(datetime.date.today().year + 1)
+    assert normalize_date(next_year) == (None, "date in the future")
+    assert normalize_dates([next_year])[1][0] == "date in the future"
+
+
+@pytest.mark.parametrize("value, expected", [
+    # Days since 1899-12-30, as Excel gives them when a date cell is read as a number
+    ("43891", ("2020-03-01", None)), ("43891.0", ("2020-03-01", None)),
+    ("43890", ("2020-02-29", None)), ("10000", ("1927-05-18", None)),
+    ("44270", ("2021-03-15", None)), ("44271", (None, "date in the future")),
+    ("99999", (None, "date in the future")),
+    # Part of a day, or more than 5 digits: not a serial number
+    ("43891.5", (None, "wrong format")), ("0043891", (None, "wrong format")),
+])
+def test_excel_serial(value, expected):
+    assert normalize(value) == expected
+
+
+def test_many_dates():
+    values = ["2020-3-1", "", "2021-02-29", "2020-3-1", "43891", "2022", "01/03/2020"]
+    dates, reasons = normalize_dates(values, TODAY)
+    # One result per value, in the same order, duplicates included
+    assert list(dates) == ["2020-03-01", "unknown", None, "2020-03-01", "2020-03-01", None,
+                           None]
+    assert list(reasons) == [None, None, "impossible date", None, None, "date in the future",
+                             "wrong format"]
+    dates, reasons = normalize_dates([], TODAY)
+    assert len(dates) == len(reasons) == 0
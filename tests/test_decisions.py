@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for decisions: answers saved on disk, replayed in next runs, and evicted.
+"""
+
+import sqlite3
+
+from gisaid_curation import decisions as decisions_module
+from gisaid_curation.decisions import DecisionStore
+from gisaid_curation.questions import read_answers
+
+from conftest import write_bulk, vname, questions_run
+from test_questions import answer_all
+
+
+def test_reload(tmp_path):
+    path = str(tmp_path / "decisions.sqlite")
+    store = DecisionStore(path, "alice")
+    store.record("covv_location", "France", "Europe / France")
+    store.record("covv_authors", "J. Doe", "J. Doe", accepted=False)
+    store.close()
+    store = DecisionStore(path, "bob")
+    assert store.get("covv_location", "France") == ("Europe / France", True)
+    assert store.get("covv_authors", "J. Doe") == ("J. Doe", False)
+    assert store.get("covv_location", "Spain") is None
+    # A new answer for the same value replaces the old one, with its curator
+    store.record("covv_location", "France", "Europe / France / Paris")
+    store.close()
+    con = sqlite3.connect(path)
+    assert con.execute("SELECT value, curator FROM decisions WHERE original = 'France'"
+                       ).fetchall() == [("Europe / France / Paris", "bob")]
+    con.close()
+
+
+def test_evict(tmp_path, monkeypatch):
+    path = str(tmp_path / "decisions.sqlite")
+    store = DecisionStore(path)
+    monkeypatch.setattr(decisions_module.time, "time", lambda: 1000 * 24 * 3600)
+    store.record("covv_location", "France", "Europe / France")
+    store.record("covv_host", "human", "Human")
+    monkeypatch.setattr(decisions_module.time, "time", lambda: 1010 * 24 * 3600)
+    store.record("covv_location", "Spain", "Europe / Spain")
+    # Older than 5 days
+    assert store.evict(max_age=5) == 2
+    assert list(store.answers) == [("covv_location", "Spain")]
+    assert store.evict(fields=["covv_location"]) == 1
+    assert store.answers == {}
+    store.close()
+    # Evicted decisions are removed from the file too
+    assert DecisionStore(path).answers == {}
+
+
+def test_shared_across_runs(tmp_path):
+    """
+    Answers given in a run are not asked again in the next runs, on another file
+    """
+    path = str(tmp_path / "decisions.sqlite")
+    first = write_bulk(tmp_path / "first.csv", [{"covv_virus_name": vname(1)}])
+    second = write_bulk(tmp_path / "second.csv", [{"covv_virus_name": vname(2)}])
+    store = DecisionStore(path, "alice")
+    asked = questions_run(first, store)
+    assert len(asked)
+    answer_all(f"{first}.questions.tsv", {})
+    read_answers(f"{first}.questions.tsv", store)
+    store.close()
+    store = DecisionStore(path, "bob")
+    assert len(questions_run(second, store)) == 0
+    store.close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for gazetteer: locations fixed with known places, and countries of virus names
+compared with locations.
+"""
+
+import pytest
+
+from gisaid_curation.gazetteer import load_gazetteer, country_key, CountryMatcher
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return load_gazetteer()
+
+
+def test_normalize(gazetteer):
+    assert gazetteer.normalize(["USA", "Wyoming"]) == (["North America", "USA", "Wyoming"],
+                                                       True)
+    # Typos and truncated names are fixed, but checked by the curator
+    assert gazetteer.normalize(["Europe", "Frnace"]) == (["Europe", "France"], False)
+    assert gazetteer.normalize(["Europe", "Luxemburg"]) == (["Europe", "Luxembourg"], False)
+    assert gazetteer.normalize(["Eurpoe", "France"]) == (["Europe", "France"], False)
+    assert gazetteer.normalize(["north amer", "usa", "wyom"]) == (
+        ["North America", "USA", "Wyoming"], False)
+    # Aliases are sure
+    assert gazetteer.normalize(["UK", "England"])[1] is True
+    # Continent given, but not the one of the country: the curator must check it
+    assert gazetteer.normalize(["Oceania", "Austria"]) == (["Europe", "Austria"], False)
+    # Ambiguous names
+    assert gazetteer.normalize(["Africa", "Congo"])[1] is False
+    assert gazetteer.normalize(["Asia", "Korea"])[1] is False
+
+
+def test_country_key():
+    assert country_key("U.S.") == "us"
+    assert country_key("Côte d’Ivoire") == country_key("Cote d'Ivoire")
+    assert country_key(" Guinea-Bissau ") == "guinea bissau"
+
+
+def test_country_index(gazetteer):
+    index = gazetteer.country_index
+    assert index["uk"] == index["gb"] == index["gbr"] == "United Kingdom"
+    assert index["us"] == index["united states"] == "USA"
+    assert index["turkiye"] == "Turkey"
+    assert "congo" not in index
+
+
+PAIRS = [
+    ("France", "Europe / France / Paris", True),
+    ("FR", "Europe / France", True),
+    ("UK", "Europe / United Kingdom / England", True),
+    ("England", "Europe / United Kingdom / England", True),
+    ("England", "Europe / United Kingdom / Scotland", False),
+    ("United States", "North America / USA / Texas", True),
+    ("Niger", "Africa / Nigeria", False),
+    ("Türkiye", "Asia / Turkey", True),
+    ("Spain", "Europe / France", False),
+    ("France", "Europe", False),
+    ("", "Europe / France", False),
+]
+
+
+@pytest.mark.parametrize("country, location, same", PAIRS)
+def test_matcher(gazetteer, country, location, same):
+    assert CountryMatcher(gazetteer)(country, location) is same
+
+
+def test_matcher_add_all(gazetteer):
+    matcher = CountryMatcher(gazetteer)
+    matcher.add_all([country for country, _, _ in PAIRS], [loc for _, loc, _ in PAIRS])
+    assert [matcher.known[(country, loc)] for country, loc, _ in PAIRS] == \
+        [same for _, _, same in PAIRS]
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for journal: log messages saved as records, and written to the journal files.
+"""
+
+import json
+import logging
+
+from gisaid_curation import utils
+from gisaid_curation.journal import Journal, change
+
+from conftest import write_bulk, vname, questions_run
+
+
+def read(path):
+    with open(path) as fi:
+        return fi.read()
+
+
+def test_buffer(tmp_path):
+    prefix = str(tmp_path / "bulk.csv")
+    journal = Journal(prefix, buffer_size=2)
+    journal.add("INFO", "changed host", 3, "v1", "covv_host", "cat", "Cat")
+    # Nothing written until the buffer is full
+    assert read(f"{prefix}.changes.log") == ""
+    journal.add("ERROR", "name already used", 4, "v2", "covv_virus_name", "v2", "v3")
+    assert read(f"{prefix}.changes.log") == ("INFO :: changed host\n"
+                                              "ERROR :: name already used\n")
+    journal.add("WARNING", "coverage changed", None, None, "covv_coverage", "4 X", "4x")
+    journal.flush()
+    assert read(f"{prefix}.contact_sub.log") == ("ERROR :: name already used\n"
+                                                  "WARNING :: coverage changed\n")
+    assert read(f"{prefix}.virus_IDs.txt") == "v2\tv3\n"
+    records = [json.loads(line) for line in read(f"{prefix}.changes.jsonl").splitlines()]
+    assert records[0] == {"row": 3, "sequence": "v1", "column": "covv_host", "old": "cat",
+                          "new": "Cat", "severity": "INFO", "reason": "changed host"}
+    assert [record["row"] for record in records] == [3, 4, None]
+    # A new journal on the same file starts empty
+    Journal(prefix)
+    assert read(f"{prefix}.changes.log") == ""
+
+
+def test_logger(tmp_path):
+    prefix = str(tmp_path / "bulk.csv")
+    utils.init_logger(prefix, "gisaid_curation")
+    logger = logging.getLogger("gisaid_curation.metadata")
+    for i in range(50):
+        logger.info(f"message {i}", extra=change("covv_host", "cat", "Cat", f"v{i}", i))
+    logger.error("no lab", extra=change("covv_orig_lab", "", "unknown", "v50", 50))
+    utils.close_logger("gisaid_curation")
+    # Messages in the order they were logged, all written when the logger is closed
+    assert read(f"{prefix}.changes.log").splitlines() == (
+        [f"INFO :: message {i}" for i in range(50)] + ["ERROR :: no lab"])
+    assert read(f"{prefix}.contact_sub.log") == "ERROR :: no lab\n"
+
+
+def test_curation_journal(tmp_path, decisions):
+    bulk = write_bulk(tmp_path / "bulk.csv", [
+        {"covv_virus_name": vname(1)},
+        {"covv_virus_name": "hCov-19/France/IPP00002/2020", "covv_host": "cat"}])
+    questions_run(bulk, decisions)
+    assert read(f"{bulk}.virus_IDs.txt") == f"hCov-19/France/IPP00002/2020\t{vname(2)}\n"
+    records = [json.loads(line) for line in read(f"{bulk}.changes.jsonl").splitlines()]
+    host = [record for record in records if record["column"] == "covv_host"]
+    # Row: index of the line in the Submissions sheet (0 for the 2nd header line)
+    assert [(record["row"], record["sequence"], record["old"], record["new"])
+            for record in host] == [(2, vname(2), "cat", "Cat")]
+    assert (f"WARNING :: Changed sequence name 'hCov-19/France/IPP00002/2020' to "
+            f"'{vname(2)}'") in read(f"{bulk}.contact_sub.log")
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for pipeline: chunks read (Lookahead) and written (BackgroundWriter) in background
+threads, in the order of the file.
+"""
+
+import time
+import random
+
+import pandas as pd
+import pytest
+
+from gisaid_curation.gazetteer import load_gazetteer
+from gisaid_curation.pipeline import BackgroundWriter, Lookahead
+
+from conftest import COLUMNS, DESCRIPTIONS, LINE, vname
+
+
+def chunk(start, size, **values):
+    """
+    Lines start to start+size of Submissions sheet (2nd header line for line 0)
+    """
+    lines = [DESCRIPTIONS if i == 0 else [{**LINE, "covv_virus_name": vname(i), **values}[column]
+                                          for column in COLUMNS]
+             for i in range(start, start + size)]
+    return pd.DataFrame(lines, columns=COLUMNS, index=range(start, start + size))
+
+
+class Reader:
+    """
+    Chunks of the file, read slowly, keeping how many were read
+    """
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.read = 0
+
+    def __iter__(self):
+        for md in self.chunks:
+            time.sleep(0.01)
+            self.read += 1
+            yield md
+        if self.error is not None:
+            raise self.error
+
+
+class Writer:
+    """
+    StreamingWriter writing chunks in random time, keeping the order they are written in
+    """
+
+    path = "curated.xlsx"
+
+    def __init__(self, fail_at=None):
+        self.written = []
+        self.fail_at = fail_at
+        self.closed = False
+        self.discarded = False
+
+    def append(self, md, original=None):
+        time.sleep(random.random() / 100)
+        if len(self.written) == self.fail_at:
+            raise OSError("disk full")
+        self.written.append((list(md.index), original is not None))
+
+    def close(self):
+        self.closed = True
+
+    def discard(self):
+        self.discarded = True
+
+
+def test_lookahead_order():
+    chunks = [chunk(0, 3), chunk(3, 3, covv_collection_date="2020-3-1"),
+              chunk(6, 3, covv_location="Europe / Frnace", covv_coverage="4000")]
+    reader = Reader(chunks)
+    read = []
+    for md, prepared in Lookahead(reader, load_gazetteer(), depth=1):
+        # Main thread slower than the reader: at most 1 chunk queued, and 1 waiting to be queued
+        time.sleep(0.05)
+        assert reader.read <= len(read) + 3
+        read.append(list(md.index))
+        # 2nd header line not prepared
+        assert "Collection date" not in prepared.get("covv_collection_date")
+        assert prepared.get("covv_location")[md["covv_location"].iloc[-1]][0][:2] == [
+            "Europe", "France"]
+    assert read == [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+    assert prepared.get("covv_coverage") == {"4000": "4,000x"}
+    assert prepared.get("covv_location")["Europe / Frnace"] == (["Europe", "France"], False)
+
+
+def test_lookahead_prepared():
+    md, prepared = next(iter(Lookahead([chunk(1, 2, covv_collection_date="2020-3-1")])))
+    assert prepared.get("covv_collection_date") == {"2020-3-1": ("2020-03-01", None)}
+    # No gazetteer: locations not prepared
+    assert prepared.get("covv_location") == {}
+    # Empty cells filled
+    md = next(iter(Lookahead([chunk(1, 1).replace("45", None)])))[0]
+    assert md["covv_patient_age"].tolist() == [""]
+
+
+def test_lookahead_error():
+    reader = Reader([chunk(0, 2), chunk(2, 2)], error=ValueError("bad file"))
+    read = []
+    with pytest.raises(ValueError, match="bad file"):
+        for md, _ in Lookahead(reader):
+            read.append(list(md.index))
+    # Chunks read before the error are all given
+    assert read == [[0, 1], [2, 3]]
+
+
+def test_lookahead_stopped():
+    reader = Reader([chunk(i, 1) for i in range(20)])
+    lookahead = Lookahead(reader, depth=1)
+    for _ in lookahead:
+        break
+    lookahead.thread.join(1)
+    # Curation stopped: the reader thread stops too, without reading the whole file
+    assert not lookahead.thread.is_alive()
+    assert reader.read < 5
+
+
+def test_writer_order():
+    writer = Writer()
+    background = BackgroundWriter(writer, depth=1)
+    for i in range(10):
+        md = chunk(i * 2, 2)
+        background.append(md, md if i % 2 else None)
+    # All written by close, in the order they were given
+    background.close()
+    assert writer.written == [([i * 2, i * 2 + 1], bool(i % 2)) for i in range(10)]
+    assert writer.closed
+
+
+def test_writer_error():
+    writer = Writer(fail_at=1)
+    background = BackgroundWriter(writer)
+    background.append(chunk(0, 2))
+    background.append(chunk(2, 2))
+    # Error raised by a next call in the main thread, following chunks not written
+    with pytest.raises(OSError, match="disk full"):
+        for i in range(2, 10):
+            time.sleep(0.01)
+            background.append(chunk(i * 2, 2))
+    with pytest.raises(OSError, match="disk full"):
+        background.close()
+    assert writer.written == [([0, 1], False)]
+    assert not writer.closed
+
+
+def test_writer_discard():
+    writer = Writer()
+    background = BackgroundWriter(writer)
+    background.append(chunk(0, 2))
+    background.discard()
+    assert not background.thread.is_alive()
+    assert writer.discarded and not writer.closed
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for profiling (--profile): timings and counts of an interactive curation run.
+"""
+
+import os
+import sys
+import json
+import pstats
+import subprocess
+
+from conftest import write_bulk, vname
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_profile(tmp_path):
+    # Same values on all lines, but one host with an accent
+    bulk = write_bulk(tmp_path / "bulk.csv", [{"covv_virus_name": vname(i)} for i in range(6)]
+                      + [{"covv_virus_name": vname(6), "covv_host": "Humàn"}])
+    summary_file = str(tmp_path / "profile.json")
+    stats_file = str(tmp_path / "profile.pstats")
+    # Curator accepts everything (empty answers)
+    run = subprocess.run([sys.executable, os.path.join(ROOT, "bin", "gisaid_curation"),
+                          "-f", bulk, "-d", str(tmp_path / "decisions.sqlite"),
+                          "--profile-json", summary_file, "--profile-stats", stats_file],
+                         input="\n" * 20, capture_output=True, text=True, cwd=tmp_path,
+                         env={**os.environ, "PYTHONPATH": ROOT})
+    assert run.returncode == 0, run.stderr
+    assert "------PROFILE-----" in run.stdout
+    with open(summary_file) as fi:
+        summary = json.load(fi)
+    assert {"read", "curation", "write", "logs"} <= set(summary["phases"])
+    # Questions of a clean line: location, passage, authors, assembly, sequencing technology
+    assert summary["questions"] == 5
+    assert 0 < summary["input_seconds"] <= summary["total_seconds"]
+    checks = summary["checks"]
+    # Each distinct value of a column checked once, whatever the number of lines
+    assert checks["check_location"]["calls"] == 1
+    assert checks["check_mandatory_field"]["calls"] == 7  # labs, addresses, authors...
+    assert checks["check_location"]["input_seconds"] > 0
+    assert summary["transliteration"]["columns"]["covv_host"]["transliterated"] == 1
+    # cProfile stats can be read
+    assert pstats.Stats(stats_file).total_calls > 0
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for the two-phase mode: questions written (-q), answered in the questions file, and
+applied by the next run (-a).
+"""
+
+import csv
+import os
+
+from gisaid_curation.questions import read_answers
+
+from conftest import write_bulk, vname, questions_run
+
+
+def answer_all(path, answers, default="y"):
+    """
+    Fill the 'answer' column of a questions file: answers {column: answer}, default for
+    other columns
+    """
+    with open(path, newline="") as qf:
+        lines = list(csv.DictReader(qf, delimiter="\t"))
+    for line in lines:
+        line["answer"] = answers.get(line["column"], default)
+    with open(path, "w", newline="") as qf:
+        writer = csv.DictWriter(qf, fieldnames=list(lines[0]), delimiter="\t")
+        writer.writeheader()
+        writer.writerows(lines)
+
+
+def test_wrong_date_needs_new_date(tmp_path, decisions, capsys):
+    bulk = write_bulk(tmp_path / "bulk.csv", [
+        {"covv_virus_name": vname(1)},
+        {"covv_virus_name": vname(2), "covv_collection_date": "2020-13-01"}])
+    questions = questions_run(bulk, decisions)
+    # No proposal for an invalid date
+    assert questions.questions[("covv_collection_date", "2020-13-01")]["proposal"] == ""
+
+    # 'y' is refused for the date: it is asked again, and nothing is saved for it
+    answer_all(f"{bulk}.questions.tsv", {})
+    assert read_answers(f"{bulk}.questions.tsv", decisions) == len(questions) - 1
+    assert "Answer ignored" in capsys.readouterr().out
+    assert decisions.get("covv_collection_date", "2020-13-01") is None
+    questions = questions_run(bulk, decisions)
+    assert list(questions.questions) == [("covv_collection_date", "2020-13-01")]
+
+    # New date: nothing left to ask, curated file written
+    answer_all(f"{bulk}.questions.tsv", {"covv_collection_date": "2020-12-01"})
+    assert read_answers(f"{bulk}.questions.tsv", decisions) == 1
+    assert len(questions_run(bulk, decisions)) == 0
+    assert os.path.exists(f"{bulk}.curated.xlsx")
+    with open(f"{bulk}.curated.diff.tsv", newline="") as diff:
+        changes = list(csv.DictReader(diff, delimiter="\t"))
+    assert [(line["column"], line["original"], line["curated"]) for line in changes] == [
+        ("covv_collection_date", "2020-13-01", "2020-12-01")]
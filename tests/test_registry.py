@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for registry: virus names already released, looked for all at once.
+"""
+
+from gisaid_curation.registry import VirusNameRegistry
+
+from conftest import write_bulk, vname, questions_run
+
+
+def test_released(tmp_path):
+    path = str(tmp_path / "registry.sqlite")
+    registry = VirusNameRegistry(path)
+    registry.add([vname(1), vname(2)])
+    registry.close()
+    registry = VirusNameRegistry(path)
+    # Bulk join: names of the bulk found in one request, and kept for next lookups
+    assert registry.released([vname(1), vname(3), vname(1), vname(2)]) == {vname(1), vname(2)}
+    assert registry.known == {vname(1): True, vname(2): True, vname(3): False}
+    assert vname(2) in registry and vname(3) not in registry
+    assert registry.released([]) == set()
+    registry.add([vname(3)])
+    assert vname(3) in registry
+    registry.close()
+
+
+def test_released_name_asked(tmp_path, decisions):
+    """
+    Curation asks a new name for names already released, and adds names of the curated
+    bulk to the registry
+    """
+    registry = VirusNameRegistry(str(tmp_path / "registry.sqlite"))
+    registry.add([vname(1)])
+    bulk = write_bulk(tmp_path / "bulk.csv", [{"covv_virus_name": vname(1)},
+                                              {"covv_virus_name": vname(2)}])
+    questions = questions_run(bulk, decisions, registry=registry)
+    assert ("covv_virus_name", vname(1)) in questions.questions
+    assert ("covv_virus_name", vname(2)) not in questions.questions
+    # Nothing added while questions are left
+    assert vname(2) not in registry
+    decisions.record("covv_virus_name", vname(1), vname(3))
+    for column, value in list(questions.questions):
+        if column != "covv_virus_name":
+            decisions.record(column, value, questions.questions[(column, value)]["proposal"])
+    assert len(questions_run(bulk, decisions, registry=registry)) == 0
+    check = VirusNameRegistry(registry.path)
+    assert check.released([vname(1), vname(2), vname(3)]) == {vname(1), vname(2), vname(3)}
+    check.close()
+    registry.close()
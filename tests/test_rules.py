@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for rules: values of each column fixed as its rule says (unknown, vocabulary,
+accepted values, wrong values), and check functions of data_curation following the rules.
+"""
+
+import logging
+
+import pytest
+
+from gisaid_curation import data_curation
+from gisaid_curation.rules import RULES
+
+
+def fix(column, value):
+    """
+    Fixed value and status, checking fix_all and fix give them
+    """
+    fixed, status = RULES[column].fix_all([value])
+    assert RULES[column].fix(value) == (fixed[0], status[0])
+    return fixed[0], status[0]
+
+
+def answers(monkeypatch, *texts):
+    """
+    Answers typed by the curator, and the questions asked
+    """
+    texts = list(texts)
+    asked = []
+
+    def typed(question):
+        asked.append(question)
+        return texts.pop(0)
+
+    monkeypatch.setattr("builtins.input", typed)
+    return asked
+
+
+@pytest.mark.parametrize("value, status", [
+    ("betacoronavirus", "ok"), ("Betacoronavirus", "ok"), (" betacoronavirus ", "ok"),
+    # Anything else, even empty, is replaced without asking
+    ("alphacoronavirus", "wrong"), ("", "wrong"), (None, "wrong"),
+])
+def test_type(value, status):
+    assert fix("covv_type", value) == ("betacoronavirus", status)
+    assert RULES["covv_type"].final(status)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("original", ("Original", "ok")), ("Original (clinical sample)",
+                                       ("Original (clinical sample)", "ok")),
+    ("VERO", ("Vero", "ok")), ("Vero E6", ("Vero e6", "ok")),
+    # Must start with the word Original or Vero
+    ("Veronica", ("Veronica", "wrong")), ("clinical sample", ("clinical sample", "wrong")),
+    ("", ("unknown", "unknown")),
+])
+def test_passage(value, expected):
+    assert fix("covv_passage", value) == expected
+    # Always checked by the curator, but for unknown passages
+    assert RULES["covv_passage"].final(expected[1]) == (expected[1] == "unknown")
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("human", "Human"), ("HUMAN", "Human"), (" Hümän ", "Human"),
+    ("Homo sapiens", "Homo sapiens"), ("Unknown ", "unknown"), ("", "unknown"),
+])
+def test_host(value, expected):
+    fixed, status = fix("covv_host", value)
+    assert fixed == expected
+    assert RULES["covv_host"].final(status)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("m", ("Male", "ok")), ("F", ("Female", "ok")), ("female", ("Female", "ok")),
+    # Anything with a 'u' is unknown
+    ("u", ("unknown", "unknown")), ("unk", ("unknown", "unknown")),
+    ("Unknown", ("unknown", "unknown")), ("", ("unknown", "unknown")),
+    # Only the vocabulary is accepted
+    ("Féminin", ("Féminin", "wrong")), ("woman", ("woman", "wrong")),
+])
+def test_gender(value, expected):
+    assert fix("covv_gender", value) == expected
+
+
+@pytest.mark.parametrize("value, status", [
+    ("0", "ok"), ("45", "ok"), ("120", "ok"), ("8 months", "ok"), ("8months", "ok"),
+    ("1 year", "ok"), ("2 Weeks", "ok"), ("", "unknown"),
+    ("121", "wrong"), ("045", "wrong"), ("-1", "wrong"), ("45.5", "wrong"), ("abc", "wrong"),
+])
+def test_patient_age(value, status):
+    fixed, fixed_status = fix("covv_patient_age", value)
+    assert fixed_status == status
+    # Wrong ages are kept as they are, and only reported
+    assert fixed == ("unknown" if status == "unknown" else value)
+    assert RULES["covv_patient_age"].final(status)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", ("unknown", "unknown")), ("  ", ("unknown", "unknown")),
+    ("UNKNOWN ", ("unknown", "unknown")),
+    # Only empty or 'unknown' is unknown in mandatory columns
+    ("unk", ("unk", "ok")), (" Hôpital Necker ", ("Hopital Necker", "ok")),
+])
+def test_mandatory(value, expected):
+    assert fix("covv_orig_lab", value) == expected
+
+
+def test_final():
+    # Accepted values are confirmed by the curator for authors, not for labs
+    assert RULES["covv_orig_lab"].final("ok")
+    assert not RULES["covv_authors"].final("ok")
+    # Unknown mandatory values are reported
+    assert not RULES["covv_orig_lab"].final("unknown")
+    assert RULES["covv_host"].final("unknown")
+    # Wrong genders are asked
+    assert not RULES["covv_gender"].final("wrong")
+
+
+def test_problems():
+    assert RULES["covv_orig_lab"].problems("") == [
+        ("ERROR", "not given: ask submitter (NO release)")]
+    assert RULES["covv_seq_technology"].problems("unknown") == [
+        ("WARNING", "not given: inform submitter (can be released)")]
+    assert RULES["covv_type"].problems("Betacoronavirus") == [
+        ("WARNING", "will be changed to 'betacoronavirus'")]
+    assert RULES["covv_gender"].problems("woman") == [
+        ("ERROR", "gender must be Male, Female or unknown")]
+    assert RULES["covv_gender"].problems("Male") == []
+
+
+def test_many_values():
+    fixed, status = RULES["covv_gender"].fix_all(["m", "", "woman", "m", None])
+    # One result per value, in the same order, duplicates included
+    assert list(fixed) == ["Male", "unknown", "woman", "Male", "unknown"]
+    assert list(status) == ["ok", "unknown", "wrong", "ok", "unknown"]
+    fixed, status = RULES["covv_gender"].fix_all([])
+    assert len(fixed) == len(status) == 0
+
+
+def test_check_column(monkeypatch):
+    asked = answers(monkeypatch, "n", "original (clinical sample)")
+    seen = {}
+    # Accepted host fixed without asking
+    assert data_curation.check_column("hümän", "v1", "covv_host", {}) == "Human"
+    # Wrong passage: refused, then replaced by a value written as the rule says
+    assert data_curation.check_column("clinical sample", "v1", "covv_passage",
+                                      seen) == "Original (clinical sample)"
+    assert len(asked) == 2
+    assert "passage should start with Original or Vero" in asked[0]
+    # Asked once for each value
+    assert data_curation.check_column("Clinical sample", "v2", "covv_passage",
+                                      seen) == "Original (clinical sample)"
+    assert len(asked) == 2
+
+
+def test_check_gender(monkeypatch):
+    asked = answers(monkeypatch, "woman", "f")
+    assert data_curation.check_gender("u", "v1", {}) == "unknown"
+    assert data_curation.check_gender("Féminin", "v1", {}) == "Female"
+    # Asked again while the answer is not accepted by the rule
+    assert len(asked) == 2
+
+
+@pytest.mark.parametrize("column, answer, expected", [
+    # Not confirmed: accepted without asking
+    ("covv_orig_lab", None, "Institut Pasteur"),
+    ("covv_authors", "", "Jane Doe"),
+    ("covv_authors", "Jane Doé", "Jane Doe"),
+    ("covv_authors", "s", None),
+])
+def test_check_mandatory_field(monkeypatch, column, answer, expected):
+    asked = answers(monkeypatch, *([] if answer is None else [answer]))
+    value = "Jane Doe" if column == "covv_authors" else "Institut Pasteur"
+    assert data_curation.check_mandatory_field(value, "v1", column, {}) == expected
+    assert len(asked) == RULES[column].confirm
+
+
+@pytest.mark.parametrize("column, level", [("covv_orig_lab", "ERROR"),
+                                           ("covv_seq_technology", "WARNING")])
+def test_check_mandatory_unknown(monkeypatch, column, level):
+    asked = answers(monkeypatch)
+    levels = []
+    handler = logging.Handler(logging.WARNING)
+    handler.emit = lambda record: levels.append(record.levelname)
+    data_curation.logger.addHandler(handler)
+    try:
+        assert data_curation.check_mandatory_field(" ", "v1", column, {}) == "unknown"
+    finally:
+        data_curation.logger.removeHandler(handler)
+    # Reported with the severity of the rule, without asking
+    assert asked == []
+    assert levels == [level]
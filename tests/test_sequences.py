@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for sequences: FASTA records read, matched to curated virus names and counted.
+"""
+
+import os
+import csv
+import sys
+import subprocess
+
+import pytest
+
+from gisaid_curation import sequences
+from gisaid_curation.sequences import count_bases, iter_fasta, NameIndex, cure_fasta
+
+from conftest import write_bulk, vname
+from test_questions import answer_all
+
+
+FASTA = (">hCoV-19/France/A-1/2020\nACGTN\nnnRY-\n"
+         ">hCoV-19/Frnce/B-2/2020\r\nACGT\r\n"
+         ">extra/seq\nAC\n"
+         ">hCoV-19/France/A-1/2020\nAC\n"
+         ">hCoV-19/France/A-1/2020\nACGT*X")
+VNAMES = ["hCoV-19/France/A-1/2020", "hCoV-19/France/B-2/2020", "hCoV-19/France/A-2/2020",
+          "hCoV-19/France/C-3/2020"]
+RENAMES = [("hCoV-19/Frnce/B-2/2020", "hCoV-19/France/B-2/2020"),
+           ("hCoV-19/France/A-1/2020", "hCoV-19/France/A-2/2020")]
+
+
+def test_count_bases():
+    assert count_bases(b"") == (0, 0, 0, 0)
+    assert count_bases(b"ACGTN\nnnRY-\n") == (10, 3, 2, 0)
+    assert count_bases(b"acgt \r\nux*\n") == (7, 0, 0, 2)
+
+
+def test_iter_fasta(tmp_path):
+    path = tmp_path / "seqs.fasta"
+    path.write_bytes(("ignored\n" + FASTA).encode())
+    records = list(iter_fasta(path))
+    assert [header for header, _ in records] == [
+        "hCoV-19/France/A-1/2020", "hCoV-19/Frnce/B-2/2020", "extra/seq",
+        "hCoV-19/France/A-1/2020", "hCoV-19/France/A-1/2020"]
+    assert records[0][1] == b"ACGTN\nnnRY-\n"
+    assert records[-1][1] == b"ACGT*X"
+
+
+def test_name_index():
+    index = NameIndex(VNAMES, RENAMES)
+    # Several lines with the same original name: in the order of lines
+    assert index.match("hCoV-19/France/A-1/2020") == ("hCoV-19/France/A-1/2020", True)
+    assert index.match("hCoV-19/France/A-1/2020") == ("hCoV-19/France/A-2/2020", True)
+    assert index.match("hCoV-19/France/A-1/2020") == (None, True)
+    # Original, or already curated, name
+    assert index.match("hCoV-19/France/B-2/2020") == ("hCoV-19/France/B-2/2020", True)
+    assert index.match("extra/seq") == (None, False)
+    assert index.missing() == ["hCoV-19/France/C-3/2020"]
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_cure_fasta(tmp_path, monkeypatch, parallel):
+    if parallel:
+        monkeypatch.setattr(sequences, "PARALLEL_SIZE", 0)
+        monkeypatch.setattr(sequences, "BATCH_SIZE", 2)
+    path = tmp_path / "seqs.fasta"
+    path.write_bytes(FASTA.encode())
+    summary = cure_fasta(str(path), VNAMES, RENAMES, jobs=2)
+    assert summary == {"sequences": 5, "renamed": 2, "extra": 1, "duplicated": 1,
+                       "missing": 1}
+    # Sequence lines are kept as they are
+    assert (tmp_path / "seqs.fasta.curated.fasta").read_bytes() == (
+        b">hCoV-19/France/A-1/2020\nACGTN\nnnRY-\n"
+        b">hCoV-19/France/B-2/2020\nACGT\r\n"
+        b">extra/seq\nAC\n"
+        b">hCoV-19/France/A-2/2020\nAC\n"
+        b">hCoV-19/France/A-1/2020\nACGT*X\n")
+    with open(tmp_path / "seqs.fasta.sequences.tsv", newline="") as stats:
+        lines = list(csv.reader(stats, delimiter="\t"))
+    assert lines[0] == sequences.HEADER
+    assert lines[1] == ["hCoV-19/France/A-1/2020", "hCoV-19/France/A-1/2020", "10", "3", "0.3",
+                        "2", "0"]
+    assert [line[0] for line in lines[1:]] == [
+        "hCoV-19/France/A-1/2020", "hCoV-19/France/B-2/2020", "extra/seq",
+        "hCoV-19/France/A-2/2020", "hCoV-19/France/A-1/2020"]
+    assert lines[-1][2:] == ["6", "0", "0.0", "0", "2"]
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.mark.parametrize("command", [[os.path.join(ROOT, "bin", "gisaid_curation")],
+                                     ["-m", "gisaid_curation.data_curation"]])
+def test_fasta_option(tmp_path, command):
+    bulk = write_bulk(tmp_path / "bulk.csv", [{"covv_virus_name": vname(1)},
+                                              {"covv_virus_name": vname(2)}])
+    fasta = tmp_path / "bulk.fasta"
+    fasta.write_bytes(f">{vname(1)}\nACGT\n>{vname(2)}\nACGN\n".encode())
+    questions = str(tmp_path / "questions.tsv")
+
+    def run(*args):
+        return subprocess.run([sys.executable, *command, "-f", bulk, "-q", questions,
+                               "--fasta", str(fasta), *args],
+                              capture_output=True, text=True, cwd=tmp_path,
+                              env={**os.environ, "PYTHONPATH": ROOT})
+
+    # Questions left: metadata are not curated, nor sequences
+    assert run().returncode == 0
+    assert not os.path.exists(f"{fasta}.curated.fasta")
+    answer_all(questions, {})
+    answers = str(tmp_path / "answers.tsv")
+    os.rename(questions, answers)
+    result = run("-a", answers)
+    assert "2 sequences in" in result.stdout
+    assert (tmp_path / "bulk.fasta.curated.fasta").read_bytes() == fasta.read_bytes()
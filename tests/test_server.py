@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for server: requests sent to a curation server started on a Unix socket.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+
+import pytest
+
+from conftest import write_bulk, vname
+
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def request(socket_path, method, target, body=b""):
+    """
+    Send an HTTP request to the server: HTTP status, and json answer (or bytes)
+    """
+    if isinstance(body, dict):
+        body = json.dumps(body).encode()
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(socket_path)
+        client.sendall(f"{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n"
+                       .encode() + body)
+        response = b""
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            response += data
+    head, _, content = response.partition(b"\r\n\r\n")
+    if b"application/json" in head:
+        content = json.loads(content)
+    return int(head.split()[1]), content
+
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    Server curating files of tmp_path/data: its socket
+    """
+    os.makedirs(tmp_path / "data")
+    socket_path = str(tmp_path / "server.sock")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "bin", "gisaid_curation"),
+                                "--serve", "--socket", socket_path,
+                                "-d", str(tmp_path / "decisions.sqlite"),
+                                "--upload-dir", str(tmp_path / "uploads"),
+                                "--data-root", str(tmp_path / "data")],
+                               cwd=tmp_path, stdout=subprocess.DEVNULL,
+                               env={**os.environ, "PYTHONPATH": ROOT})
+    try:
+        for _ in range(300):
+            if os.path.exists(socket_path) or process.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert os.path.exists(socket_path), "server not started"
+        yield socket_path
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_curate_answer_upload(tmp_path, server):
+    bulk = write_bulk(tmp_path / "data" / "bulk.csv", [{"covv_virus_name": vname(1)},
+                                                        {"covv_virus_name": vname(2)}])
+    status, result = request(server, "POST", "/curate", {"path": bulk})
+    assert status == 200 and result["curated"] is None
+    questions = result["questions"]
+    assert {question["column"] for question in questions} >= {"covv_location", "covv_passage"}
+    # Only questions sent back can be answered
+    status, error = request(server, "POST", "/answers", {"answers": [
+        {"column": "covv_host", "value": "Human", "answer": "y"}]})
+    assert status == 400 and "curate the file first" in error["error"]
+    status, result = request(server, "POST", "/answers", {"answers": [
+        {"column": question["column"], "value": question["value"], "answer": "y"}
+        for question in questions]})
+    assert status == 200 and result == {"recorded": len(questions)}
+    status, result = request(server, "POST", "/curate", {"path": bulk})
+    assert status == 200 and result["questions"] == []
+    assert result["curated"] == f"{os.path.realpath(bulk)}.curated.xlsx"
+    assert os.path.isfile(result["curated"])
+    # Same values in an uploaded file: answers already given by curators are used
+    with open(bulk, "rb") as fi:
+        status, result = request(server, "POST", "/curate?filename=other.csv", fi.read())
+    assert status == 200 and result["questions"] == []
+    status, content = request(server, "GET", result["curated_download"])
+    assert status == 200 and content.startswith(b"PK")
+    status, result = request(server, "GET", "/status")
+    assert status == 200 and result["curated"] == 2 and result["decisions"] == len(questions)
+
+
+@pytest.mark.parametrize("path", ["outside.csv", "data/../outside.csv", "data/link.csv"])
+def test_path_outside_data_root(tmp_path, server, path):
+    outside = write_bulk(tmp_path / "outside.csv", [{"covv_virus_name": vname(1)}])
+    os.symlink(outside, tmp_path / "data" / "link.csv")
+    status, error = request(server, "POST", "/curate", {"path": str(tmp_path / path)})
+    assert status == 403 and "can be curated" in error["error"]
+    assert not os.path.exists(f"{outside}.questions.tsv")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for transliteration: accents and non-ASCII characters replaced, ASCII values kept
+as they are without calling unidecode, and each distinct value transliterated once.
+"""
+
+import pandas as pd
+import pytest
+
+from gisaid_curation import transliteration
+from gisaid_curation.transliteration import to_ascii, to_ascii_all, is_ascii
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """
+    Texts given to unidecode
+    """
+    transliteration.transliterate.cache_clear()
+    called = []
+    unidecode = transliteration.unidecode.unidecode
+
+    def counted(text):
+        called.append(text)
+        return unidecode(text)
+
+    monkeypatch.setattr(transliteration.unidecode, "unidecode", counted)
+    yield called
+    transliteration.transliterate.cache_clear()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Île-de-France", "Ile-de-France"), ("São Paulo", "Sao Paulo"), ("Kraków", "Krakow"),
+    # Letters without accents, but not ASCII
+    ("Straße", "Strasse"), ("Æsir", "AEsir"), ("Ø", "O"), ("ﬁ", "fi"),
+    # Typographic punctuation
+    ("Côte d’Ivoire", "Cote d'Ivoire"), ("−5", "-5"),
+    # Other scripts
+    ("Ελλάδα", "Ellada"), ("北京", "Bei Jing "),
+    # Spaces kept: values are stripped by the checks, not here
+    ("  Hôpital ", "  Hopital "),
+])
+def test_to_ascii(text, expected):
+    assert to_ascii(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "Paris", "a\tb", "unknown", "  Institut Pasteur "])
+def test_ascii_kept(calls, text):
+    assert to_ascii(text) is text
+    assert calls == []
+
+
+def test_transliterated_once(calls):
+    assert [to_ascii("Zürich") for _ in range(3)] == ["Zurich"] * 3
+    assert calls == ["Zürich"]
+    assert transliteration.summary()["cache"]["hits"] == 2
+
+
+def test_is_ascii():
+    assert list(is_ascii(pd.Series(["Paris", "Zürich", ""]))) == [True, False, True]
+    # Missing values and values which are not text: nothing to transliterate
+    assert list(is_ascii(pd.Series(["Zürich", None, float("nan"), 3],
+                                   dtype=object))) == [False, True, True, True]
+    assert list(is_ascii(pd.Series([1, 2.5], dtype=object))) == [True, True]
+    assert len(is_ascii(pd.Series([], dtype=object))) == 0
+
+
+def test_to_ascii_all(calls):
+    values = pd.Series(["Zürich", None, "Paris", "Zürich", 3, "Kraków"],
+                       index=[5, 7, 9, 11, 13, 15], name="covv_location", dtype=object)
+    converted = to_ascii_all(values)
+    assert converted.tolist() == ["Zurich", None, "Paris", "Zurich", 3, "Krakow"]
+    # Same lines, even if not numbered from 0
+    assert converted.index.equals(values.index)
+    assert converted.name == "covv_location"
+    # Only distinct non-ASCII values transliterated
+    assert sorted(calls) == ["Kraków", "Zürich"]
+    assert to_ascii_all(pd.Series([], dtype=object)).empty
+
+
+def test_to_ascii_all_categorical():
+    values = pd.Series(["Zürich", "Paris", "Zürich"], dtype="category")
+    converted = to_ascii_all(values)
+    # Categories are not kept: transliterated values can be the same as other values
+    assert converted.dtype == object
+    assert converted.tolist() == ["Zurich", "Paris", "Zurich"]
+
+
+def test_count():
+    transliteration.reset()
+    transliteration.count("covv_location", pd.Series(["Paris", "Zürich", "Kraków", ""],
+                                                     dtype=object))
+    transliteration.count("covv_location", pd.Series(["Zürich"], dtype=object))
+    transliteration.count("covv_host", pd.Series(["Human"], dtype=object))
+    assert transliteration.summary()["columns"] == {
+        "covv_location": {"values": 5, "transliterated": 3},
+        "covv_host": {"values": 1, "transliterated": 0}}
+    transliteration.reset()
+    assert transliteration.summary()["columns"] == {}
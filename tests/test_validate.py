@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for validate: problems of a bulk reported before curation, as curation would see them.
+"""
+
+import pytest
+
+from gisaid_curation.gazetteer import GAZETTEER
+from gisaid_curation.validate import validate
+
+from conftest import write_bulk, vname
+
+
+def problems(report):
+    """
+    {(column, value): [severities]} of a report
+    """
+    found = {}
+    for severity, column, value, _ in report.problems:
+        found.setdefault((column, value), []).append(severity)
+    return found
+
+
+def test_clean_bulk(tmp_path):
+    bulk = write_bulk(tmp_path / "bulk.csv", [
+        {"covv_virus_name": vname(i), "covv_location": "Europe / France"} for i in [1, 2]])
+    assert validate(bulk, GAZETTEER).problems == {}
+
+
+@pytest.mark.parametrize("location, severity", [
+    # Fixed by curation with the gazetteer, without asking anything
+    ("France", "WARNING"),
+    ("Europe / Frnace", "WARNING"),
+    # Nothing known: the curator must give the location
+    ("Atlantis", "ERROR"),
+])
+def test_location_as_curated(tmp_path, location, severity):
+    bulk = write_bulk(tmp_path / "bulk.csv", [
+        {"covv_virus_name": vname(1), "covv_location": location},
+        {"covv_virus_name": vname(2), "covv_location": location}])
+    report = validate(bulk, GAZETTEER)
+    assert problems(report)[("covv_location", location)] == [severity]
+    # Reported once, with the number of lines and the first one
+    assert [count_line for (_, column, _, _), count_line in report.problems.items()
+            if column == "covv_location"] == [[2, 3]]
+
+
+def test_location_without_gazetteer(tmp_path):
+    bulk = write_bulk(tmp_path / "bulk.csv", [{"covv_virus_name": vname(1),
+                                               "covv_location": "France"}])
+    assert problems(validate(bulk)) == {("covv_location", "France"): ["ERROR"]}
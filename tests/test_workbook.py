@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+Tests for workbook: xlsx bulks read (and cached) and curated workbooks written
+(instructions sheet, lines numbered as in the original sheet).
+"""
+
+import os
+import csv
+import time
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, PatternFill
+
+from gisaid_curation import workbook
+from gisaid_curation.workbook import (StreamingWriter, evict_cache, file_key, iter_workbook,
+                                      read_workbook)
+
+
+def write_xlsx(path, lines):
+    """
+    Write a xlsx bulk with a formatted instructions sheet. 'lines': (virus name, host) of
+    each line of Submissions sheet, None for an empty line
+    """
+    wb = Workbook()
+    instructions = wb.active
+    instructions.title = "Instructions"
+    instructions["A1"] = "GISAID bulk upload"
+    instructions["A1"].font = Font(bold=True, size=14)
+    instructions["A1"].fill = PatternFill("solid", fgColor="FFFF00")
+    instructions.merge_cells("A1:C1")
+    instructions.column_dimensions["A"].width = 40
+    instructions.row_dimensions[1].height = 30
+    instructions["A3"] = 12.5
+    instructions["A3"].number_format = "0.00"
+    submissions = wb.create_sheet("Submissions")
+    submissions.append(["covv_virus_name", "covv_host"])
+    submissions.append(["Virus name", "Host"])
+    for line in lines:
+        submissions.append(line or [None, None])
+    wb.save(path)
+    return str(path)
+
+
+def test_instructions_layout(tmp_path):
+    file_in = write_xlsx(tmp_path / "bulk.xlsx", [("v1", "Human")])
+    _, md = read_workbook(file_in)
+    writer = StreamingWriter(str(tmp_path / "out.xlsx"), file_in)
+    writer.append(md)
+    writer.close()
+    sheet = load_workbook(tmp_path / "out.xlsx")["instructions"]
+    assert sheet["A1"].value == "GISAID bulk upload"
+    assert sheet["A1"].font.b and sheet["A1"].font.sz == 14
+    assert sheet["A1"].fill.fgColor.rgb.endswith("FFFF00")
+    assert [str(cells) for cells in sheet.merged_cells.ranges] == ["A1:C1"]
+    assert sheet.column_dimensions["A"].width == 40
+    assert sheet.row_dimensions[1].height == 30
+    assert sheet["A3"].value == 12.5 and sheet["A3"].number_format == "0.00"
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1, 2])
+def test_empty_lines_numbered(tmp_path, chunk_size):
+    lines = [("v1", "human"), None, None, ("v2", "Cat"), None, ("v3", "dog")]
+    file_in = write_xlsx(tmp_path / "bulk.xlsx", lines)
+    if chunk_size:
+        chunks = list(iter_workbook(file_in, chunk_size)[1])
+    else:
+        chunks = [read_workbook(file_in)[1]]
+    # Index: position in the sheet (0 for the 2nd header line)
+    assert [line for chunk in chunks for line in chunk.index] == [0, 1, 4, 6]
+    writer = StreamingWriter(str(tmp_path / "out.xlsx"), file_in, str(tmp_path / "diff.tsv"))
+    for chunk in chunks:
+        curated = chunk.copy()
+        curated["covv_host"] = curated["covv_host"].str.capitalize()
+        writer.append(curated, chunk)
+    writer.close()
+    with open(tmp_path / "diff.tsv", newline="") as diff:
+        changes = [(int(line["line"]), line["sequence"], line["curated"])
+                   for line in csv.DictReader(diff, delimiter="\t")]
+    # Lines as numbered in Excel, in both workbooks
+    assert changes == [(3, "v1", "Human"), (8, "v3", "Dog")]
+    sheet = load_workbook(tmp_path / "out.xlsx")["Submissions"]
+    assert [sheet.cell(line, 2).value for line, _, _ in changes] == ["Human", "Dog"]
+    assert sheet.cell(6, 1).value == "v2"
+
+
+def test_cache_key(tmp_path):
+    file_in = write_xlsx(tmp_path / "bulk.xlsx", [("v1", "human")])
+    key = file_key(file_in)
+    assert file_key(file_in) == key
+    # Same content, another modification time
+    stat = os.stat(file_in)
+    os.utime(file_in, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert file_key(file_in) != key
+    write_xlsx(file_in, [("v1", "cat")])
+    os.utime(file_in, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert file_key(file_in) != key
+
+
+def test_cache_read(tmp_path, monkeypatch):
+    file_in = write_xlsx(tmp_path / "bulk.xlsx", [("v1", "human"), None, ("v2", "cat")])
+    cache_dir = str(tmp_path / "cache")
+    instructions, md = read_workbook(file_in, cache_dir)
+    assert sorted(os.listdir(cache_dir)) == [f"{file_key(file_in)}.instructions.feather",
+                                             f"{file_key(file_in)}.md.feather"]
+
+    # 2nd read: the file is not parsed again
+    def parse(file_in):
+        raise AssertionError("file parsed again")
+
+    monkeypatch.setattr(workbook, "read_xlsx", parse)
+    cached_instructions, cached_md = read_workbook(file_in, cache_dir)
+    # Same cells (feather gives pandas string columns)
+    pd.testing.assert_frame_equal(cached_md, md, check_dtype=False)
+    pd.testing.assert_frame_equal(cached_instructions, instructions, check_dtype=False)
+    assert list(cached_md.index) == [0, 1, 3]
+
+
+def test_cache_eviction(tmp_path):
+    cache_dir = tmp_path / "cache"
+    os.makedirs(cache_dir)
+    # 3 files of 1 MB, used 1, 3, then 2 days ago
+    for key, age in [("a", 1), ("b", 3), ("c", 2)]:
+        for kind in ["md", "instructions"]:
+            path = cache_dir / f"{key}.{kind}.feather"
+            path.write_bytes(b"0" * (1 << 19))
+            os.utime(path, (time.time() - age * 86400,) * 2)
+    evict_cache(str(cache_dir), cache_size=2.5)
+    # Least recently used one removed, with all its sheets
+    assert sorted(os.listdir(cache_dir)) == ["a.instructions.feather", "a.md.feather",
+                                             "c.instructions.feather", "c.md.feather"]
+    evict_cache(str(cache_dir), cache_size=1)
+    assert sorted(os.listdir(cache_dir)) == ["a.instructions.feather", "a.md.feather"]